@@ -0,0 +1,138 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+import tracing
+
+_REPLAY_PATTERN = re.compile(r"\S+\s*|\s+")
+
+
+class SemanticAnswerCache:
+    """
+    대화 파일별로 질문 임베딩과 답변을 저장하는 의미 기반 답변 캐시입니다.
+
+    같은 대화 파일에 대해 코사인 유사도가 threshold 이상인 질문이 다시 들어오면 저장된 답변을 반환합니다.
+    항목은 ttl 초가 지나면 만료되며, 전체 항목 수가 max_entries 를 넘으면 가장 오래 사용하지 않은
+    항목부터 삭제합니다.
+    """
+
+    def __init__(self, threshold: float = 0.95, ttl: float = 24 * 3600, max_entries: int = 1000):
+        """
+        :param threshold: 같은 질문으로 볼 코사인 유사도의 최솟값
+        :param ttl: 답변을 재사용할 최대 시간(초)
+        :param max_entries: 모든 대화 파일을 합친 최대 항목 수
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # (chat_key, 항목 번호) -> (정규화된 질문 벡터, 답변, 저장 시각), 오래 사용하지 않은 순서
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[np.ndarray, str, float]]" = OrderedDict()
+        # chat_key -> 해당 대화 파일의 항목 번호 목록
+        self._chats: Dict[str, Dict[int, None]] = {}
+        self._next_id = 0
+        # 캐시 적중/미적중 횟수
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, chat_key: str, vector: Sequence[float]) -> Optional[str]:
+        """
+        비슷한 질문의 답변을 찾습니다.
+
+        :param chat_key: 대화 파일의 해시
+        :param vector: 질문 임베딩
+        :return: 저장된 답변 (없으면 None)
+        """
+        query = _normalize(vector)
+        now = time.time()
+        with self._lock:
+            self._expire(chat_key, now)
+            ids = list(self._chats.get(chat_key, ()))
+            if ids:
+                matrix = np.stack([self._entries[(chat_key, i)][0] for i in ids])
+                similarities = matrix @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    key = (chat_key, ids[best])
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    tracing.count("answer_cache_hits")
+                    return self._entries[key][1]
+            self.misses += 1
+            tracing.count("answer_cache_misses")
+            return None
+
+    def store(self, chat_key: str, vector: Sequence[float], answer: str) -> None:
+        """
+        질문과 답변을 저장합니다.
+
+        :param chat_key: 대화 파일의 해시
+        :param vector: 질문 임베딩
+        :param answer: 답변
+        """
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[(chat_key, entry_id)] = (_normalize(vector), answer, time.time())
+            self._chats.setdefault(chat_key, {})[entry_id] = None
+            while len(self._entries) > self.max_entries:
+                (evicted_chat, evicted_id), _ = self._entries.popitem(last=False)
+                self._remove_id(evicted_chat, evicted_id)
+
+    def _expire(self, chat_key: str, now: float) -> None:
+        for entry_id in list(self._chats.get(chat_key, ())):
+            if now - self._entries[(chat_key, entry_id)][2] > self.ttl:
+                del self._entries[(chat_key, entry_id)]
+                self._remove_id(chat_key, entry_id)
+
+    def _remove_id(self, chat_key: str, entry_id: int) -> None:
+        ids = self._chats[chat_key]
+        del ids[entry_id]
+        if not ids:
+            del self._chats[chat_key]
+
+
+def _normalize(vector: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def replay_answer(answer: str, handler) -> None:
+    """
+    캐시된 답변을 LLM 스트리밍과 같은 방식으로 콜백 핸들러에 전달하여 화면에 출력합니다.
+
+    :param answer: 출력할 답변
+    :param handler: on_llm_new_token 을 구현한 콜백 핸들러 (예: utils.StreamHandler)
+    """
+    for token in _REPLAY_PATTERN.findall(answer):
+        handler.on_llm_new_token(token)
+    # 토큰을 모아서 출력하는 핸들러는 마지막에 남은 토큰을 출력합니다.
+    if hasattr(handler, "flush"):
+        handler.flush()
+
+
+# 프로세스 전체에서 공유하는 답변 캐시
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache(**kwargs) -> SemanticAnswerCache:
+    """
+    프로세스 전체에서 공유하는 SemanticAnswerCache 를 반환합니다. 처음 호출할 때만 kwargs 를 사용합니다.
+
+    :param kwargs: SemanticAnswerCache 생성 시 전달할 매개변수
+    :return: 공유 답변 캐시
+    """
+    global _answer_cache
+    with _answer_cache_lock:
+        if _answer_cache is None:
+            _answer_cache = SemanticAnswerCache(**kwargs)
+        return _answer_cache
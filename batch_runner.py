@@ -0,0 +1,139 @@
+"""
+대화 파일 하나에 대해 JSONL 질문 목록을 Streamlit 없이 일괄 실행합니다.
+
+    python batch_runner.py chat.txt questions.jsonl -o answers.jsonl --concurrency 4
+
+질문 파일의 각 줄은 {"id": ..., "question": ...} 형태이며, question 대신 body/title 필드도 사용할 수 있습니다.
+결과 파일의 각 줄에는 답변, context 에 사용된 원본 행 범위, 단계별 소요 시간(초)이 기록됩니다.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+import tracing
+from pipeline import ChatPipeline
+
+# 질문으로 사용할 필드 (앞에 있는 필드를 우선 사용)
+QUESTION_FIELDS = ("question", "body", "title")
+ID_FIELDS = ("id", "request_id")
+
+
+def read_questions(path: str) -> List[dict]:
+    """
+    JSONL 질문 파일을 읽습니다.
+
+    :param path: 질문 파일 경로
+    :return: {"id", "question"} 목록 (id 가 없으면 줄 번호)
+    """
+    questions = []
+    with open(path, encoding="utf8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            question = next((record[field] for field in QUESTION_FIELDS if record.get(field)), None)
+            if question is None:
+                raise ValueError(f"{path}:{line_number} 에 질문 필드({', '.join(QUESTION_FIELDS)})가 없습니다.")
+            question_id = next((record[field] for field in ID_FIELDS if field in record), line_number)
+            questions.append({"id": question_id, "question": question})
+    return questions
+
+
+def run_batch(
+    chat_pipeline: ChatPipeline, questions: Iterable[dict], concurrency: int = 4
+) -> Iterator[dict]:
+    """
+    질문들을 동시에 실행하고 결과를 질문 순서대로 반환합니다. 실패한 질문은 error 필드에 오류를 기록합니다.
+
+    :param chat_pipeline: 질문에 답변할 파이프라인
+    :param questions: {"id", "question"} 목록
+    :param concurrency: 동시에 실행할 질문 수
+    :return: {"id", "question", "answer", "rows", "timings", "error"} 의 iterator
+    """
+
+    def ask(item: dict) -> dict:
+        result = {"id": item["id"], "question": item["question"]}
+        try:
+            result.update(chat_pipeline.ask(item["question"]), error=None)
+        except Exception as e:
+            result.update(answer=None, rows=[], timings={}, error=f"{type(e).__name__}: {e}")
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch") as executor:
+        yield from executor.map(ask, questions)
+
+
+def summarize(results: List[dict], elapsed: float) -> dict:
+    """
+    일괄 실행 결과의 처리량과 단계별 소요 시간 백분위수를 계산합니다.
+
+    :param results: run_batch 결과 목록
+    :param elapsed: 전체 실행 시간(초)
+    :return: 요약 통계
+    """
+    succeeded = [result for result in results if result["error"] is None]
+    summary = {
+        "questions": len(results),
+        "errors": len(results) - len(succeeded),
+        "elapsed": elapsed,
+        "questions_per_second": len(results) / elapsed if elapsed else None,
+    }
+    for stage in ("retrieve", "pack", "generate", "total"):
+        values = [result["timings"][stage] for result in succeeded]
+        if values:
+            summary[stage] = {
+                "p50": float(np.percentile(values, 50)),
+                "p95": float(np.percentile(values, 95)),
+            }
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="카톡GPT 질문 일괄 실행기")
+    parser.add_argument("chat_file", help="카카오톡 TXT/CSV 파일")
+    parser.add_argument("questions", help="질문 JSONL 파일")
+    parser.add_argument("-o", "--output", default="-", help="결과 JSONL 파일 (기본값은 표준 출력)")
+    parser.add_argument("--concurrency", type=int, default=4, help="동시에 실행할 질문 수")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="OpenAI API 키")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"), help="OpenAI 호환 서버 주소")
+    parser.add_argument("--index-root", default="./index/", help="인덱스 저장 경로")
+    parser.add_argument("--metrics", default=None, help="단계별 측정값을 저장할 Prometheus 텍스트 파일")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("--api-key 또는 OPENAI_API_KEY 환경변수가 필요합니다.")
+
+    questions = read_questions(args.questions)
+    start = time.perf_counter()
+    chat_pipeline = ChatPipeline.from_file(
+        args.chat_file, api_key=args.api_key, base_url=args.base_url, index_root=args.index_root
+    )
+    print(f"pipeline ready in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+
+    start = time.perf_counter()
+    results = []
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf8")
+    try:
+        for result in run_batch(chat_pipeline, questions, args.concurrency):
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            results.append(result)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(json.dumps(summarize(results, time.perf_counter() - start), ensure_ascii=False), file=sys.stderr)
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf8") as f:
+            f.write(tracing.tracer.prometheus_text())
+    return 1 if any(result["error"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
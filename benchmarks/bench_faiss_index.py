@@ -0,0 +1,151 @@
+"""
+FAISS 인덱스 종류별 recall@k(flat 인덱스 대비), 벡터당 메모리, 생성 시간, 검색 지연 시간을 측정합니다.
+
+    python -m benchmarks.bench_faiss_index --vectors 100000 --dim 1536
+    python -m benchmarks.bench_faiss_index --types ivf_sq_fp16 --nprobe 4 8 16 32
+
+임베딩은 실제 문장 임베딩처럼 주제별로 모여 있도록 가우시안 혼합 분포에서 생성합니다.
+결과는 benchmarks/results/<커밋>-faiss_index.json 에 저장됩니다.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from benchmarks.run_benchmarks import RESULTS_DIR, git_commit, percentiles
+from faiss_index import INDEX_TYPES, build_index, bytes_per_vector, describe_index, set_search_params
+
+
+def clustered_vectors(
+    num_vectors: int, dim: int, num_clusters: int = 200, intrinsic_dim: int = 32, seed: int = 0
+) -> np.ndarray:
+    """
+    주제(클러스터) 중심 주변에 모인 정규화된 벡터를 생성합니다. 실제 문장 임베딩처럼 클러스터 안의 변화는
+    intrinsic_dim 차원의 부분 공간에 놓이도록 만듭니다 (모든 방향의 잡음만 있으면 이웃 순서가 무의미해집니다).
+    중심과 부분 공간은 seed 와 관계없이 같으므로, 같은 분포에서 문서와 질의를 따로 생성할 수 있습니다.
+
+    :param num_vectors: 벡터 수
+    :param dim: 차원
+    :param num_clusters: 클러스터 수
+    :param intrinsic_dim: 클러스터 안의 변화가 놓이는 부분 공간의 차원
+    :param seed: 난수 시드
+    :return: (num_vectors, dim) float32 배열
+    """
+    space = np.random.default_rng(12345)
+    centers = space.standard_normal((num_clusters, dim), dtype=np.float32)
+    projection = space.standard_normal((intrinsic_dim, dim), dtype=np.float32)
+
+    rng = np.random.default_rng(seed)
+    vectors = centers[rng.integers(num_clusters, size=num_vectors)]
+    vectors += 0.5 * rng.standard_normal((num_vectors, intrinsic_dim), dtype=np.float32) @ projection
+    vectors += 0.05 * rng.standard_normal((num_vectors, dim), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall_at_k(found: np.ndarray, expected: np.ndarray) -> float:
+    """
+    정답(flat 인덱스) 상위 k 개 중 찾은 비율의 평균입니다.
+    """
+    k = expected.shape[1]
+    return float(np.mean([len(set(f) & set(e)) / k for f, e in zip(found.tolist(), expected.tolist())]))
+
+
+def bench_index(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    expected: np.ndarray,
+    index_type: str,
+    k: int,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    index: Optional[faiss.Index] = None,
+) -> Tuple[dict, faiss.Index]:
+    """
+    인덱스 하나의 생성 시간, 메모리, recall@k, 질의 하나당 검색 지연 시간을 측정합니다.
+    index 를 주면 생성하지 않고 검색 설정만 바꿔서 측정합니다.
+    """
+    result = {"index_type": index_type}
+    if index is None:
+        start = time.perf_counter()
+        index = build_index(vectors, index_type)
+        result["build_seconds"] = time.perf_counter() - start
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids[0])
+    result.update(describe_index(index))
+    result["bytes_per_vector"] = bytes_per_vector(index)
+    result[f"recall@{k}"] = recall_at_k(np.array(found), expected)
+    result["search_ms"] = percentiles(latencies)
+    return result, index
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="FAISS 인덱스 종류별 recall/메모리 벤치마크")
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=30)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=list(INDEX_TYPES))
+    parser.add_argument("--nprobe", type=int, nargs="*", default=[], help="IVF 인덱스에서 추가로 측정할 nprobe 값")
+    parser.add_argument("--ef-search", type=int, nargs="*", default=[], help="HNSW 인덱스에서 추가로 측정할 efSearch 값")
+    parser.add_argument("--output", default=None, help="결과 파일 (기본값은 results/<커밋>-faiss_index.json)")
+    args = parser.parse_args(argv)
+
+    vectors = clustered_vectors(args.vectors, args.dim)
+    queries = clustered_vectors(args.queries, args.dim, seed=1)
+    flat = faiss.IndexFlatL2(args.dim)
+    flat.add(vectors)
+    _, expected = flat.search(queries, args.k)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "vectors": args.vectors,
+        "dim": args.dim,
+        "k": args.k,
+        "runs": [],
+    }
+    for index_type in args.types:
+        result, index = bench_index(vectors, queries, expected, index_type, args.k)
+        runs = [result]
+        if index_type.startswith("ivf"):
+            runs += [bench_index(vectors, queries, expected, index_type, args.k, nprobe=n, index=index)[0] for n in args.nprobe]
+        if index_type == "hnsw":
+            runs += [
+                bench_index(vectors, queries, expected, index_type, args.k, ef_search=ef, index=index)[0]
+                for ef in args.ef_search
+            ]
+        for run in runs:
+            report["runs"].append(run)
+            knobs = ", ".join(f"{key}={run[key]}" for key in ("nprobe", "ef_search") if key in run)
+            print(
+                f"{index_type:<12} {knobs:<14} recall@{args.k} {run[f'recall@{args.k}']:.3f}, "
+                f"{run['bytes_per_vector']:,.0f} B/vector, search p50 {run['search_ms']['p50']:.2f} ms",
+                file=sys.stderr,
+            )
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}-faiss_index.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"saved {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
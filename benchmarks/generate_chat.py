@@ -0,0 +1,180 @@
+"""
+벤치마크용 가상의 카카오톡 대화 내보내기 파일(TXT/CSV)을 생성합니다.
+
+    python -m benchmarks.generate_chat chat.txt --messages 1000000 --users 200
+
+날짜 구분선, 오전/오후 시각, 여러 줄 메시지, 입장/퇴장 안내, 링크를 포함하며
+같은 seed 를 사용하면 항상 같은 파일이 만들어집니다. 파일은 스트리밍으로 기록하므로
+메시지 수와 관계없이 메모리 사용량이 일정합니다.
+"""
+import argparse
+import csv
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+WEEKDAYS = ["월요일", "화요일", "수요일", "목요일", "금요일", "토요일", "일요일"]
+
+_FAMILY_NAMES = list("김이박최정강조윤장임한오서신권황안송류홍")
+_GIVEN_NAMES = ["민준", "서연", "도윤", "하은", "지호", "수아", "예준", "지민", "건우", "유진", "테디", "나다"]
+_LATIN_NAMES = ["J", "Teddy", "ABCDE", "llm_dev", "RAG봇", "choh"]
+
+_PHRASES = [
+    "안녕하세요",
+    "감사합니다",
+    "좋은 자료 공유 감사드립니다",
+    "Bge m3 모델이 한국어 임베딩을 잘합니다",
+    "LangChain 으로 RAG 파이프라인을 만들고 있어요",
+    "FAISS 와 Chroma 중 어떤 걸 쓰시나요?",
+    "오늘 세미나 녹화본 올라왔습니다",
+    "프롬프트를 조금 바꾸니까 답변이 훨씬 좋아졌네요",
+    "혹시 토큰 비용은 얼마나 나오나요?",
+    "앙상블 리트리버 가중치는 어떻게 정하셨어요?",
+    "ㅋㅋㅋㅋ",
+    "넵 확인했습니다",
+    "저도 같은 에러가 나요",
+    "버전 올리니까 해결됐습니다",
+]
+_LINKS = [
+    "https://huggingface.co/BAAI/bge-m3",
+    "https://github.com/teddylee777/kakaotalk-gpt",
+    "https://python.langchain.com/docs/get_started/introduction",
+    "https://www.youtube.com/c/teddynote",
+]
+
+
+def make_users(num_users: int, rng: random.Random) -> List[str]:
+    """
+    서로 다른 사용자 이름을 생성합니다.
+
+    :param num_users: 사용자 수
+    :param rng: 난수 생성기
+    :return: 사용자 이름 목록
+    """
+    users = []
+    seen = set()
+    while len(users) < num_users:
+        if rng.random() < 0.15:
+            name = f"{rng.choice(_LATIN_NAMES)}{rng.randrange(100)}"
+        else:
+            name = f"{rng.choice(_FAMILY_NAMES)}{rng.choice(_GIVEN_NAMES)}{rng.randrange(1000)}"
+        if name not in seen:
+            seen.add(name)
+            users.append(name)
+    return users
+
+
+def generate_messages(
+    num_messages: int,
+    num_users: int = 50,
+    seed: int = 0,
+    start: datetime = datetime(2023, 1, 1, 9, 0),
+    multiline_ratio: float = 0.05,
+    link_ratio: float = 0.05,
+) -> Iterator[Tuple[datetime, str, str]]:
+    """
+    (시각, 사용자, 메시지) 를 시간 순서대로 생성합니다. 메시지 사이 간격은 대부분 몇 분이며,
+    가끔 몇 시간씩 대화가 끊깁니다. 일부 사용자가 대부분의 메시지를 보내도록 가중치를 줍니다.
+
+    :param num_messages: 메시지 수
+    :param num_users: 사용자 수
+    :param seed: 난수 시드
+    :param start: 첫 메시지 시각
+    :param multiline_ratio: 여러 줄 메시지의 비율
+    :param link_ratio: 링크가 포함된 메시지의 비율
+    :return: (시각, 사용자, 메시지) 의 iterator
+    """
+    rng = random.Random(seed)
+    users = make_users(num_users, rng)
+    weights = [1 / (rank + 1) for rank in range(num_users)]
+    time = start
+    for _ in range(num_messages):
+        # 대부분은 짧은 간격, 5% 는 긴 공백
+        gap = rng.expovariate(1 / 90) if rng.random() > 0.05 else rng.uniform(3600, 36000)
+        time += timedelta(seconds=int(gap) + 1)
+        user = rng.choices(users, weights)[0]
+        message = " ".join(rng.choice(_PHRASES) for _ in range(rng.randint(1, 3)))
+        if rng.random() < link_ratio:
+            message += f" {rng.choice(_LINKS)}"
+        if rng.random() < multiline_ratio:
+            message += "\n" + "\n".join(rng.choice(_PHRASES) for _ in range(rng.randint(1, 4)))
+        yield time, user, message
+
+
+def _time_of_day(time: datetime) -> str:
+    meridiem = "오전" if time.hour < 12 else "오후"
+    hour = time.hour % 12 or 12
+    return f"[{meridiem} {hour}:{time.minute:02d}]"
+
+
+def write_txt(path: str, num_messages: int, num_users: int = 50, seed: int = 0, **kwargs) -> str:
+    """
+    모바일 '대화 내용 내보내기' 형식의 TXT 파일을 생성합니다.
+
+    :param path: 저장할 경로
+    :param num_messages: 메시지 수
+    :param num_users: 사용자 수
+    :param seed: 난수 시드
+    :param kwargs: generate_messages 에 전달할 매개변수
+    :return: 저장한 경로
+    """
+    rng = random.Random(seed + 1)
+    day = None
+    with open(path, "w", encoding="utf8") as f:
+        f.write("LLM RAG Langchain 통합 님과 카카오톡 대화\n")
+        f.write(f"저장한 날짜 : {datetime(2024, 4, 5, 22, 0):%Y-%m-%d %H:%M:%S}\n\n")
+        for time, user, message in generate_messages(num_messages, num_users, seed, **kwargs):
+            if time.date() != day:
+                day = time.date()
+                f.write(
+                    f"--------------- {day.year}년 {day.month}월 {day.day}일 {WEEKDAYS[day.weekday()]} ---------------\n"
+                )
+            if rng.random() < 0.002:
+                f.write(f"{user}님이 들어왔습니다.\n")
+            f.write(f"[{user}] {_time_of_day(time)} {message}\n")
+    return path
+
+
+def write_csv(path: str, num_messages: int, num_users: int = 50, seed: int = 0, **kwargs) -> str:
+    """
+    PC '대화 내용 저장' 형식(Date,User,Message)의 CSV 파일을 생성합니다.
+
+    :param path: 저장할 경로
+    :param num_messages: 메시지 수
+    :param num_users: 사용자 수
+    :param seed: 난수 시드
+    :param kwargs: generate_messages 에 전달할 매개변수
+    :return: 저장한 경로
+    """
+    with open(path, "w", encoding="utf8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Date", "User", "Message"])
+        for time, user, message in generate_messages(num_messages, num_users, seed, **kwargs):
+            writer.writerow([f"{time:%Y-%m-%d %H:%M:%S}", user, message])
+    return path
+
+
+def write_chat(path: str, num_messages: int, num_users: int = 50, seed: int = 0, **kwargs) -> str:
+    """
+    확장자(.txt/.csv)에 맞는 형식으로 대화 파일을 생성합니다.
+    """
+    _, suffix = os.path.splitext(path)
+    if suffix == ".txt":
+        return write_txt(path, num_messages, num_users, seed, **kwargs)
+    if suffix == ".csv":
+        return write_csv(path, num_messages, num_users, seed, **kwargs)
+    raise ValueError(f"지원하지 않는 확장자입니다: {suffix}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="가상의 카카오톡 대화 파일 생성기")
+    parser.add_argument("path", help="저장할 파일 경로 (.txt 또는 .csv)")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--multiline-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+
+    write_chat(args.path, args.messages, args.users, args.seed, multiline_ratio=args.multiline_ratio)
+    print(f"{args.path}: {os.path.getsize(args.path):,} bytes")
@@ -0,0 +1,118 @@
+"""
+실행 중인 HTTP API 서버(server.py)에 동시에 질문을 보내고 첫 토큰/전체 답변 지연 시간과 처리량을 측정합니다.
+
+    python tests/fake_openai_server.py --port 8001 --latency 0.05 --token-latency 0.01
+    OPENAI_API_KEY=sk-fake OPENAI_BASE_URL=http://127.0.0.1:8001/v1 uvicorn server:create_app --factory --port 8000
+    python -m benchmarks.load_test chat.txt --url http://127.0.0.1:8000 --requests 200 --concurrency 32
+
+가짜 OpenAI 호환 서버를 백엔드로 사용하면 API 비용 없이 서버 자체의 동시 처리 성능을 측정할 수 있습니다.
+질문마다 번호를 붙여 답변 캐시에 적중하지 않도록 합니다 (--repeat 를 주면 같은 질문을 반복하여 캐시 적중 경로를 측정).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List, Optional
+
+import httpx
+
+from benchmarks.run_benchmarks import percentiles
+
+QUESTIONS = [
+    "3월에 공유된 링크 알려줘",
+    "가장 많이 이야기한 주제는?",
+    "3월 5일에 무슨 얘기 했어?",
+    "모임 장소는 어디로 정했어?",
+]
+
+
+async def ask(client: httpx.AsyncClient, chat_key: str, question: str) -> dict:
+    """
+    질문 하나를 보내고 SSE 응답을 끝까지 읽습니다.
+
+    :return: {"first_token", "total", "cached", "error"} (초)
+    """
+    start = time.perf_counter()
+    first_token = None
+    result = {"cached": False, "error": None}
+    async with client.stream("POST", f"/chats/{chat_key}/ask", json={"question": question}) as response:
+        if response.status_code != 200:
+            await response.aread()
+            result["error"] = f"HTTP {response.status_code}: {response.text}"
+        else:
+            event = None
+            async for line in response.aiter_lines():
+                if line.startswith("event: "):
+                    event = line[len("event: ") :]
+                elif line.startswith("data: "):
+                    if event == "token" and first_token is None:
+                        first_token = time.perf_counter() - start
+                    elif event == "done":
+                        result["cached"] = json.loads(line[len("data: ") :])["cached"]
+                    elif event == "error":
+                        result["error"] = json.loads(line[len("data: ") :])["error"]
+    result.update(first_token=first_token, total=time.perf_counter() - start)
+    return result
+
+
+async def run(args) -> dict:
+    headers = {"Authorization": f"Bearer {args.api_key}"}
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits, timeout=None) as client:
+        with open(args.chat_file, "rb") as f:
+            response = await client.post("/chats", params={"file_name": os.path.basename(args.chat_file)}, content=f.read())
+        response.raise_for_status()
+        chat_key = response.json()["chat_key"]
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited(i: int) -> dict:
+            question = QUESTIONS[i % len(QUESTIONS)]
+            if not args.repeat:
+                question = f"{question} ({i})"
+            async with semaphore:
+                return await ask(client, chat_key, question)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(limited(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+    succeeded = [result for result in results if result["error"] is None]
+    summary = {
+        "requests": len(results),
+        "errors": len(results) - len(succeeded),
+        "cached": sum(result["cached"] for result in succeeded),
+        "concurrency": args.concurrency,
+        "elapsed": elapsed,
+        "requests_per_second": len(results) / elapsed,
+    }
+    first_tokens = [result["first_token"] for result in succeeded if result["first_token"] is not None]
+    if first_tokens:
+        summary["first_token_ms"] = percentiles(first_tokens)
+    if succeeded:
+        summary["total_ms"] = percentiles([result["total"] for result in succeeded])
+    errors = [result["error"] for result in results if result["error"] is not None]
+    if errors:
+        summary["first_error"] = errors[0]
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="카톡GPT HTTP API 부하 테스트")
+    parser.add_argument("chat_file", help="업로드할 카카오톡 TXT/CSV 파일")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="server.py 주소")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY", "sk-fake"), help="OpenAI API 키")
+    parser.add_argument("--requests", type=int, default=100, help="보낼 질문 수")
+    parser.add_argument("--concurrency", type=int, default=16, help="동시에 보낼 질문 수")
+    parser.add_argument("--repeat", action="store_true", help="같은 질문을 반복하여 답변 캐시 적중 경로를 측정합니다")
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(run(args))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+대화 크기별 파싱/청킹/인덱싱/검색 성능을 측정하고 결과를 커밋별 JSON 으로 저장합니다.
+
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 100000
+    python -m benchmarks.run_benchmarks --sizes 10000 --compare benchmarks/results/<이전 커밋>.json
+
+인덱싱에는 API 를 호출하지 않는 결정적인 가짜 임베딩을 사용하므로, 측정값은 임베딩 API 를 제외한
+로컬 처리 성능입니다. 결과는 benchmarks/results/<커밋>.json 에 저장됩니다.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.generate_chat import _PHRASES, write_chat
+from chunker import ConversationChunker
+from index_store import IndexStore
+from kakaotalk_loader import KaKaoTalkLoader
+import retriever as retriever_lib
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def git_commit() -> str:
+    """
+    현재 커밋 해시(작업 트리가 변경되었으면 -dirty 를 붙임)를 반환합니다.
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return f"{commit}-dirty" if dirty else commit
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """
+    밀리초 단위 p50/p95/p99 를 계산합니다.
+
+    :param values: 초 단위 측정값
+    :return: {"p50", "p95", "p99"} (ms)
+    """
+    values_ms = np.asarray(values) * 1000
+    return {f"p{q}": float(np.percentile(values_ms, q)) for q in (50, 95, 99)}
+
+
+def measure_peak_memory(func: Callable[[], object]) -> int:
+    """
+    함수 실행 중 Python 할당 메모리의 최대값(byte)을 측정합니다.
+    tracemalloc 은 실행 속도를 떨어뜨리므로 처리량 측정과 별도로 실행합니다.
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_size(path: str, num_messages: int, num_queries: int, dim: int, memory: bool) -> dict:
+    """
+    대화 파일 하나에 대해 파싱, 청킹, 인덱싱, 검색 성능을 측정합니다.
+
+    :param path: 대화 파일 경로
+    :param num_messages: 파일의 메시지 수
+    :param num_queries: 검색 지연 시간 측정에 사용할 질문 수
+    :param dim: 가짜 임베딩 차원
+    :param memory: 파싱 최대 메모리 측정 여부
+    :return: 측정 결과
+    """
+    _, suffix = os.path.splitext(path)
+    result = {"messages": num_messages, "format": suffix.lstrip("."), "file_bytes": os.path.getsize(path)}
+
+    # 파싱
+    start = time.perf_counter()
+    documents = KaKaoTalkLoader(path, suffix).load()
+    elapsed = time.perf_counter() - start
+    result["parse"] = {
+        "seconds": elapsed,
+        "messages_per_second": len(documents) / elapsed,
+        "documents": len(documents),
+    }
+    if memory:
+        result["parse"]["peak_bytes"] = measure_peak_memory(
+            lambda: sum(1 for _ in KaKaoTalkLoader(path, suffix).lazy_load())
+        )
+
+    # 청킹
+    start = time.perf_counter()
+    chunks = ConversationChunker().split_documents(documents)
+    elapsed = time.perf_counter() - start
+    result["chunk"] = {
+        "seconds": elapsed,
+        "messages_per_second": len(documents) / elapsed,
+        "chunks": len(chunks),
+    }
+    del documents
+
+    # 인덱싱 (가짜 임베딩)
+    embedding = DeterministicFakeEmbedding(size=dim)
+    embeddings = {"faiss": embedding, "chroma": embedding}
+    with tempfile.TemporaryDirectory() as index_root:
+        start = time.perf_counter()
+        faiss, _ = IndexStore(index_root).create("bench", chunks, embeddings)
+        elapsed = time.perf_counter() - start
+        result["index"] = {
+            "seconds": elapsed,
+            "chunks_per_second": len(chunks) / elapsed,
+            "dim": dim,
+            # 검색 결과 Document 를 만드는 열 단위 저장소(MessageStore)의 크기
+            "store_bytes": faiss.docstore.store.nbytes,
+        }
+
+        # 검색 지연 시간
+        rng = random.Random(0)
+        queries = [rng.choice(_PHRASES) for _ in range(num_queries)]
+        faiss_retriever = retriever_lib.FAISSRetrieverFactory(faiss).create(search_kwargs={"k": 30})
+        bm25_retriever = retriever_lib.BM25RetrieverFactory(chunks).create(search_kwargs={"k": 30})
+        ensemble_retriever = retriever_lib.EnsembleRetrieverFactory(None).create(
+            retrievers=[faiss_retriever, bm25_retriever], weights=[0.5, 0.5]
+        )
+        result["retrieve"] = {}
+        for name, retriever in [
+            ("faiss", faiss_retriever),
+            ("bm25", bm25_retriever),
+            ("ensemble", ensemble_retriever),
+        ]:
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                retriever.invoke(query)
+                latencies.append(time.perf_counter() - start)
+            result["retrieve"][name] = percentiles(latencies)
+    return result
+
+
+def compare(base: dict, current: dict) -> List[str]:
+    """
+    두 결과 파일의 같은 크기/형식 측정값을 비교한 표를 만듭니다.
+
+    :param base: 기준 결과
+    :param current: 비교할 결과
+    :return: 출력할 줄 목록
+    """
+    lines = [f"{'metric':<48} {base['commit']:>14} {current['commit']:>14} {'change':>8}"]
+    base_runs = {(run["format"], run["messages"]): run for run in base["runs"]}
+    for run in current["runs"]:
+        base_run = base_runs.get((run["format"], run["messages"]))
+        if base_run is None:
+            continue
+        for name, before, after in _flatten_pairs(base_run, run):
+            change = (after - before) / before * 100 if before else float("nan")
+            lines.append(f"{run['format']}/{run['messages']}/{name:<36} {before:>14.4g} {after:>14.4g} {change:>+7.1f}%")
+    return lines
+
+
+def _flatten_pairs(base: dict, current: dict, prefix: str = ""):
+    for key, value in current.items():
+        if key not in base:
+            continue
+        if isinstance(value, dict):
+            yield from _flatten_pairs(base[key], value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and key not in ("messages", "dim"):
+            yield f"{prefix}{key}", base[key], value
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="카톡GPT 성능 벤치마크")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="메시지 수")
+    parser.add_argument("--formats", nargs="+", default=["txt", "csv"], choices=["txt", "csv"])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=100, help="검색 지연 시간 측정 질문 수")
+    parser.add_argument("--dim", type=int, default=256, help="가짜 임베딩 차원")
+    parser.add_argument("--no-memory", action="store_true", help="파싱 최대 메모리를 측정하지 않습니다")
+    parser.add_argument("--output", default=None, help="결과 파일 (기본값은 results/<커밋>.json)")
+    parser.add_argument("--compare", default=None, help="비교할 이전 결과 파일")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "runs": [],
+    }
+    with tempfile.TemporaryDirectory() as data_dir:
+        for num_messages in args.sizes:
+            for file_format in args.formats:
+                path = os.path.join(data_dir, f"chat_{num_messages}.{file_format}")
+                write_chat(path, num_messages, args.users)
+                run = bench_size(path, num_messages, args.queries, args.dim, not args.no_memory)
+                report["runs"].append(run)
+                os.remove(path)
+                print(
+                    f"{file_format}/{num_messages}: parse {run['parse']['messages_per_second']:,.0f} msg/s, "
+                    f"chunk {run['chunk']['messages_per_second']:,.0f} msg/s, "
+                    f"index {run['index']['chunks_per_second']:,.0f} chunk/s, "
+                    f"ensemble p50 {run['retrieve']['ensemble']['p50']:.1f} ms",
+                    file=sys.stderr,
+                )
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"saved {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf8") as f:
+            print("\n".join(compare(json.load(f), report)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
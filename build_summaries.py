@@ -0,0 +1,60 @@
+"""
+대화 파일의 일/주/월 단위 요약을 미리 만들어 인덱스 디렉토리에 저장합니다.
+
+    python build_summaries.py chat.txt --model gpt-3.5-turbo
+
+인덱스가 없으면 먼저 인덱싱합니다. 이전에 만든 요약이 있으면 내용이 바뀐 기간만 다시 요약하므로,
+대화 파일을 새로 내보낸 뒤 다시 실행해도 추가된 날짜와 그 주/월만 요약합니다.
+저장된 요약은 '이번 달 대화 요약해줘' 같은 기간 요약 질문에 사용됩니다 (summary_index.SummaryRouter).
+"""
+import argparse
+import os
+import sys
+import time
+from typing import List, Optional
+
+import embeddings as embeddings_lib
+from index_store import IndexStore, file_fingerprint, stored_messages
+from pipeline import load_or_index
+from summary_index import LLMSummarizer, SummaryIndex
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="카톡GPT 기간별 요약 생성기")
+    parser.add_argument("chat_file", help="카카오톡 TXT/CSV 파일")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="OpenAI API 키")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"), help="OpenAI 호환 서버 주소")
+    parser.add_argument("--index-root", default="./index/", help="인덱스 저장 경로")
+    parser.add_argument("--model", default="gpt-3.5-turbo", help="요약에 사용할 모델")
+    parser.add_argument("--max-input-chars", type=int, default=12000, help="요약 호출 하나에 넣을 최대 글자 수")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("--api-key 또는 OPENAI_API_KEY 환경변수가 필요합니다.")
+
+    with open(args.chat_file, "rb") as f:
+        data = f.read()
+    file_name = os.path.basename(args.chat_file)
+    _, file_suffix = os.path.splitext(file_name)
+
+    index_store = IndexStore(args.index_root)
+    chat_key = file_fingerprint(data, file_suffix)
+    embeddings = embeddings_lib.embedding_factory(api_key=args.api_key, base_url=args.base_url)
+    faiss, _ = load_or_index(index_store, chat_key, data, file_name, embeddings)
+
+    start = time.perf_counter()
+    path = index_store.path(chat_key)
+    summary_index = SummaryIndex.build(
+        stored_messages(faiss),
+        LLMSummarizer(args.api_key, base_url=args.base_url, model=args.model),
+        previous=SummaryIndex.load(path),
+        max_input_chars=args.max_input_chars,
+        on_progress=lambda done, total: print(f"\r{done:,} / {total:,}", end="", file=sys.stderr),
+    )
+    summary_index.save(path)
+    print(f"\nsaved {len(summary_index):,} summaries in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
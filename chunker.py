@@ -0,0 +1,128 @@
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+
+class ConversationChunker:
+    """
+    연속된 대화 메시지를 하나의 청크로 묶는 분할기입니다.
+
+    메시지 단위 Document 를 순서대로 받아, 날짜가 바뀌거나 대화 간격이 벌어지거나
+    화자 전환 횟수 또는 길이 예산을 넘기면 새로운 청크를 시작합니다.
+    청크의 메타데이터에는 날짜 범위, 참여 사용자, 원본 행 범위가 담깁니다.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 1000,
+        max_gap_minutes: int = 30,
+        max_turns: int = 20,
+        length_function: Callable[[str], int] = len,
+    ):
+        """
+        :param chunk_size: 청크 하나의 최대 길이 (length_function 기준)
+        :param max_gap_minutes: 같은 청크로 묶을 메시지 사이의 최대 간격(분)
+        :param max_turns: 청크 하나에 허용할 최대 화자 전환 횟수
+        :param length_function: 길이를 계산하는 함수 (tiktoken 기반 토큰 수 함수 등)
+        """
+        self.chunk_size = chunk_size
+        self.max_gap_seconds = max_gap_minutes * 60
+        self.max_turns = max_turns
+        self.length_function = length_function
+        # 길이 예산을 넘는 단일 메시지를 나누기 위한 분할기
+        self._oversize_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size,
+            chunk_overlap=0,
+            length_function=length_function,
+        )
+
+    @staticmethod
+    def format_line(document: Document) -> str:
+        """
+        메시지 Document 를 `[2024-03-27 10:55] User: **, Message: 안녕하세요` 형태의 한 줄로 변환합니다.
+
+        :param document: 메시지 단위 Document
+        :return: 시각이 포함된 대화 라인
+        """
+        return f'[{document.metadata["date"][:16]}] {document.page_content.lstrip(chr(34))}'
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        """
+        메시지 Document 들을 대화 청크 Document 목록으로 변환합니다.
+
+        :param documents: 행 순서대로 정렬된 메시지 단위 Document
+        :return: 청크 Document 목록
+        """
+        return list(self.lazy_split_documents(documents))
+
+    def lazy_split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """
+        split_documents 의 스트리밍 버전입니다. 한 번에 하나의 청크만 메모리에 유지합니다.
+
+        :param documents: 행 순서대로 정렬된 메시지 단위 Document
+        :return: 청크 Document 의 iterator
+        """
+        lines: List[str] = []
+        messages: List[Document] = []
+        length = 0
+        turns = 0
+        last_user: Optional[str] = None
+        last_day = None
+        last_time: Optional[datetime] = None
+
+        for document in documents:
+            metadata = document.metadata
+            line = self.format_line(document)
+            line_length = self.length_function(line)
+            time = datetime.fromisoformat(metadata["date"])
+            day = (metadata["year"], metadata["month"], metadata["day"])
+            user = metadata["user"]
+
+            if messages:
+                is_new_turn = user != last_user
+                if (
+                    day != last_day
+                    or (time - last_time).total_seconds() > self.max_gap_seconds
+                    or length + 1 + line_length > self.chunk_size
+                    or (is_new_turn and turns + 1 > self.max_turns)
+                ):
+                    yield from self._build_chunks(lines, messages)
+                    lines, messages, length, turns = [], [], 0, 0
+                elif is_new_turn:
+                    turns += 1
+
+            lines.append(line)
+            messages.append(document)
+            length += line_length + (1 if len(lines) > 1 else 0)
+            last_user, last_day, last_time = user, day, time
+
+        if messages:
+            yield from self._build_chunks(lines, messages)
+
+    def _build_chunks(self, lines: List[str], messages: List[Document]) -> Iterator[Document]:
+        first, last = messages[0].metadata, messages[-1].metadata
+        speakers = Counter(message.metadata["user"] for message in messages)
+        metadata = {
+            "date": first["date"],
+            "date_end": last["date"],
+            "year": first["year"],
+            "month": first["month"],
+            "day": first["day"],
+            # 가장 많이 발화한 사용자를 대표 사용자로, 전체 참여자는 users 에 기록합니다.
+            "user": speakers.most_common(1)[0][0],
+            "users": ", ".join(speakers),
+            "row": first["row"],
+            "row_end": last["row"],
+            "source": first["source"],
+        }
+        text = "\n".join(lines)
+
+        # 메시지 하나가 길이 예산을 넘는 경우에만 다시 나눕니다.
+        if len(messages) == 1 and self.length_function(text) > self.chunk_size:
+            for piece in self._oversize_splitter.split_text(text):
+                yield Document(page_content=piece, metadata=dict(metadata))
+        else:
+            yield Document(page_content=text, metadata=metadata)
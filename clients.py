@@ -0,0 +1,97 @@
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+# API 키별로 공유하는 keep-alive HTTP 연결 풀 설정
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+_lock = threading.Lock()
+_http_clients: Dict[Tuple[str, Optional[str]], httpx.Client] = {}
+_chat_models: Dict[tuple, ChatOpenAI] = {}
+_embeddings: Dict[tuple, OpenAIEmbeddings] = {}
+
+
+def _key_id(api_key: str) -> str:
+    # API 키 원문 대신 해시를 레지스트리의 키로 사용합니다.
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+def get_http_client(api_key: str, base_url: Optional[str] = None) -> httpx.Client:
+    """
+    API 키(와 base_url)별로 프로세스 전체에서 공유하는 httpx 클라이언트를 반환합니다.
+    같은 키로 생성한 LLM/임베딩 클라이언트는 하나의 연결 풀을 사용하므로 TLS 연결을 재사용합니다.
+
+    :param api_key: OpenAI API 키
+    :param base_url: OpenAI 호환 서버 주소 (기본값은 OpenAI)
+    :return: 공유 httpx 클라이언트
+    """
+    key = (_key_id(api_key), base_url)
+    with _lock:
+        if key not in _http_clients:
+            _http_clients[key] = httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        return _http_clients[key]
+
+
+def get_chat_model(
+    api_key: str,
+    model: str = "gpt-4-turbo-preview",
+    temperature: float = 0,
+    streaming: bool = False,
+    base_url: Optional[str] = None,
+) -> ChatOpenAI:
+    """
+    설정별로 공유하는 ChatOpenAI 인스턴스를 반환합니다.
+    콜백은 인스턴스에 고정하지 않으므로, 요청마다 invoke 의 config={"callbacks": [...]} 로 전달합니다.
+
+    :param api_key: OpenAI API 키
+    :param model: 모델 이름
+    :param temperature: 샘플링 온도
+    :param streaming: 토큰 스트리밍 여부
+    :param base_url: OpenAI 호환 서버 주소 (기본값은 OpenAI)
+    :return: 공유 ChatOpenAI
+    """
+    key = (_key_id(api_key), model, temperature, streaming, base_url)
+    with _lock:
+        if key in _chat_models:
+            return _chat_models[key]
+    chat_model = ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        streaming=streaming,
+        api_key=api_key,
+        base_url=base_url,
+        http_client=get_http_client(api_key, base_url),
+    )
+    with _lock:
+        return _chat_models.setdefault(key, chat_model)
+
+
+def get_embeddings(
+    api_key: str,
+    model: str = "text-embedding-ada-002",
+    base_url: Optional[str] = None,
+) -> OpenAIEmbeddings:
+    """
+    설정별로 공유하는 OpenAIEmbeddings 인스턴스를 반환합니다.
+
+    :param api_key: OpenAI API 키
+    :param model: 임베딩 모델 이름
+    :param base_url: OpenAI 호환 서버 주소 (기본값은 OpenAI)
+    :return: 공유 OpenAIEmbeddings
+    """
+    key = (_key_id(api_key), model, base_url)
+    with _lock:
+        if key in _embeddings:
+            return _embeddings[key]
+    embedding = OpenAIEmbeddings(
+        model=model,
+        api_key=api_key,
+        base_url=base_url,
+        http_client=get_http_client(api_key, base_url),
+    )
+    with _lock:
+        return _embeddings.setdefault(key, embedding)
@@ -0,0 +1,154 @@
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.documents import Document
+from langchain_core.runnables import Runnable, RunnableLambda
+
+import tracing
+from embeddings import _tiktoken_counter
+
+
+class ContextPacker:
+    """
+    검색된 청크를 프롬프트의 {context} 로 넣을 대화 기록 문자열로 조립합니다.
+
+    검색 순위가 높은 청크부터 토큰 예산 안에 들어가는 만큼 선택하고, 같은 행 범위의 중복 청크는 제외합니다.
+    선택한 청크는 원본 행 순서로 정렬한 뒤 이어지는 행끼리 하나의 대화 구간으로 합쳐서,
+    메타데이터 없이 `[2024-03-27 10:55] User: **, Message: ...` 형태의 라인만 출력합니다.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 6000,
+        token_counter: Optional[Callable[[str], int]] = None,
+        separator: str = "\n\n",
+    ):
+        """
+        :param max_tokens: 조립한 context 의 최대 토큰 수
+        :param token_counter: 토큰 수를 계산하는 함수 (기본값은 tiktoken cl100k_base, 사용할 수 없으면 글자 수)
+        :param separator: 이어지지 않는 대화 구간 사이의 구분자
+        """
+        self.max_tokens = max_tokens
+        self.token_counter = token_counter or _tiktoken_counter()
+        self.separator = separator
+
+    def select(self, documents: Sequence[Document]) -> List[Document]:
+        """
+        검색 순위대로 정렬된 청크 중 중복을 제외하고 토큰 예산에 들어가는 청크를 고릅니다.
+
+        :param documents: 검색 순위대로 정렬된 청크 Document
+        :return: 선택된 청크 (검색 순위 순)
+        """
+        selected: List[Document] = []
+        seen = set()
+        spans = []
+        separator_tokens = self.token_counter(self.separator)
+        tokens = 0
+        for document in documents:
+            key = self._key(document)
+            if key in seen or self._is_covered(document, spans):
+                continue
+            seen.add(key)
+            document_tokens = self.token_counter(document.page_content)
+            cost = document_tokens + (separator_tokens if selected else 0)
+            # 예산을 넘는 청크는 건너뛰고, 남은 예산에 들어가는 더 짧은 청크를 계속 찾습니다.
+            if tokens + cost > self.max_tokens:
+                continue
+            tokens += cost
+            selected.append(document)
+            span = self._span(document)
+            if span is not None:
+                spans.append(span)
+        tracing.count("context_tokens", tokens)
+        return selected
+
+    def pack(self, documents: Sequence[Document]) -> str:
+        """
+        청크를 골라 원본 행 순서의 대화 기록 문자열로 조립합니다.
+
+        :param documents: 검색 순위대로 정렬된 청크 Document
+        :return: 프롬프트에 넣을 context 문자열
+        """
+        with tracing.span("context.pack", candidates=len(documents)) as trace_span:
+            context = self.format(self.select(documents))
+            trace_span.set(chars=len(context))
+        return context
+
+    def format(self, selected: Sequence[Document]) -> str:
+        """
+        select 로 고른 청크를 원본 행 순서의 대화 기록 문자열로 변환합니다.
+
+        :param selected: 선택된 청크
+        :return: 프롬프트에 넣을 context 문자열
+        """
+        # 행 정보가 없는 문서는 검색 순위 순서 그대로 뒤에 붙입니다.
+        # 같은 시작 행이면 넓은 구간을 먼저 두어, 그 안에 포함되는 좁은 구간을 건너뛸 수 있게 합니다.
+        ordered = sorted(
+            (document for document in selected if self._span(document) is not None),
+            key=lambda document: self._order(self._span(document)),
+        )
+        unordered = [document for document in selected if self._span(document) is None]
+
+        blocks: List[List[str]] = []
+        emitted = []
+        last_span = None
+        for document in ordered:
+            # 이미 넣은 더 넓은 구간에 완전히 포함되는 청크만 건너뜁니다. 긴 메시지를 나눈 조각이나
+            # 여러 줄 메시지처럼 행 범위가 같은 청크는 한 행이 여러 줄이므로 줄 수로 겹침을 계산하지 않고 그대로 넣습니다.
+            if self._is_covered(document, emitted):
+                continue
+            span = self._span(document)
+            source, row, row_end = span
+            lines = document.page_content.split("\n")
+            # 같은 파일에서 바로 이어지거나 겹치는 행이면 이전 구간에 합칩니다.
+            if last_span is not None and last_span[0] == source and row <= last_span[2] + 1:
+                blocks[-1].extend(lines)
+                last_span = (source, last_span[1], max(last_span[2], row_end))
+            else:
+                blocks.append(lines)
+                last_span = span
+            emitted.append(span)
+        blocks.extend([document.page_content] for document in unordered)
+        return self.separator.join("\n".join(block) for block in blocks)
+
+    def as_runnable(self) -> Runnable:
+        """
+        Document 목록을 받아 context 문자열을 반환하는 Runnable 을 생성합니다.
+
+        :return: retriever 뒤에 연결할 Runnable
+        """
+        return RunnableLambda(self.pack, name="ContextPacker")
+
+    @staticmethod
+    def _span(document: Document):
+        metadata = document.metadata
+        if "row" not in metadata:
+            return None
+        return (
+            str(metadata.get("source", "")),
+            int(metadata["row"]),
+            int(metadata.get("row_end", metadata["row"])),
+        )
+
+    @staticmethod
+    def _order(span):
+        source, row, row_end = span
+        return source, row, -row_end
+
+    @staticmethod
+    def _key(document: Document):
+        return (ContextPacker._span(document), document.page_content)
+
+    @staticmethod
+    def _is_covered(document: Document, spans) -> bool:
+        # 이미 선택한 더 넓은 청크에 행 범위가 완전히 포함되면 중복으로 봅니다.
+        span = ContextPacker._span(document)
+        if span is None:
+            return False
+        source, row, row_end = span
+        return any(
+            source == other[0]
+            and other[1] <= row
+            and row_end <= other[2]
+            and (other[2] - other[1]) > (row_end - row)
+            for other in spans
+        )
@@ -1,29 +1,426 @@
-from langchain_openai.embeddings import OpenAIEmbeddings
-from langchain.storage import LocalFileStore
-from langchain.embeddings import CacheBackedEmbeddings
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
+import numpy as np
+from langchain_core.embeddings import Embeddings
 
-def embedding_factory(api_key: str, use_cache=True):
-    # OpenAI 임베딩을 사용하여 기본 임베딩 설정
-    embedding = OpenAIEmbeddings(api_key=api_key)
+import tracing
+from clients import get_embeddings
 
-    if use_cache:
-        # 로컬 파일 저장소 설정
-        store = LocalFileStore("./cache/")
-
-        # 캐시를 지원하는 임베딩 생성
-        faiss_cached_embedder = CacheBackedEmbeddings.from_bytes_store(
-            embedding,
-            store,
-            namespace="faiss",  # 기본 임베딩과 저장소를 사용하여 캐시 지원 임베딩을 생성
-        )
 
-        chroma_cached_embedder = CacheBackedEmbeddings.from_bytes_store(
-            embedding,
-            store,
-            namespace="chroma",  # 기본 임베딩과 저장소를 사용하여 캐시 지원 임베딩을 생성
+class EmbeddingStore:
+    """
+    임베딩 벡터를 하나의 SQLite 파일에 float32 로 압축 저장하는 저장소입니다.
+    키 하나당 한 행을 사용하며, 전체 크기가 max_bytes 를 넘으면 가장 오래 사용하지 않은
+    벡터부터 삭제합니다(LRU).
+    """
+
+    # SQLite 의 바인딩 변수 개수 제한(999)을 넘지 않도록 나누어 조회합니다.
+    _QUERY_BATCH_SIZE = 500
+
+    def __init__(self, path: str = "./cache/embeddings.sqlite3", max_bytes: int = 1 << 30):
+        """
+        :param path: SQLite 파일 경로
+        :param max_bytes: 저장할 벡터의 최대 총 크기(byte)
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vector BLOB NOT NULL, accessed INTEGER NOT NULL)"
         )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)"
+        )
+        size, clock = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(vector)), 0), COALESCE(MAX(accessed), 0) FROM embeddings"
+        ).fetchone()
+        # 저장된 벡터의 총 크기와, LRU 순서를 기록하기 위한 단조 증가 카운터
+        self.size_bytes = size
+        self._clock = clock
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def mget(self, keys: Sequence[bytes]) -> List[Optional[np.ndarray]]:
+        """
+        여러 키의 벡터를 한 번에 조회합니다.
+
+        :param keys: 조회할 키 목록
+        :return: 키 순서대로 정렬된 벡터 목록 (없는 키는 None)
+        """
+        found: Dict[bytes, bytes] = {}
+        with self._lock:
+            self._clock += 1
+            with self._transaction():
+                for start in range(0, len(keys), self._QUERY_BATCH_SIZE):
+                    batch = keys[start : start + self._QUERY_BATCH_SIZE]
+                    placeholders = ",".join("?" * len(batch))
+                    found.update(
+                        self._conn.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                            batch,
+                        ).fetchall()
+                    )
+                    self._conn.execute(
+                        f"UPDATE embeddings SET accessed = ? WHERE key IN ({placeholders})",
+                        (self._clock, *batch),
+                    )
+        return [
+            np.frombuffer(found[key], dtype=np.float32) if key in found else None
+            for key in keys
+        ]
+
+    def mset(self, items: Sequence[Tuple[bytes, Sequence[float]]]) -> None:
+        """
+        여러 벡터를 한 번에 저장하고, 필요하면 오래된 벡터를 삭제합니다.
+
+        :param items: (키, 벡터) 튜플 목록
+        """
+        with self._lock:
+            self._clock += 1
+            with self._transaction():
+                for key, vector in items:
+                    blob = np.asarray(vector, dtype=np.float32).tobytes()
+                    cursor = self._conn.execute(
+                        "INSERT OR IGNORE INTO embeddings (key, vector, accessed) VALUES (?, ?, ?)",
+                        (key, blob, self._clock),
+                    )
+                    if cursor.rowcount:
+                        self.size_bytes += len(blob)
+                if self.size_bytes > self.max_bytes:
+                    self._evict()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # 중간에 예외가 발생하면(database is locked, 잘못된 벡터 등) 롤백하여, 공유 연결이 열린 트랜잭션에
+        # 남아 이후의 BEGIN 이 모두 실패하지 않도록 합니다. size_bytes 도 트랜잭션 이전 값으로 되돌립니다.
+        size_bytes = self.size_bytes
+        self._conn.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            self.size_bytes = size_bytes
+            raise
+        self._conn.execute("COMMIT")
+
+    def _evict(self) -> None:
+        # 용량의 90% 이하가 될 때까지 가장 오래 사용하지 않은 벡터부터 삭제합니다.
+        target = self.max_bytes * 0.9
+        evicted = []
+        for key, length in self._conn.execute(
+            "SELECT key, LENGTH(vector) FROM embeddings ORDER BY accessed"
+        ):
+            if self.size_bytes <= target:
+                break
+            evicted.append((key,))
+            self.size_bytes -= length
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    모델 이름과 텍스트 해시를 키로 사용하는 캐시 임베딩입니다.
+    같은 텍스트는 어떤 벡터스토어에서 사용하더라도 한 번만 임베딩합니다.
+    """
+
+    def __init__(self, underlying: Embeddings, store: EmbeddingStore, model: Optional[str] = None):
+        """
+        :param underlying: 실제 임베딩을 수행하는 임베딩 인스턴스
+        :param store: 임베딩 저장소
+        :param model: 캐시 키에 사용할 모델 이름 (기본값은 underlying.model)
+        """
+        self.underlying = underlying
+        self.store = store
+        self.model = model or getattr(underlying, "model", underlying.__class__.__name__)
+        # 캐시 적중/미적중 횟수
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    def key(self, text: str) -> bytes:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).digest()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.key(text) for text in texts]
+        vectors = self.store.mget(keys)
+
+        # 캐시에 없는 텍스트만 중복 없이 임베딩합니다.
+        missing: Dict[bytes, str] = {}
+        for key, text, vector in zip(keys, texts, vectors):
+            if vector is None:
+                missing.setdefault(key, text)
+        with self._counter_lock:
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        tracing.count("embedding_cache_hits", len(texts) - len(missing))
+        tracing.count("embedding_cache_misses", len(missing))
+
+        if missing:
+            # 캐시 적중 여부와 관계없이 같은 값을 반환하도록 float32 로 맞춥니다.
+            with tracing.span("embed.api", items=len(missing)):
+                computed = {
+                    key: np.asarray(vector, dtype=np.float32)
+                    for key, vector in zip(
+                        missing, self.underlying.embed_documents(list(missing.values()))
+                    )
+                }
+            self.store.mset(list(computed.items()))
+            vectors = [
+                computed[key] if vector is None else vector
+                for key, vector in zip(keys, vectors)
+            ]
+        return [vector.tolist() for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def lookup(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """
+        캐시에 있는 임베딩만 반환합니다. 적중 횟수만 기록하며, 캐시에 없는 텍스트는
+        embed_documents 로 임베딩할 때 미적중으로 기록됩니다.
+
+        :param texts: 텍스트 목록
+        :return: 입력 순서대로 정렬된 임베딩 목록 (캐시에 없으면 None)
+        """
+        vectors = self.store.mget([self.key(text) for text in texts])
+        hits = sum(vector is not None for vector in vectors)
+        with self._counter_lock:
+            self.hits += hits
+        tracing.count("embedding_cache_hits", hits)
+        return [None if vector is None else vector.tolist() for vector in vectors]
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    임베딩 API 의 429(rate limit) 응답으로 발생한 예외인지 확인합니다.
+
+    :param error: 임베딩 호출 중 발생한 예외
+    :return: rate limit 예외 여부
+    """
+    return (
+        getattr(error, "status_code", None) == 429
+        or type(error).__name__ == "RateLimitError"
+        or "rate limit" in str(error).lower()
+    )
+
 
-        return {"faiss": faiss_cached_embedder, "chroma": chroma_cached_embedder}
+class EmbeddingPipeline:
+    """
+    텍스트를 토큰 수 기준의 배치로 나누어, 제한된 스레드 풀에서 동시에 임베딩하는 파이프라인입니다.
+
+    rate limit 응답을 받으면 동시 요청 수를 절반으로 줄이고 잠시 기다린 뒤 재시도하며,
+    요청이 연속으로 성공하면 동시 요청 수를 하나씩 늘립니다 (AIMD).
+    진행 상황 콜백은 항상 호출한 스레드에서 실행되므로 Streamlit 위젯을 바로 갱신할 수 있습니다.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        max_batch_tokens: int = 50000,
+        max_batch_size: int = 1000,
+        max_concurrency: int = 8,
+        initial_concurrency: int = 4,
+        max_retries: int = 6,
+        backoff: float = 1.0,
+        token_counter: Optional[Callable[[str], int]] = None,
+    ):
+        """
+        :param embedding: 배치를 임베딩할 임베딩 인스턴스 (CachedEmbeddings 권장)
+        :param max_batch_tokens: 배치 하나의 최대 토큰 수
+        :param max_batch_size: 배치 하나의 최대 텍스트 수
+        :param max_concurrency: 최대 동시 요청 수
+        :param initial_concurrency: 처음 동시 요청 수
+        :param max_retries: 배치 하나당 rate limit 재시도 횟수
+        :param backoff: 첫 재시도 전 대기 시간(초), 재시도마다 두 배로 늘어납니다
+        :param token_counter: 텍스트의 토큰 수를 계산하는 함수 (기본값은 tiktoken cl100k_base)
+        """
+        self.embedding = embedding
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.initial_concurrency = min(initial_concurrency, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.token_counter = token_counter or _tiktoken_counter()
+        # 마지막 실행의 통계
+        self.concurrency = self.initial_concurrency
+        self.rate_limited = 0
+        self.tokens = 0
+
+    def batches(self, texts: Sequence[str]) -> List[Tuple[int, int]]:
+        """
+        텍스트를 순서대로 배치로 나눕니다.
+
+        :param texts: 임베딩할 텍스트 목록
+        :return: 배치별 (시작 인덱스, 끝 인덱스) 목록
+        """
+        batches = []
+        start, tokens = 0, 0
+        self.tokens = 0
+        for i, text in enumerate(texts):
+            text_tokens = self.token_counter(text)
+            self.tokens += text_tokens
+            if i > start and (
+                tokens + text_tokens > self.max_batch_tokens
+                or i - start >= self.max_batch_size
+            ):
+                batches.append((start, i))
+                start, tokens = i, 0
+            tokens += text_tokens
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def embed(
+        self,
+        texts: Sequence[str],
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> List[List[float]]:
+        """
+        텍스트 목록을 임베딩합니다.
+
+        :param texts: 임베딩할 텍스트 목록
+        :param on_progress: (완료된 텍스트 수, 전체 텍스트 수) 를 받는 진행 상황 콜백
+        :return: 입력 순서대로 정렬된 임베딩 목록
+        """
+        texts = list(texts)
+        with tracing.span("embed", items=len(texts)) as span:
+            # 캐시에 있는 텍스트는 토큰 수를 세지 않고 API 로 보낼 배치에서도 제외합니다.
+            if isinstance(self.embedding, CachedEmbeddings):
+                vectors = self.embedding.lookup(texts)
+            else:
+                vectors = [None] * len(texts)
+            missing = [i for i, vector in enumerate(vectors) if vector is None]
+            cached = len(texts) - len(missing)
+            if on_progress is not None and cached:
+                on_progress(cached, len(texts))
+                report = on_progress
+
+                def on_progress(done: int, total: int) -> None:
+                    report(cached + done, cached + total)
+
+            computed = self._embed([texts[i] for i in missing], on_progress)
+            for i, vector in zip(missing, computed):
+                vectors[i] = vector
+            span.set(
+                tokens=self.tokens, cached=cached, rate_limited=self.rate_limited, concurrency=self.concurrency
+            )
+        # API 로 보낸 텍스트의 토큰 수만 기록합니다 (캐시 적중은 embedding_cache_hits 로 따로 기록).
+        tracing.count("embedding_tokens", self.tokens)
+        return vectors
+
+    def _embed(
+        self,
+        texts: List[str],
+        on_progress: Optional[Callable[[int, int], None]],
+    ) -> List[List[float]]:
+        pending = list(enumerate(self.batches(texts)))
+        vectors: List[Optional[List[List[float]]]] = [None] * len(pending)
+        attempts = [0] * len(pending)
+        done_texts = 0
+        successes = 0
+        self.concurrency = self.initial_concurrency
+        self.rate_limited = 0
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            in_flight = {}
+            # 뒤쪽 배치부터 꺼낼 수 있도록 뒤집어 둡니다.
+            pending.reverse()
+            while pending or in_flight:
+                while pending and len(in_flight) < self.concurrency:
+                    i, (start, end) = pending.pop()
+                    delay = self.backoff * 2 ** (attempts[i] - 1) if attempts[i] else 0.0
+                    future = executor.submit(self._embed_batch, texts[start:end], delay)
+                    in_flight[future] = (i, (start, end))
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i, (start, end) = in_flight.pop(future)
+                    try:
+                        vectors[i] = future.result()
+                    except Exception as e:
+                        if not is_rate_limit_error(e) or attempts[i] >= self.max_retries:
+                            raise
+                        # rate limit: 동시 요청 수를 절반으로 줄이고 같은 배치를 다시 시도합니다.
+                        self.rate_limited += 1
+                        attempts[i] += 1
+                        self.concurrency = max(1, self.concurrency // 2)
+                        successes = 0
+                        pending.append((i, (start, end)))
+                        continue
+
+                    done_texts += end - start
+                    successes += 1
+                    if successes >= self.concurrency and self.concurrency < self.max_concurrency:
+                        self.concurrency += 1
+                        successes = 0
+                    if on_progress is not None:
+                        on_progress(done_texts, len(texts))
+
+        return [vector for batch in vectors for vector in batch]
+
+    def _embed_batch(self, texts: List[str], delay: float) -> List[List[float]]:
+        if delay:
+            time.sleep(delay)
+        return self.embedding.embed_documents(texts)
+
+
+@lru_cache(maxsize=1)
+def _tiktoken_counter() -> Callable[[str], int]:
+    # tiktoken 인코딩은 처음 사용할 때 내려받으므로, 사용할 수 없으면 글자 수로 대신합니다.
+    try:
+        import tiktoken
+
+        encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return len
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+# 프로세스 전체에서 공유하는 임베딩 저장소 (경로별로 하나)
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(path: str = "./cache/embeddings.sqlite3", **kwargs) -> EmbeddingStore:
+    """
+    경로별로 하나의 EmbeddingStore 를 생성하여 프로세스 전체에서 공유합니다.
+
+    :param path: SQLite 파일 경로
+    :param kwargs: EmbeddingStore 생성 시 전달할 추가 매개변수
+    :return: 공유 임베딩 저장소
+    """
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = EmbeddingStore(path, **kwargs)
+        return _stores[path]
+
+
+def embedding_factory(api_key: str, use_cache=True, base_url=None):
+    # OpenAI 임베딩을 사용하여 기본 임베딩 설정 (API 키별로 HTTP 연결 풀을 공유)
+    embedding = get_embeddings(api_key, base_url=base_url)
+
+    if use_cache:
+        # FAISS 와 Chroma 가 하나의 캐시를 공유하므로 같은 텍스트는 한 번만 임베딩됩니다.
+        cached_embedder = CachedEmbeddings(embedding, get_embedding_store())
+        return {"faiss": cached_embedder, "chroma": cached_embedder}
     else:
         return {"faiss": embedding, "chroma": embedding}
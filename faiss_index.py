@@ -0,0 +1,240 @@
+import logging
+import math
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# index_type="auto" 일 때 사용할 벡터 수 기준
+FLAT_MAX_VECTORS = 20_000
+IVF_SQ_MAX_VECTORS = 200_000
+# 학습(k-means)에 사용할 최대 벡터 수. 이보다 많으면 무작위로 고른 표본으로 학습합니다.
+MAX_TRAINING_VECTORS = 50_000
+# faiss 가 k-means 중심 하나당 요구하는 최소 학습 벡터 수
+MIN_POINTS_PER_CENTROID = 39
+
+# 인덱스 종류별 설명
+INDEX_TYPES = {
+    "flat": "정확한 검색 (float32, 차원 x 4 byte)",
+    "sq_fp16": "float16 으로 압축한 정확한 검색 (차원 x 2 byte)",
+    "hnsw": "HNSW 그래프 근사 검색 (float32 + 그래프, 학습 불필요)",
+    "ivf_flat": "IVF 근사 검색 (float32)",
+    "ivf_sq_fp16": "IVF 근사 검색 + float16 압축",
+    "ivf_pq": "IVF 근사 검색 + PQ 압축 (벡터당 수십~수백 byte)",
+}
+
+
+def choose_index_type(num_vectors: int) -> str:
+    """
+    벡터 수에 맞는 인덱스 종류를 고릅니다. 작은 대화방은 정확한 flat 인덱스를, 큰 대화방은 메모리와 검색 시간을
+    줄이는 IVF 인덱스를 사용합니다.
+
+    :param num_vectors: 인덱싱할 벡터 수
+    :return: INDEX_TYPES 의 키
+    """
+    if num_vectors <= FLAT_MAX_VECTORS:
+        return "flat"
+    if num_vectors <= IVF_SQ_MAX_VECTORS:
+        return "ivf_sq_fp16"
+    return "ivf_pq"
+
+
+def default_nlist(num_vectors: int) -> int:
+    # IVF 클러스터 수는 √n 의 4배를 기준으로, 클러스터마다 학습 벡터가 충분하도록 제한합니다.
+    return max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // MIN_POINTS_PER_CENTROID, 65536))
+
+
+def default_pq_subquantizers(dim: int) -> int:
+    # 차원의 약수 중 dim / 16 이하인 가장 큰 값 (1536 차원이면 96 byte/벡터)
+    target = max(1, dim // 16)
+    return max(m for m in range(1, target + 1) if dim % m == 0)
+
+
+def index_spec(index_type: str, num_vectors: int, dim: int, nlist: Optional[int] = None, pq_m: Optional[int] = None) -> str:
+    """
+    인덱스 종류를 faiss.index_factory 문자열로 변환합니다.
+
+    :param index_type: INDEX_TYPES 의 키
+    :param num_vectors: 인덱싱할 벡터 수
+    :param dim: 벡터 차원
+    :param nlist: IVF 클러스터 수 (기본값은 default_nlist)
+    :param pq_m: PQ 부분 벡터 수 (기본값은 default_pq_subquantizers)
+    :return: index_factory 문자열 (예: "IVF256,SQfp16")
+    """
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "sq_fp16":
+        return "SQfp16"
+    if index_type == "hnsw":
+        return "HNSW32"
+    nlist = nlist or default_nlist(num_vectors)
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_sq_fp16":
+        return f"IVF{nlist},SQfp16"
+    if index_type == "ivf_pq":
+        return f"IVF{nlist},PQ{pq_m or default_pq_subquantizers(dim)}"
+    raise ValueError(f"지원하지 않는 인덱스 종류입니다: {index_type} (지원: {', '.join(INDEX_TYPES)}, auto)")
+
+
+def faiss_nlist(spec: str) -> int:
+    # "IVF256,SQfp16" -> 256 (IVF 가 아니면 0)
+    if not spec.startswith("IVF"):
+        return 0
+    return int(spec[3:].split(",", 1)[0])
+
+
+def _min_training_vectors(index_type: str, nlist: int) -> int:
+    if index_type == "ivf_pq":
+        # 8bit PQ 는 부분 벡터마다 256 개의 중심을 학습합니다.
+        return MIN_POINTS_PER_CENTROID * max(nlist, 256)
+    if index_type.startswith("ivf"):
+        return MIN_POINTS_PER_CENTROID * nlist
+    return 0
+
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: str = "auto",
+    nlist: Optional[int] = None,
+    pq_m: Optional[int] = None,
+    nprobe: Optional[int] = None,
+    ef_search: int = 128,
+    seed: int = 0,
+) -> faiss.Index:
+    """
+    벡터로 FAISS 인덱스를 만듭니다. 학습이 필요한 인덱스는 최대 MAX_TRAINING_VECTORS 개의 표본으로 학습하며,
+    학습할 벡터가 부족하면 flat 인덱스를 사용합니다. 검색 기본값(nprobe, efSearch)은 인덱스에 함께 저장됩니다.
+
+    :param vectors: (n, dim) float32 벡터
+    :param index_type: INDEX_TYPES 의 키 또는 "auto" (벡터 수로 선택)
+    :param nlist: IVF 클러스터 수
+    :param pq_m: PQ 부분 벡터 수
+    :param nprobe: IVF 검색 시 확인할 클러스터 수 (기본값은 nlist / 4, 최소 8). 클수록 recall 이 높고 느립니다.
+    :param ef_search: HNSW 검색 후보 수. 클수록 recall 이 높고 느립니다.
+    :param seed: 학습 표본을 고를 난수 시드
+    :return: 벡터가 추가된 FAISS 인덱스
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+    if index_type == "auto":
+        index_type = choose_index_type(num_vectors)
+    spec = index_spec(index_type, num_vectors, dim, nlist, pq_m)
+
+    nlist = faiss_nlist(spec)
+    if num_vectors < _min_training_vectors(index_type, nlist):
+        logger.warning("%d vectors are not enough to train %s, using Flat", num_vectors, spec)
+        spec, nlist = "Flat", 0
+
+    index = faiss.index_factory(dim, spec, faiss.METRIC_L2)
+    if not index.is_trained:
+        training = vectors
+        if num_vectors > MAX_TRAINING_VECTORS:
+            rng = np.random.default_rng(seed)
+            training = vectors[np.sort(rng.choice(num_vectors, MAX_TRAINING_VECTORS, replace=False))]
+        index.train(training)
+    index.add(vectors)
+
+    if nlist and not nprobe:
+        nprobe = min(nlist, max(8, nlist // 4))
+    set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+    return index
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> None:
+    """
+    검색 정확도/속도 설정을 바꿉니다. 해당하지 않는 설정(예: flat 인덱스의 nprobe)은 무시합니다.
+
+    :param index: FAISS 인덱스
+    :param nprobe: IVF 검색 시 확인할 클러스터 수
+    :param ef_search: HNSW 검색 후보 수
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    hnsw = faiss.downcast_index(index)
+    if hasattr(hnsw, "hnsw") and ef_search:
+        hnsw.hnsw.efSearch = ef_search
+
+
+def bytes_per_vector(index: faiss.Index) -> float:
+    """
+    직렬화한 인덱스 크기를 벡터 수로 나눈 값입니다 (메모리에 올렸을 때의 크기와 거의 같습니다).
+    """
+    return faiss.serialize_index(index).nbytes / max(1, index.ntotal)
+
+
+def describe_index(index: faiss.Index) -> dict:
+    """
+    인덱스 종류와 검색 설정을 반환합니다 (manifest 에 기록).
+
+    :param index: FAISS 인덱스
+    :return: {"type", "ntotal", "nlist"?, "nprobe"?, "ef_search"?}
+    """
+    description = {"type": type(faiss.downcast_index(index)).__name__, "ntotal": index.ntotal}
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        description["nlist"] = ivf.nlist
+        description["nprobe"] = ivf.nprobe
+    hnsw = faiss.downcast_index(index)
+    if hasattr(hnsw, "hnsw"):
+        description["ef_search"] = hnsw.hnsw.efSearch
+    return description
+
+
+def enable_reconstruct(index: faiss.Index) -> None:
+    """
+    IVF 인덱스에서도 벡터 번호로 벡터를 복원(reconstruct)할 수 있도록 direct map 을 만듭니다.
+    flat/SQ/HNSW 인덱스는 그대로 복원할 수 있으므로 아무 일도 하지 않습니다.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+
+def search_subset(
+    index: faiss.Index, vector: np.ndarray, ids: np.ndarray, k: int, brute_force_max: int = 4096
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ids 에 포함된 벡터 중에서만 가장 가까운 k 개를 찾습니다.
+
+    후보가 brute_force_max 개 이하이면 후보 벡터만 복원하여 NumPy 로 거리를 계산하고 (후보 수에 비례하는 비용),
+    그보다 많으면 IDSelector 로 후보만 비교하도록 FAISS 검색을 제한합니다. IVF 인덱스는 후보가 어느 클러스터에
+    있을지 모르므로 모든 클러스터를 확인합니다.
+
+    :param index: FAISS 인덱스 (IVF 는 enable_reconstruct 가 필요합니다)
+    :param vector: 질의 벡터 (dim,)
+    :param ids: 정렬된 후보 벡터 번호
+    :param k: 찾을 개수
+    :param brute_force_max: NumPy 로 직접 계산할 최대 후보 수
+    :return: (L2 제곱 거리, 벡터 번호) - 가까운 순서
+    """
+    query = np.asarray(vector, dtype=np.float32).reshape(1, -1)
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return np.empty(0, dtype=np.float32), ids
+
+    if len(ids) <= brute_force_max:
+        candidates = index.reconstruct_batch(ids)
+        distances = ((candidates - query) ** 2).sum(axis=1)
+        if len(ids) > k:
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(distances[top], kind="stable")]
+        return distances[top], ids[top]
+
+    selector = faiss.IDSelectorBatch(ids)
+    ivf = faiss.try_extract_index_ivf(index)
+    hnsw = faiss.downcast_index(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nlist)
+    elif hasattr(hnsw, "hnsw"):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=max(hnsw.hnsw.efSearch, k))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    distances, found = index.search(query, k, params=params)
+    keep = found[0] >= 0
+    return distances[0][keep], found[0][keep]
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+from langchain_community.vectorstores import Chroma, FAISS
+from langchain_core.embeddings import Embeddings
+
+import tracing
+from index_store import IndexStore
+from pipeline import LoadedChat
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    def __init__(self, chat: LoadedChat, nbytes: int):
+        self.chat = chat
+        self.nbytes = nbytes
+        # 사용 중인 질문 수 (0 보다 크면 내보내지 않습니다)
+        self.pins = 0
+        self.last_used = time.monotonic()
+
+
+class IndexManager:
+    """
+    프로세스 전체에서 불러온 대화 인덱스(LoadedChat)를 관리합니다.
+
+    - 같은 파일을 올린 세션은 같은 인덱스를 공유합니다 (대화 파일 해시 기준).
+    - 불러온 인덱스의 크기 합이 max_bytes 를 넘으면 가장 오래 사용하지 않은 인덱스부터 메모리에서 내보냅니다.
+      인덱스는 IndexStore 에 이미 저장되어 있으므로 디스크에 다시 쓰지 않고, 다음 질문에서 다시 불러옵니다.
+    - 세션은 인덱스 대신 대화 파일 해시만 보관하고, 질문할 때마다 use 로 인덱스를 빌려 씁니다.
+    """
+
+    def __init__(self, index_store: IndexStore, max_bytes: int = 2 << 30):
+        """
+        :param index_store: 인덱스 저장소
+        :param max_bytes: 메모리에 유지할 인덱스 크기의 합 (사용 중인 인덱스는 넘더라도 내보내지 않습니다)
+        """
+        self.index_store = index_store
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # 인덱스를 불러오는 동안만 유지되는 키별 잠금 (불러오기가 끝나 참조가 사라지면 자동으로 삭제됩니다)
+        self._load_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        # 같은 파일을 동시에 인덱싱하지 않도록 하는 키별 잠금 (index_lock 참고)
+        self._index_locks: "weakref.WeakValueDictionary[str, threading.Lock]" = weakref.WeakValueDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+
+    @property
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(entry.nbytes for entry in self._entries.values())
+
+    def index_lock(self, key: str) -> threading.Lock:
+        """
+        대화 파일을 인덱싱하는 동안 잡는 키별 잠금을 반환합니다. 같은 파일을 동시에 올린 세션이 각자
+        IndexStore.create 로 서로의 인덱스 디렉토리를 지우지 않도록, 인덱스가 있는지 확인하는 것부터
+        인덱싱이 끝날 때까지 잠금을 잡습니다. 잠금은 참조하는 세션이 없으면 자동으로 삭제됩니다.
+
+        :param key: 대화 파일의 해시
+        :return: 키별 잠금
+        """
+        with self._lock:
+            index_lock = self._index_locks.get(key)
+            if index_lock is None:
+                index_lock = self._index_locks[key] = threading.Lock()
+            return index_lock
+
+    def add(self, key: str, faiss: FAISS, chroma: Chroma) -> LoadedChat:
+        """
+        방금 인덱싱한(또는 이미 불러온) 벡터스토어를 등록합니다. 같은 키가 이미 있으면 기존 인덱스를 반환합니다.
+
+        :param key: 대화 파일의 해시
+        :param faiss: FAISS 벡터스토어
+        :param chroma: Chroma 벡터스토어
+        :return: 공유 인덱스
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry.chat
+        chat = LoadedChat(self.index_store, key, faiss, chroma)
+        entry = _Entry(chat, self._resident_bytes(key, chat))
+        with self._lock:
+            entry = self._entries.setdefault(key, entry)
+            self._entries.move_to_end(key)
+            self._evict()
+        return entry.chat
+
+    @contextmanager
+    def use(self, key: str, embeddings: Dict[str, Embeddings]) -> Iterator[LoadedChat]:
+        """
+        인덱스를 빌려 씁니다. with 블록 안에서는 메모리에서 내보내지 않으며, 내보낸 인덱스는 다시 불러옵니다.
+
+        :param key: 대화 파일의 해시
+        :param embeddings: 인덱스를 불러올 때 사용할 {"faiss": 임베딩, "chroma": 임베딩}
+        :return: 공유 인덱스
+        :raises KeyError: 저장된 인덱스가 없는 경우
+        """
+        entry = self._acquire(key, embeddings)
+        try:
+            yield entry.chat
+        finally:
+            self._release(entry)
+
+    @asynccontextmanager
+    async def ause(self, key: str, embeddings: Dict[str, Embeddings]) -> AsyncIterator[LoadedChat]:
+        """
+        use 의 비동기 버전입니다. 인덱스를 디스크에서 불러오는 동안 이벤트 루프를 막지 않도록 스레드에서 실행합니다.
+
+        :param key: 대화 파일의 해시
+        :param embeddings: 인덱스를 불러올 때 사용할 {"faiss": 임베딩, "chroma": 임베딩}
+        :return: 공유 인덱스
+        :raises KeyError: 저장된 인덱스가 없는 경우
+        """
+        acquire = asyncio.ensure_future(asyncio.to_thread(self._acquire, key, embeddings))
+        try:
+            entry = await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # 불러오는 중에 요청이 취소되어도 스레드는 끝까지 실행되므로, 끝난 뒤 고정을 해제합니다.
+            acquire.add_done_callback(
+                lambda task: task.cancelled() or task.exception() or self._release(task.result())
+            )
+            raise
+        try:
+            yield entry.chat
+        finally:
+            # 취소된 요청의 finally 에서는 await 가 다시 취소될 수 있으므로 고정 해제는 바로 실행합니다.
+            self._release(entry)
+
+    def evict(self, key: str) -> bool:
+        """
+        인덱스를 메모리에서 내보냅니다. 사용 중이면 내보내지 않습니다.
+
+        :param key: 대화 파일의 해시
+        :return: 내보냈는지 여부
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.pins:
+                return False
+            self._remove(key)
+            return True
+
+    def stats(self) -> dict:
+        """
+        메모리에 있는 인덱스와 적중/불러오기/내보내기 횟수를 반환합니다.
+
+        :return: {"max_bytes", "resident_bytes", "hits", "loads", "evictions", "chats": [...]}
+        """
+        now = time.monotonic()
+        with self._lock:
+            chats = [
+                {
+                    "key": key,
+                    "bytes": entry.nbytes,
+                    "in_use": entry.pins,
+                    "idle_seconds": now - entry.last_used,
+                }
+                for key, entry in self._entries.items()
+            ]
+            return {
+                "max_bytes": self.max_bytes,
+                "resident_bytes": sum(chat["bytes"] for chat in chats),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "chats": chats,
+            }
+
+    def _acquire(self, key: str, embeddings: Dict[str, Embeddings]) -> _Entry:
+        with self._lock:
+            entry = self._pin(key)
+            if entry is not None:
+                self.hits += 1
+                tracing.count("index_manager_hits")
+                return entry
+            load_lock = self._load_locks.get(key)
+            if load_lock is None:
+                load_lock = self._load_locks[key] = threading.Lock()
+
+        # 같은 인덱스를 여러 세션이 동시에 요청해도 한 번만 불러옵니다.
+        with load_lock:
+            with self._lock:
+                entry = self._pin(key)
+                if entry is not None:
+                    return entry
+            if not self.index_store.exists(key):
+                raise KeyError(f"저장된 인덱스가 없습니다: {key}")
+            with tracing.span("index_manager.load"):
+                faiss, chroma = self.index_store.load(key, embeddings)
+                chat = LoadedChat(self.index_store, key, faiss, chroma)
+            entry = _Entry(chat, self._resident_bytes(key, chat))
+            with self._lock:
+                entry.pins += 1
+                self._entries[key] = entry
+                self.loads += 1
+                tracing.count("index_manager_loads")
+                self._evict()
+            return entry
+
+    def _release(self, entry: _Entry) -> None:
+        with self._lock:
+            entry.pins -= 1
+            entry.last_used = time.monotonic()
+            self._evict()
+
+    def _pin(self, key: str) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.pins += 1
+            entry.last_used = time.monotonic()
+            self._entries.move_to_end(key)
+        return entry
+
+    def _evict(self) -> None:
+        # 오래 사용하지 않은 순서(OrderedDict 앞쪽)부터, 사용 중이 아닌 인덱스를 내보냅니다.
+        # 가장 최근에 사용한 인덱스는 예산보다 크더라도 유지합니다.
+        total = sum(entry.nbytes for entry in self._entries.values())
+        for key in list(self._entries)[:-1]:
+            if total <= self.max_bytes:
+                return
+            entry = self._entries[key]
+            if entry.pins:
+                continue
+            total -= entry.nbytes
+            self._remove(key)
+        if total > self.max_bytes:
+            logger.warning("index memory %d bytes exceeds budget %d bytes", total, self.max_bytes)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.index_store.release(entry.chat.chroma)
+        self.evictions += 1
+        tracing.count("index_manager_evictions")
+
+    def _resident_bytes(self, key: str, chat: LoadedChat) -> int:
+        # FAISS 인덱스 파일과 Chroma 컬렉션은 검색할 때 메모리에 올라오므로 디스크 크기로 추정합니다.
+        path = self.index_store.path(key)
+        return chat.nbytes + _disk_bytes(os.path.join(path, "faiss", "index.faiss")) + _disk_bytes(
+            os.path.join(path, "chroma")
+        )
+
+
+def _disk_bytes(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(directory, name))
+        for directory, _, names in os.walk(path)
+        for name in names
+    )
+
+
+# 프로세스 전체에서 공유하는 인덱스 관리자
+_index_manager: Optional[IndexManager] = None
+_index_manager_lock = threading.Lock()
+
+
+def get_index_manager(**kwargs) -> IndexManager:
+    """
+    프로세스 전체에서 공유하는 IndexManager 를 반환합니다. 처음 호출할 때만 kwargs 를 사용하며,
+    max_bytes 를 주지 않으면 KAKAOTALK_GPT_INDEX_MEMORY_MB 환경변수(기본값 2048)를 사용합니다.
+
+    :param kwargs: IndexManager 생성 시 전달할 매개변수 (index_store, max_bytes)
+    :return: 공유 인덱스 관리자
+    """
+    global _index_manager
+    with _index_manager_lock:
+        if _index_manager is None:
+            kwargs.setdefault("index_store", IndexStore())
+            kwargs.setdefault("max_bytes", int(os.environ.get("KAKAOTALK_GPT_INDEX_MEMORY_MB", 2048)) << 20)
+            _index_manager = IndexManager(**kwargs)
+        return _index_manager
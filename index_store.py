@@ -0,0 +1,403 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import uuid
+from datetime import datetime
+from itertools import chain, islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import chromadb
+from chromadb.api.client import SharedSystemClient
+import faiss as faiss_lib
+import numpy as np
+from langchain_community.vectorstores import Chroma, FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import tracing
+from embeddings import EmbeddingPipeline
+from faiss_index import build_index, describe_index
+from kakaotalk_loader import FINGERPRINT_MESSAGES
+from message_store import MessageDocstore, MessageStore, PositionIds
+
+# NOTE - 청크 구성이나 인덱스 포맷이 바뀌면 값을 올려서 이전 인덱스를 무효화합니다.
+INDEX_VERSION = "2"
+CHROMA_COLLECTION_NAME = "kakaotalk"
+
+
+def file_fingerprint(data: Union[bytes, memoryview], file_suffix: str) -> str:
+    """
+    업로드된 대화 파일의 내용 해시를 계산합니다. 같은 파일은 항상 같은 값을 가집니다.
+
+    :param data: 파일 내용 (업로드 버퍼의 memoryview 도 복사 없이 사용할 수 있습니다)
+    :param file_suffix: 파일 확장자 ('.txt' 또는 '.csv')
+    :return: 16진수 해시 문자열
+    """
+    digest = hashlib.sha256(f"{INDEX_VERSION}\0{file_suffix}\0".encode("utf-8"))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+def message_digest(document: Document) -> str:
+    """
+    메시지 하나의 해시를 계산합니다. 새 내보내기 파일이 이전 파일의 연장인지 확인할 때 사용합니다.
+
+    :param document: 메시지 단위 Document
+    :return: 16진수 해시 문자열
+    """
+    return hashlib.sha256(
+        f'{document.metadata["row"]}\0{document.metadata["date"]}\0{document.page_content}'.encode("utf-8")
+    ).hexdigest()
+
+
+def stored_documents(faiss: FAISS) -> List[Document]:
+    """
+    FAISS 벡터스토어에 저장된 Document 를 색인 순서대로 반환합니다.
+    저장된 인덱스를 불러온 경우에도 BM25 등 문서 목록이 필요한 검색기를 만들 수 있습니다.
+
+    :param faiss: FAISS 벡터스토어
+    :return: Document 목록
+    """
+    return [
+        faiss.docstore.search(faiss.index_to_docstore_id[i])
+        for i in range(len(faiss.index_to_docstore_id))
+    ]
+
+
+def stored_messages(faiss: FAISS) -> MessageStore:
+    """
+    FAISS 벡터스토어의 문서 저장소를 MessageStore 로 반환합니다. 이전 형식(InMemoryDocstore)의 인덱스는
+    저장된 Document 로 새 MessageStore 를 만듭니다.
+
+    :param faiss: FAISS 벡터스토어
+    :return: 색인 순서대로 저장된 MessageStore
+    """
+    if isinstance(faiss.docstore, MessageDocstore):
+        return faiss.docstore.store
+    return MessageStore.from_documents(stored_documents(faiss))
+
+
+class _Extension(Exception):
+    """새 내보내기 파일이 이전 파일의 연장임을 확인했을 때 전체 인덱싱을 중단하기 위해 사용합니다."""
+
+
+def _until_extension(messages: Iterable[Document], manifest: dict) -> Iterator[Document]:
+    """
+    이전에 인덱싱한 마지막 메시지까지 메시지를 그대로 전달하다가, 같은 행의 메시지가 이전 파일과 같으면
+    _Extension 을 발생시킵니다. 연장이 아니면 끝까지 전달하므로 같은 파싱 결과로 전체 인덱싱을 이어갈 수 있습니다.
+
+    :param messages: 새 내보내기 파일의 메시지 단위 Document (행 순서)
+    :param manifest: 이전 인덱스의 manifest
+    """
+    last_row = manifest["last_row"]
+    for message in messages:
+        # 같은 행의 메시지가 다르면 이전 파일과 다른 대화이므로 증분 인덱싱을 하지 않습니다.
+        if message.metadata["row"] == last_row and message_digest(message) == manifest["last_message"]:
+            raise _Extension()
+        yield message
+
+
+class IndexStore:
+    """
+    대화 파일별 FAISS/Chroma 인덱스를 로컬 디렉토리에 저장하고 다시 불러오는 저장소입니다.
+
+    <root>/<key>/faiss/ 에 FAISS 인덱스를, <root>/<key>/chroma/ 에 Chroma 컬렉션을 저장하며,
+    인덱싱이 끝난 뒤 manifest.json 을 기록하여 완성된 인덱스임을 표시합니다.
+    """
+
+    def __init__(self, root: str = "./index/", faiss_index_type: str = "auto"):
+        """
+        :param root: 인덱스를 저장할 디렉토리
+        :param faiss_index_type: 새로 만들 FAISS 인덱스 종류 (faiss_index.INDEX_TYPES 의 키).
+                                 "auto" 이면 문서 수에 따라 flat / IVF 인덱스를 고릅니다.
+        """
+        self.root = root
+        self.faiss_index_type = faiss_index_type
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self.path(key), "manifest.json"))
+
+    def manifest(self, key: str) -> dict:
+        with open(os.path.join(self.path(key), "manifest.json"), encoding="utf8") as f:
+            return json.load(f)
+
+    def find_chat(self, chat_fingerprint: str) -> Optional[str]:
+        """
+        같은 대화방으로 가장 최근에 만든 인덱스의 키를 찾습니다.
+
+        :param chat_fingerprint: KaKaoTalkLoader.chat_fingerprint() 값
+        :return: 인덱스 키 (없으면 None)
+        """
+        path = os.path.join(self.root, "chats", f"{chat_fingerprint}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf8") as f:
+            key = json.load(f)["key"]
+        return key if self.exists(key) else None
+
+    def index_chat(
+        self,
+        key: str,
+        loader,
+        chunker,
+        embeddings: Dict[str, Embeddings],
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        **manifest,
+    ) -> Tuple[FAISS, Chroma]:
+        """
+        대화 파일을 인덱싱합니다. 같은 대화방의 이전 인덱스가 있고 새 파일이 이전 파일의 연장이면,
+        이전 인덱스를 복사한 뒤 새로 추가된 메시지만 임베딩하여 덧붙입니다.
+
+        :param key: 대화 파일의 해시
+        :param loader: KaKaoTalkLoader 인스턴스
+        :param chunker: ConversationChunker 인스턴스
+        :param embeddings: embedding_factory 가 반환한 {"faiss": ..., "chroma": ...} 딕셔너리
+        :param on_progress: 임베딩 진행 상황 콜백 (EmbeddingPipeline.embed 참고)
+        :param manifest: manifest.json 에 함께 기록할 추가 정보
+        :return: (FAISS, Chroma) 벡터스토어
+        """
+        # 파일은 한 번만 파싱합니다. 앞부분 메시지로 대화방 지문을 계산하고, 같은 메시지 흐름으로
+        # 이전 인덱스의 연장인지 확인하면서 전체 인덱싱용 청크를 만듭니다.
+        last = {}
+        messages = _track_last(loader.lazy_load(), last)
+        head = list(islice(messages, FINGERPRINT_MESSAGES))
+        chat_fingerprint = loader.chat_fingerprint(head)
+        messages = chain(head, messages)
+        base_key = self.find_chat(chat_fingerprint)
+        tail = None
+        try:
+            if base_key is not None:
+                base_manifest = self.manifest(base_key)
+                messages_to_index = _until_extension(messages, base_manifest)
+            else:
+                messages_to_index = messages
+            # 청크 Document 는 만들어지는 대로 열 단위 저장소로 옮기고 보관하지 않습니다.
+            documents = MessageStore.from_documents(chunker.lazy_split_documents(messages_to_index))
+        except _Extension:
+            # 이전 인덱스의 마지막 메시지 이후에 추가된 메시지만 인덱싱합니다.
+            tail = list(messages)
+
+        if tail is None:
+            faiss, chroma = self.create(key, documents, embeddings, on_progress, **manifest)
+            manifest["documents"] = len(documents)
+            manifest["users"] = _users(documents)
+            last_message = last.get("message")
+        else:
+            documents = chunker.split_documents(tail)
+            faiss, chroma = self.extend(base_key, key, documents, embeddings, on_progress)
+            last_message = tail[-1] if tail else None
+            manifest = {
+                **{k: v for k, v in base_manifest.items() if k not in ("key", "version", "updated")},
+                **manifest,
+                "documents": base_manifest["documents"] + len(documents),
+                "users": _users(documents, base_manifest.get("users", [])),
+                "base_key": base_key,
+            }
+
+        manifest["faiss_index"] = describe_index(faiss.index)
+        if last_message is not None:
+            manifest["last_row"] = last_message.metadata["row"]
+            manifest["last_message"] = message_digest(last_message)
+        manifest["chat_fingerprint"] = chat_fingerprint
+        self.write_manifest(key, **manifest)
+
+        os.makedirs(os.path.join(self.root, "chats"), exist_ok=True)
+        with open(os.path.join(self.root, "chats", f"{chat_fingerprint}.json"), "w", encoding="utf8") as f:
+            json.dump({"key": key}, f)
+        return faiss, chroma
+
+    def extend(
+        self,
+        base_key: str,
+        key: str,
+        documents: List[Document],
+        embeddings: Dict[str, Embeddings],
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> Tuple[FAISS, Chroma]:
+        """
+        이전 인덱스를 새 키로 복사한 뒤 문서를 덧붙입니다. 이전 인덱스는 그대로 남습니다.
+
+        :param base_key: 이전 인덱스의 키
+        :param key: 새 인덱스의 키
+        :param documents: 덧붙일 Document 목록
+        :param embeddings: embedding_factory 가 반환한 {"faiss": ..., "chroma": ...} 딕셔너리
+        :param on_progress: 임베딩 진행 상황 콜백 (EmbeddingPipeline.embed 참고)
+        :return: (FAISS, Chroma) 벡터스토어
+        """
+        path = self.path(key)
+        shutil.rmtree(path, ignore_errors=True)
+        shutil.copytree(
+            self.path(base_key), path, ignore=shutil.ignore_patterns("manifest.json")
+        )
+
+        faiss, chroma = self.load(key, embeddings, mmap=False)
+        if documents:
+            store = MessageStore.from_documents(documents)
+            texts, vectors = self._embed(store, embeddings, on_progress)
+            # MessageDocstore 와 PositionIds 는 add_embeddings 로 추가한 순서대로 행 번호를 부여합니다.
+            faiss.add_embeddings(list(zip(texts, vectors)), [store.metadata(i) for i in range(len(store))])
+            faiss.save_local(os.path.join(path, "faiss"))
+            self._add_to_chroma(chroma, store, texts, vectors)
+        return faiss, chroma
+
+    def create(
+        self,
+        key: str,
+        documents: Union[Iterable[Document], MessageStore],
+        embeddings: Dict[str, Embeddings],
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        **manifest,
+    ) -> Tuple[FAISS, Chroma]:
+        """
+        문서를 임베딩하여 FAISS/Chroma 인덱스를 만들고 디스크에 저장합니다.
+
+        :param key: 대화 파일의 해시
+        :param documents: 인덱싱할 Document 목록 또는 MessageStore
+        :param embeddings: embedding_factory 가 반환한 {"faiss": ..., "chroma": ...} 딕셔너리
+        :param on_progress: 임베딩 진행 상황 콜백 (EmbeddingPipeline.embed 참고)
+        :param manifest: manifest.json 에 함께 기록할 추가 정보
+        :return: (FAISS, Chroma) 벡터스토어
+        """
+        path = self.path(key)
+        # 이전에 중단된 인덱싱이 남아 있다면 지우고 새로 만듭니다.
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+        if not isinstance(documents, MessageStore):
+            documents = MessageStore.from_documents(documents)
+
+        # 한 번 임베딩한 벡터로 FAISS 와 Chroma 를 모두 채웁니다.
+        texts, vectors = self._embed(documents, embeddings, on_progress)
+        with tracing.span("index.faiss", items=len(texts)):
+            # 문서 수에 맞는 인덱스(작으면 flat, 크면 IVF 압축 인덱스)를 만들고, Document 대신 MessageStore 를
+            # docstore 로 사용하여 벡터 번호를 그대로 행 번호로 사용합니다.
+            index = build_index(np.asarray(vectors, dtype=np.float32), self.faiss_index_type)
+            faiss = FAISS(embeddings["faiss"], index, MessageDocstore(documents), PositionIds(len(documents)))
+            faiss.save_local(os.path.join(path, "faiss"))
+        chroma = Chroma(
+            embedding_function=embeddings["chroma"],
+            **self._chroma_kwargs(path),
+        )
+        self._add_to_chroma(chroma, documents, texts, vectors)
+
+        self.write_manifest(key, documents=len(documents), faiss_index=describe_index(index), **manifest)
+        return faiss, chroma
+
+    def load(
+        self, key: str, embeddings: Dict[str, Embeddings], mmap: bool = True
+    ) -> Tuple[FAISS, Chroma]:
+        """
+        저장된 FAISS/Chroma 인덱스를 불러옵니다.
+
+        :param key: 대화 파일의 해시
+        :param embeddings: embedding_factory 가 반환한 {"faiss": ..., "chroma": ...} 딕셔너리
+        :param mmap: True 이면 FAISS 인덱스를 메모리 맵으로 읽습니다 (읽기 전용)
+        :return: (FAISS, Chroma) 벡터스토어
+        """
+        path = self.path(key)
+        faiss_path = os.path.join(path, "faiss")
+
+        with tracing.span("index.load", mmap=mmap) as span:
+            # FAISS.load_local 과 같지만, 인덱스 파일을 메모리 맵으로 읽을 수 있도록 직접 불러옵니다.
+            io_flags = faiss_lib.IO_FLAG_MMAP | faiss_lib.IO_FLAG_READ_ONLY if mmap else 0
+            index = faiss_lib.read_index(os.path.join(faiss_path, "index.faiss"), io_flags)
+            # 직접 생성한 파일만 읽으므로 pickle 역직렬화가 안전합니다.
+            with open(os.path.join(faiss_path, "index.pkl"), "rb") as f:
+                docstore, index_to_docstore_id = pickle.load(f)
+            faiss = FAISS(embeddings["faiss"], index, docstore, index_to_docstore_id)
+            span.set(items=index.ntotal)
+
+        chroma = Chroma(
+            embedding_function=embeddings["chroma"],
+            **self._chroma_kwargs(path),
+        )
+        return faiss, chroma
+
+    def write_manifest(self, key: str, **manifest) -> None:
+        manifest = {
+            "key": key,
+            "version": INDEX_VERSION,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            **manifest,
+        }
+        path = os.path.join(self.path(key), "manifest.json")
+        with open(path + ".tmp", "w", encoding="utf8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _embed(
+        store: MessageStore,
+        embeddings: Dict[str, Embeddings],
+        on_progress: Optional[Callable[[int, int], None]],
+    ) -> Tuple[List[str], List[List[float]]]:
+        texts = list(store.texts())
+        vectors = EmbeddingPipeline(embeddings["faiss"]).embed(texts, on_progress)
+        return texts, vectors
+
+    @staticmethod
+    def _add_to_chroma(
+        chroma: Chroma, store: MessageStore, texts: List[str], vectors: List[List[float]]
+    ) -> None:
+        # Chroma.add_texts 는 다시 임베딩하므로, 계산해 둔 벡터를 컬렉션에 직접 추가합니다.
+        # 메타데이터 dict 는 배치 단위로만 만듭니다.
+        batch_size = chroma._client.max_batch_size
+        with tracing.span("index.chroma", items=len(texts)):
+            for start in range(0, len(texts), batch_size):
+                end = min(start + batch_size, len(texts))
+                chroma._collection.upsert(
+                    ids=[str(uuid.uuid4()) for _ in range(start, end)],
+                    embeddings=vectors[start:end],
+                    metadatas=[store.metadata(i) for i in range(start, end)],
+                    documents=texts[start:end],
+                )
+
+    @staticmethod
+    def release(chroma: Chroma) -> None:
+        """
+        Chroma 가 경로별로 캐시해 두는 클라이언트 시스템(HNSW 인덱스, SQLite 연결)을 닫습니다.
+        닫은 뒤에는 같은 경로를 다시 load 해야 합니다.
+
+        :param chroma: load/create 로 만든 Chroma 벡터스토어
+        """
+        # NOTE - chromadb 는 persist_directory 별로 System 을 프로세스 전역에 보관하므로,
+        #        Chroma 객체를 버리는 것만으로는 메모리가 해제되지 않습니다.
+        client = chroma._client
+        system = SharedSystemClient._identifer_to_system.pop(client._identifier, None)
+        if system is not None:
+            system.stop()
+
+    @staticmethod
+    def _chroma_kwargs(path: str) -> dict:
+        return {
+            "collection_name": CHROMA_COLLECTION_NAME,
+            "persist_directory": os.path.join(path, "chroma"),
+            "client_settings": chromadb.config.Settings(
+                is_persistent=True, anonymized_telemetry=False
+            ),
+        }
+
+
+def _track_last(messages: Iterable[Document], last: dict) -> Iterator[Document]:
+    # 스트리밍 중인 메시지 중 마지막 메시지를 last["message"] 에 기록합니다.
+    for message in messages:
+        last["message"] = message
+        yield message
+
+
+def _users(documents: Union[Iterable[Document], MessageStore], users: Iterable[str] = ()) -> List[str]:
+    # 청크 메타데이터의 참여 사용자 목록을 모아 정렬된 목록으로 반환합니다.
+    found = set(users)
+    if isinstance(documents, MessageStore):
+        # 저장소는 서로 다른 값을 한 번씩만 보관하므로 Document 를 만들지 않고 값 목록만 확인합니다.
+        values = documents.categories("users" if "users" in documents.columns else "user")
+    else:
+        values = (document.metadata.get("users", document.metadata["user"]) for document in documents)
+    for value in values:
+        found.update(value.split(", "))
+    return sorted(found)
@@ -1,23 +1,22 @@
+import logging
 import os
+import time
 import streamlit as st
 from langchain_core.messages import ChatMessage
-from langchain_openai import ChatOpenAI
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import (
-    RunnableLambda,
-    RunnablePassthrough,
-    ConfigurableField,
-)
-from langchain_community.document_transformers import LongContextReorder
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma, FAISS
-import kakaotalk_loader as kakao
-import prompt as prmpt
+from index_store import file_fingerprint
+from index_manager import get_index_manager
+from answer_cache import get_answer_cache, replay_answer
 import embeddings
-import retriever
-import tempfile
-from utils import print_messages, StreamHandler
-from pathlib import Path
+import pipeline
+import tracing
+from embeddings import _tiktoken_counter
+from reranker import MMRReranker
+from utils import print_messages, print_counters, print_index_stats, print_trace, StreamHandler
+
+# KAKAOTALK_GPT_TRACE_LOG=1 이면 단계별 측정 기록을 JSON 로그로 출력합니다.
+if os.environ.get("KAKAOTALK_GPT_TRACE_LOG"):
+    logging.basicConfig(format="%(message)s")
+    tracing.logger.setLevel(logging.INFO)
 
 st.set_page_config(page_title="카톡GPT", page_icon="💬")
 st.title("카톡GPT💬")
@@ -46,75 +45,75 @@ with st.sidebar:
             st.info("OpenAI API Key를 입력해 주세요.")
         else:
             st.session_state["kakaotalk_file"] = kakaotalk_file
+    st.checkbox("⏱️ 단계별 소요 시간 보기", key="show_metrics")
 
-if "kakaotalk_file" in st.session_state and "retriever" not in st.session_state:
+if "kakaotalk_file" in st.session_state and "chat_ready" not in st.session_state:
     with st.sidebar:
         with st.status("파일을 처리 중입니다 🧑‍💻👩‍💻", expanded=True) as status:
             
-            # NOTE : choh(2024.04.05) - 윈도우 권한 에러 해결
-            FLAG_DELETE = True
-            if os.name == 'nt':
-                FLAG_DELETE = False
-                
-            with tempfile.NamedTemporaryFile(delete=FLAG_DELETE) as f:
-                f.write(st.session_state["kakaotalk_file"].read())
-                f.flush()
-                
-                # 카카오톡 로더
-                # loader = kakao.KaKaoTalkLoader(f.name, encoding="utf8")
-                
-                # NOTE : choh(2024.04.05) - 파일의 확장자를 loader에 전달 할 수 있도록 수정
-                # 직접 전달하지 않으면, hash된 파일명으로 전달되서 확장자가 없어짐
-                _, file_suffix = os.path.splitext(st.session_state["kakaotalk_file"].name)
-                loader = kakao.KaKaoTalkLoader(f.name, file_suffix, encoding="utf8")
-
-                text_splitter = RecursiveCharacterTextSplitter(
-                    chunk_size=500, chunk_overlap=0
-                )
-                documents = loader.load_and_split(text_splitter=text_splitter)
-                st.write("① 임베딩 생성")
-                status.update(label="① 임베딩을 생성 중..🔥", state="running")
-                # Embedding 생성
-                embeddings = embeddings.embedding_factory(
-                    api_key=st.session_state["OPENAI_API_KEY"]
-                )
-
-                st.write("② DB 인덱싱")
-                status.update(label="② DB 인덱싱 생성 중..🔥", state="running")
-                # VectorStore 생성
-                faiss = FAISS.from_documents(documents, embeddings["faiss"])
-                chroma = Chroma.from_documents(documents, embeddings["chroma"])
-
-                st.write("③ Retriever 생성")
-                status.update(label="③ Retriever 생성 중..🔥", state="running")
-                # FAISSRetriever 생성
-                faiss_retriever = retriever.FAISSRetrieverFactory(faiss).create(
-                    search_kwargs={"k": 30},
-                )
-
-                # SelfQueryRetriever 생성
-                self_query_retriever = retriever.SelfQueryRetrieverFactory(
-                    chroma
-                ).create(
-                    model="gpt-4-turbo-preview",
-                    temperature=0,
-                    api_key=st.session_state["OPENAI_API_KEY"],
-                    search_kwargs={"k": 30},
-                )
-
-                # 앙상블 retriever를 초기화합니다.
-                ensemble_retriever = retriever.EnsembleRetrieverFactory(None).create(
-                    retrievers=[faiss_retriever, self_query_retriever],
-                    weights=[0.4, 0.6],
-                )
-                reordering = LongContextReorder()
-
-                combined_retriever = ensemble_retriever | RunnableLambda(
-                    reordering.transform_documents
-                )
-                st.session_state["retriever"] = combined_retriever
-                st.write("완료 ✅")
-                status.update(label="완료 ✅", state="complete", expanded=False)
+            kakaotalk_file = st.session_state["kakaotalk_file"]
+            # NOTE : choh(2024.04.05) - 파일의 확장자를 loader에 전달 할 수 있도록 수정
+            # 직접 전달하지 않으면, hash된 파일명으로 전달되서 확장자가 없어짐
+            _, file_suffix = os.path.splitext(kakaotalk_file.name)
+
+            # 파일 내용 해시로 이전에 만들어 둔 인덱스가 있는지 확인
+            # 불러온 인덱스는 프로세스 전체에서 공유하며, 같은 파일을 올린 세션끼리 재사용합니다.
+            index_manager = get_index_manager()
+            index_store = index_manager.index_store
+            # getvalue() 는 업로드 전체를 복사하므로 버퍼를 그대로 해시합니다.
+            with kakaotalk_file.getbuffer() as buffer:
+                chat_key = file_fingerprint(buffer, file_suffix)
+            st.session_state["chat_key"] = chat_key
+
+            # Embedding 생성
+            embeddings = embeddings.embedding_factory(
+                api_key=st.session_state["OPENAI_API_KEY"]
+            )
+            # 답변 캐시 조회 시 질문 임베딩에 사용
+            st.session_state["embeddings"] = embeddings
+
+            # 같은 파일을 올린 다른 세션이 인덱싱 중이면 끝날 때까지 기다렸다가 저장된 인덱스를 사용합니다.
+            with index_manager.index_lock(chat_key):
+                indexed = index_store.exists(chat_key)
+                if indexed:
+                    st.write("①② 저장된 인덱스 불러오기")
+                    status.update(label="①② 저장된 인덱스를 불러오는 중..🔥", state="running")
+                    on_progress = None
+                else:
+                    st.write("① 임베딩 생성")
+                    status.update(label="① 임베딩을 생성 중..🔥", state="running")
+
+                    st.write("② DB 인덱싱")
+                    status.update(label="② DB 인덱싱 생성 중..🔥", state="running")
+                    progress_bar = st.progress(0.0)
+
+                    def on_progress(done, total):
+                        progress_bar.progress(done / total, text=f"{done:,} / {total:,}")
+
+                with tracing.trace() as index_trace:
+                    if indexed:
+                        # 다른 세션이 이미 불러온 인덱스가 있으면 그대로 공유하고, 없으면 불러옵니다.
+                        with index_manager.use(chat_key, embeddings):
+                            pass
+                    else:
+                        faiss, chroma = pipeline.load_or_index(
+                            index_store,
+                            chat_key,
+                            kakaotalk_file,
+                            kakaotalk_file.name,
+                            embeddings,
+                            on_progress=on_progress,
+                        )
+                        st.write("③ Retriever 생성")
+                        status.update(label="③ Retriever 생성 중..🔥", state="running")
+                        index_manager.add(chat_key, faiss, chroma)
+                st.session_state["index_trace"] = index_trace
+
+            # 세션에는 인덱스 대신 대화 파일 해시만 보관합니다. 메모리 예산을 넘으면 오래 사용하지 않은
+            # 인덱스부터 내보내고, 다음 질문에서 다시 불러옵니다.
+            st.session_state["chat_ready"] = True
+            st.write("완료 ✅")
+            status.update(label="완료 ✅", state="complete", expanded=False)
         st.markdown(f'💬 `{st.session_state["kakaotalk_file"].name}`')
         st.markdown(
             "🔔참고\n\n**새로운 카톡 파일** 로 대화를 시작하려면, `새로고침` 후 진행해 주세요"
@@ -128,7 +127,7 @@ print_messages()
 if user_input := st.chat_input("메시지를 입력해 주세요."):
     if "OPENAI_API_KEY" not in st.session_state:
         st.info("OpenAI API Key를 입력해 주세요.")
-    elif "retriever" not in st.session_state:
+    elif "chat_ready" not in st.session_state:
         st.info("KakaoTalk CSV 파일을 업로드해 주세요.")
     else:
         # 사용자가 입력한 내용
@@ -137,41 +136,54 @@ if user_input := st.chat_input("메시지를 입력해 주세요."):
             ChatMessage(role="user", content=user_input)
         )
 
-        # AI의 답변
-        with st.chat_message("assistant"):
-            stream_handler = StreamHandler(st.empty())
-
-            llm = ChatOpenAI(
-                model_name="gpt-4-turbo-preview",
-                temperature=0,
-                streaming=True,
-                callbacks=[stream_handler],
-                api_key=st.session_state["OPENAI_API_KEY"],
-            ).configurable_alternatives(
-                ConfigurableField(id="llm"),
-                default_key="gpt4",
-                gpt3=ChatOpenAI(
-                    model="gpt-3-turbo",
-                    temperature=0,
-                    streaming=True,
-                    callbacks=[stream_handler],
-                    api_key=st.session_state["OPENAI_API_KEY"],
-                ),
-            )
+        # 질문 하나의 단계별 소요 시간을 모아서 사이드바에 보여줍니다.
+        with tracing.trace() as spans:
+            start = time.perf_counter()
+
+            # 같은 대화 파일에 대해 비슷한 질문의 답변이 있으면 LLM 호출 없이 재사용합니다.
+            answer_cache = get_answer_cache()
+            chat_key = st.session_state["chat_key"]
+            with tracing.span("answer_cache.lookup"):
+                question_vector = st.session_state["embeddings"]["faiss"].embed_query(user_input)
+                cached_answer = answer_cache.lookup(chat_key, question_vector)
+
+            # AI의 답변
+            with st.chat_message("assistant"):
+                stream_handler = StreamHandler(st.empty())
+
+                if cached_answer is not None:
+                    replay_answer(cached_answer, stream_handler)
+                    response = cached_answer
+                else:
+                    # 질문하는 동안에는 인덱스를 메모리에서 내보내지 않습니다. 검색기는 API 키별로 인덱스에 캐시되므로
+                    # 체인은 질문마다 가볍게 만들고, 스트리밍 콜백만 요청마다 config 로 전달합니다.
+                    with get_index_manager().use(chat_key, st.session_state["embeddings"]) as chat:
+                        chain = pipeline.build_chain(
+                            chat.retriever(st.session_state["embeddings"], st.session_state["OPENAI_API_KEY"]),
+                            st.session_state["OPENAI_API_KEY"],
+                            # 거의 같은 대화 청크는 걸러내고 서로 다른 청크를 context 에 넣습니다.
+                            reranker=MMRReranker(st.session_state["embeddings"]["faiss"]),
+                            # '이번 달 대화 요약해줘' 같은 질문은 미리 만든 기간별 요약으로 답합니다.
+                            summary_router=chat.summary_router(),
+                        )
+                        response = chain.invoke(
+                            user_input,
+                            config={"callbacks": [stream_handler]},
+                        )
+                    answer_cache.store(chat_key, question_vector, response)
+                    tracing.count("llm_completion_tokens", _tiktoken_counter()(response))
+                st.session_state["messages"].append(
+                    ChatMessage(role="assistant", content=response)
+                )
 
-            chain = (
-                {
-                    "context": st.session_state["retriever"],
-                    "question": RunnablePassthrough(),
-                }
-                | prmpt.rag_prompt()
-                | llm
-                | StrOutputParser()
-            )
+            if stream_handler.first_token_time is not None:
+                tracing.observe("llm.first_token", stream_handler.first_token_time - start)
+            tracing.observe("answer", time.perf_counter() - start, cached=cached_answer is not None)
+        st.session_state["last_trace"] = spans
 
-            response = chain.invoke(
-                user_input,
-            )
-            st.session_state["messages"].append(
-                ChatMessage(role="assistant", content=response)
-            )
+if st.session_state.get("show_metrics"):
+    with st.sidebar:
+        print_trace(st.session_state.get("index_trace"), "파일 처리 단계별 소요 시간")
+        print_trace(st.session_state.get("last_trace"), "마지막 질문 단계별 소요 시간")
+        print_counters()
+        print_index_stats(get_index_manager().stats())
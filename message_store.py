@@ -0,0 +1,292 @@
+from collections.abc import Mapping
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+# datetime64 배열로 저장할 날짜 메타데이터 ("YYYY-MM-DD HH:MM:SS" 형식)
+DATE_COLUMNS = ("date", "date_end")
+
+
+def _compact_int(values: np.ndarray) -> np.ndarray:
+    # 값 범위에 맞는 가장 작은 정수 타입으로 변환합니다 (year/month/day 등은 1~2 byte 로 충분합니다).
+    if len(values) == 0:
+        return values.astype(np.int8)
+    low, high = values.min(), values.max()
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return values.astype(dtype)
+    return values.astype(np.int64)
+
+
+class _Column:
+    """
+    메타데이터 키 하나의 값을 담는 열입니다.
+
+    - int/float/bool: NumPy 배열
+    - date: datetime64[s] 배열 (원래 문자열로 정확히 되돌릴 수 있는 경우만)
+    - str: 중복을 제거한 문자열 목록(categories)과 각 행의 번호(codes)
+    """
+
+    def __init__(self, kind: str, values: np.ndarray, categories: Optional[List[str]] = None):
+        self.kind = kind
+        self.values = values
+        self.categories = categories
+        # 문자열 -> 번호 조회 테이블 (extend 할 때만 만들고, 저장하지 않습니다)
+        self._lookup: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def encode(cls, key: str, values: list) -> "_Column":
+        first = values[0]
+        if isinstance(first, str):
+            if not all(isinstance(value, str) for value in values):
+                raise ValueError(f"{key} 메타데이터에 문자열과 다른 타입이 섞여 있습니다.")
+            if key in DATE_COLUMNS:
+                try:
+                    dates = np.array(values, dtype="datetime64[s]")
+                except ValueError:
+                    dates = None
+                if dates is not None and (
+                    np.char.replace(np.datetime_as_string(dates), "T", " ") == np.array(values)
+                ).all():
+                    return cls("date", dates)
+            lookup: Dict[str, int] = {}
+            codes = np.fromiter(
+                (lookup.setdefault(value, len(lookup)) for value in values), dtype=np.int64, count=len(values)
+            )
+            return cls("str", _compact_int(codes), list(lookup))
+
+        array = np.asarray(values)
+        if isinstance(first, (bool, np.bool_)) and array.dtype.kind == "b":
+            return cls("bool", array)
+        if isinstance(first, (int, np.integer)) and array.dtype.kind in "iu":
+            return cls("int", _compact_int(array.astype(np.int64)))
+        if isinstance(first, (float, np.floating)) and array.dtype.kind in "iuf":
+            return cls("float", array.astype(np.float64))
+        raise ValueError(f"{key} 메타데이터는 저장할 수 없는 타입입니다: {type(first).__name__}")
+
+    def __getstate__(self) -> dict:
+        return {**self.__dict__, "_lookup": None}
+
+    @property
+    def nbytes(self) -> int:
+        return self.values.nbytes + sum(len(value.encode("utf-8")) for value in self.categories or ())
+
+    def value(self, i: int) -> Any:
+        if self.kind == "str":
+            return self.categories[self.values[i]]
+        if self.kind == "date":
+            return str(self.values[i]).replace("T", " ")
+        return self.values[i].item()
+
+    def to_list(self) -> list:
+        if self.kind == "str":
+            return [self.categories[code] for code in self.values.tolist()]
+        if self.kind == "date":
+            return np.char.replace(np.datetime_as_string(self.values), "T", " ").tolist()
+        return self.values.tolist()
+
+    def extend(self, key: str, other: "_Column") -> "_Column":
+        if self.kind != other.kind:
+            # 타입이 달라진 경우(예: 형식이 다른 날짜 문자열)에는 값을 합쳐서 다시 인코딩합니다.
+            return _Column.encode(key, self.to_list() + other.to_list())
+        if self.kind != "str":
+            values = np.concatenate([self.values, other.values])
+            return _Column(self.kind, _compact_int(values) if self.kind == "int" else values)
+
+        if self._lookup is None:
+            self._lookup = {value: code for code, value in enumerate(self.categories)}
+        mapping = np.empty(len(other.categories), dtype=np.int64)
+        for i, value in enumerate(other.categories):
+            code = self._lookup.get(value)
+            if code is None:
+                code = self._lookup[value] = len(self.categories)
+                self.categories.append(value)
+            mapping[i] = code
+        self.values = _compact_int(np.concatenate([self.values.astype(np.int64), mapping[other.values]]))
+        return self
+
+
+class MessageStore:
+    """
+    대화 청크(또는 메시지)를 Document 대신 열(column) 단위 배열로 보관하는 저장소입니다.
+
+    Document 하나마다 메타데이터 dict 와 문자열 객체를 만드는 대신, 본문은 하나의 UTF-8 버퍼와 offset 배열에,
+    숫자와 날짜는 NumPy 배열에, 사용자·source 등 반복되는 문자열은 한 번만 저장하고 번호로 참조합니다.
+    검색기는 행 번호(위치)로 결과를 찾고, Document 는 최종 검색 결과(top-k)에 대해서만 만듭니다.
+
+    모든 Document 의 메타데이터 키는 같아야 합니다.
+    """
+
+    def __init__(self):
+        self._text = bytearray()
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._columns: Dict[str, _Column] = {}
+
+    @classmethod
+    def from_documents(cls, documents: Iterable[Document], batch_size: int = 10000) -> "MessageStore":
+        """
+        Document 를 batch_size 개씩 읽어 저장소를 만듭니다. 입력이 iterator 이면 전체 Document 목록을
+        메모리에 유지하지 않습니다.
+
+        :param documents: 저장할 Document
+        :param batch_size: 한 번에 열로 변환할 Document 수
+        :return: MessageStore
+        """
+        store = cls()
+        iterator = iter(documents)
+        while True:
+            batch = list(islice(iterator, batch_size))
+            if not batch:
+                return store
+            store.extend(batch)
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._columns)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        본문 버퍼, offset, 메타데이터 열이 차지하는 byte 수입니다.
+        """
+        return len(self._text) + self._offsets.nbytes + sum(column.nbytes for column in self._columns.values())
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> Document:
+        return self.document(i)
+
+    def __iter__(self) -> Iterator[Document]:
+        return (self.document(i) for i in range(len(self)))
+
+    def extend(self, documents: Iterable[Document]) -> None:
+        """
+        Document 를 저장소 끝에 추가합니다.
+
+        :param documents: 추가할 Document
+        """
+        documents = list(documents)
+        if not documents:
+            return
+        keys = list(documents[0].metadata)
+        if self._columns and set(keys) != set(self._columns):
+            raise ValueError(f"메타데이터 키가 다릅니다: {sorted(keys)} != {sorted(self._columns)}")
+        values: Dict[str, list] = {key: [] for key in keys}
+        encoded = []
+        for document in documents:
+            if document.metadata.keys() != values.keys():
+                raise ValueError(f"메타데이터 키가 다릅니다: {sorted(document.metadata)} != {sorted(keys)}")
+            for key, value in document.metadata.items():
+                values[key].append(value)
+            encoded.append(document.page_content.encode("utf-8"))
+
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        self._offsets = np.concatenate([self._offsets, self._offsets[-1] + np.cumsum(lengths)])
+        self._text += b"".join(encoded)
+        for key in keys:
+            column = _Column.encode(key, values[key])
+            self._columns[key] = self._columns[key].extend(key, column) if key in self._columns else column
+
+    def text(self, i: int) -> str:
+        """
+        i 번째 본문을 반환합니다.
+        """
+        return self._text[self._offsets[i] : self._offsets[i + 1]].decode("utf-8")
+
+    def texts(self) -> Iterator[str]:
+        """
+        모든 본문을 저장 순서대로 반환합니다 (임베딩, BM25 색인에 사용).
+        """
+        for start, end in zip(self._offsets[:-1].tolist(), self._offsets[1:].tolist()):
+            yield self._text[start:end].decode("utf-8")
+
+    def metadata(self, i: int) -> dict:
+        """
+        i 번째 메타데이터를 dict 로 만듭니다.
+        """
+        return {key: column.value(i) for key, column in self._columns.items()}
+
+    def document(self, i: int) -> Document:
+        """
+        i 번째 Document 를 만듭니다.
+
+        :param i: 행 번호 (저장 순서)
+        :return: 저장할 때와 같은 본문과 메타데이터를 가진 Document
+        """
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"행 번호가 범위를 벗어났습니다: {i}")
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def column(self, key: str) -> np.ndarray:
+        """
+        메타데이터 열의 배열을 반환합니다. 문자열 열은 categories 의 번호 배열을 반환합니다.
+        날짜/사용자 조건으로 행을 고를 때 Document 를 만들지 않고 벡터 연산으로 처리할 수 있습니다.
+
+        :param key: 메타데이터 키
+        :return: NumPy 배열
+        """
+        return self._columns[key].values
+
+    def categories(self, key: str) -> List[str]:
+        """
+        문자열 메타데이터 열에 저장된 서로 다른 값 목록을 반환합니다 (column 의 번호가 가리키는 값).
+
+        :param key: 메타데이터 키
+        :return: 문자열 목록
+        """
+        return self._columns[key].categories or []
+
+
+class MessageDocstore(Docstore, AddableMixin):
+    """
+    MessageStore 를 FAISS 의 docstore 로 사용하기 위한 어댑터입니다. id 는 저장소의 행 번호이며,
+    검색 결과로 선택된 행만 Document 로 만듭니다.
+    """
+
+    def __init__(self, store: MessageStore):
+        self.store = store
+
+    def search(self, search: Union[int, str]) -> Union[str, Document]:
+        try:
+            return self.store.document(int(search))
+        except (ValueError, IndexError):
+            return f"ID {search} not found."
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        # FAISS 는 새 벡터를 인덱스 끝에 추가하므로, Document 도 같은 순서로 저장소 끝에 추가합니다.
+        self.store.extend(texts.values())
+
+
+class PositionIds(Mapping):
+    """
+    FAISS 의 index_to_docstore_id 를 대신하는 매핑입니다. FAISS 벡터 번호가 곧 MessageStore 의 행 번호이므로
+    벡터마다 uuid 문자열을 저장하지 않습니다.
+    """
+
+    def __init__(self, size: int = 0):
+        self.size = size
+
+    def __getitem__(self, i: int) -> int:
+        if 0 <= i < self.size:
+            return int(i)
+        raise KeyError(i)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.size))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def update(self, index_to_id: Mapping) -> None:
+        # FAISS.add_embeddings 가 새 벡터 번호 -> id 를 추가합니다. 번호가 이어지는지만 확인합니다.
+        if sorted(index_to_id) != list(range(self.size, self.size + len(index_to_id))):
+            raise ValueError("FAISS 벡터 번호가 저장소 행 번호와 이어지지 않습니다.")
+        self.size += len(index_to_id)
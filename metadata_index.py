@@ -0,0 +1,161 @@
+import calendar
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.chains.query_constructor.ir import Comparator, Comparison, Operation, Operator
+
+from message_store import MessageStore
+
+# 필터로 사용할 수 있는 날짜 속성
+DATE_ATTRIBUTES = ("year", "month", "day")
+
+
+class MetadataIndex:
+    """
+    날짜/사용자 조건을 행 번호 집합으로 바꾸는 메타데이터 색인입니다. 불러올 때 한 번 만들어 두고,
+    질문마다 전체 메타데이터를 검사하지 않고 이진 탐색으로 후보 행을 찾습니다.
+
+    - 날짜: 청크 시작 시각(date)으로 정렬한 행 번호 배열. 날짜 범위는 searchsorted 로 찾습니다.
+    - 사용자: 사용자가 참여한(users) 청크의 행 번호를 정렬한 배열.
+
+    결과 행 번호는 MessageStore / FAISS 벡터 번호와 같습니다.
+    """
+
+    def __init__(self, store: MessageStore):
+        """
+        :param store: 색인할 MessageStore (date 와 users 또는 user 메타데이터가 있어야 합니다)
+        """
+        self.size = len(store)
+        dates = _timestamps(store)
+        self.order = np.argsort(dates, kind="stable").astype(np.int64)
+        self.sorted_dates = dates[self.order]
+
+        key = "users" if "users" in store.columns else "user"
+        codes = store.column(key)
+        # 같은 참여자 조합(categories 번호)의 행을 모은 뒤, 사용자별로 합칩니다.
+        rows_by_code = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[rows_by_code], np.arange(len(store.categories(key)) + 1))
+        user_parts: Dict[str, List[np.ndarray]] = {}
+        for code, value in enumerate(store.categories(key)):
+            rows = rows_by_code[bounds[code] : bounds[code + 1]]
+            for user in value.split(", "):
+                user_parts.setdefault(user, []).append(rows)
+        self.user_rows: Dict[str, np.ndarray] = {
+            user: np.sort(np.concatenate(parts)).astype(np.int64) for user, parts in user_parts.items()
+        }
+
+        self.min_year = int(self.sorted_dates[0].astype("datetime64[Y]").astype(int) + 1970) if self.size else 0
+        self.max_year = int(self.sorted_dates[-1].astype("datetime64[Y]").astype(int) + 1970) if self.size else -1
+
+    @property
+    def nbytes(self) -> int:
+        """
+        정렬된 행 번호와 날짜, 사용자별 행 번호 배열이 차지하는 byte 수입니다.
+        """
+        return self.order.nbytes + self.sorted_dates.nbytes + sum(rows.nbytes for rows in self.user_rows.values())
+
+    def date_range(self, start: np.datetime64, end: np.datetime64) -> np.ndarray:
+        """
+        start <= date < end 인 행 번호를 찾습니다.
+
+        :param start: 시작 시각 (포함)
+        :param end: 끝 시각 (제외)
+        :return: 정렬된 행 번호 배열
+        """
+        low, high = np.searchsorted(self.sorted_dates, [start, end])
+        return np.sort(self.order[low:high])
+
+    def dates(self, year: Optional[int] = None, month: Optional[int] = None, day: Optional[int] = None) -> np.ndarray:
+        """
+        year/month/day 가 일치하는 행 번호를 찾습니다. 빠진 값은 대화 기간 안의 모든 값으로 보고,
+        '3월' 처럼 연도가 없으면 연도별 3월 범위를 각각 이진 탐색하여 합칩니다.
+
+        :return: 정렬된 행 번호 배열
+        """
+        parts = [self.date_range(start, end) for start, end in self._ranges(year, month, day)]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def users(self, user: str) -> np.ndarray:
+        """
+        사용자가 참여한 청크의 행 번호를 찾습니다.
+
+        :return: 정렬된 행 번호 배열
+        """
+        return self.user_rows.get(user, np.empty(0, dtype=np.int64))
+
+    def resolve(self, query_filter) -> Optional[np.ndarray]:
+        """
+        KoreanQueryParser 가 만든 필터(year/month/day/user 의 EQ 비교와 AND)를 행 번호 집합으로 바꿉니다.
+
+        :param query_filter: StructuredQuery.filter (None 이면 전체)
+        :return: 정렬된 행 번호 배열. 필터가 없으면 None
+        :raises ValueError: 이 색인으로 처리할 수 없는 필터 (LLM 이 만든 범위 조건 등)
+        """
+        if query_filter is None:
+            return None
+        comparisons = _comparisons(query_filter)
+        fields = {}
+        for comparison in comparisons:
+            if comparison.comparator != Comparator.EQ or comparison.attribute not in (*DATE_ATTRIBUTES, "user"):
+                raise ValueError(f"지원하지 않는 필터입니다: {comparison}")
+            if fields.get(comparison.attribute, comparison.value) != comparison.value:
+                return np.empty(0, dtype=np.int64)
+            fields[comparison.attribute] = comparison.value
+
+        ids = None
+        if any(attribute in fields for attribute in DATE_ATTRIBUTES):
+            ids = self.dates(*(_int_or_none(fields.get(attribute)) for attribute in DATE_ATTRIBUTES))
+        if "user" in fields:
+            user_ids = self.users(fields["user"])
+            ids = user_ids if ids is None else np.intersect1d(ids, user_ids, assume_unique=True)
+        return ids
+
+    def _ranges(self, year: Optional[int], month: Optional[int], day: Optional[int]) -> List[Tuple[np.datetime64, np.datetime64]]:
+        years = [year] if year is not None else range(self.min_year, self.max_year + 1)
+        ranges = []
+        for y in years:
+            if month is None and day is None:
+                ranges.append((_datetime(y, 1, 1), _datetime(y + 1, 1, 1)))
+                continue
+            for m in [month] if month is not None else range(1, 13):
+                if day is None:
+                    ranges.append((_datetime(y, m, 1), _next_month(y, m)))
+                elif 1 <= day <= calendar.monthrange(y, m)[1]:
+                    start = _datetime(y, m, day)
+                    ranges.append((start, start + np.timedelta64(1, "D")))
+        return ranges
+
+
+def _timestamps(store: MessageStore) -> np.ndarray:
+    # date 열을 datetime64[s] 배열로 반환합니다 (문자열로 저장된 경우 값마다 한 번만 변환).
+    dates = store.column("date")
+    if dates.dtype.kind == "M":
+        return dates.astype("datetime64[s]")
+    parsed = np.array(
+        [np.datetime64(datetime.fromisoformat(value), "s") for value in store.categories("date")],
+        dtype="datetime64[s]",
+    )
+    return parsed[dates]
+
+
+def _comparisons(query_filter) -> List[Comparison]:
+    if isinstance(query_filter, Comparison):
+        return [query_filter]
+    if isinstance(query_filter, Operation) and query_filter.operator == Operator.AND:
+        return [comparison for argument in query_filter.arguments for comparison in _comparisons(argument)]
+    raise ValueError(f"지원하지 않는 필터입니다: {query_filter}")
+
+
+def _int_or_none(value) -> Optional[int]:
+    return None if value is None else int(value)
+
+
+def _datetime(year: int, month: int, day: int) -> np.datetime64:
+    return np.datetime64(f"{year:04d}-{month:02d}-{day:02d}", "s")
+
+
+def _next_month(year: int, month: int) -> np.datetime64:
+    return _datetime(year + month // 12, month % 12 + 1, 1)
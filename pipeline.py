@@ -0,0 +1,420 @@
+import asyncio
+import os
+import threading
+from typing import AsyncIterator, BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+
+from langchain_community.vectorstores import Chroma, FAISS
+from langchain_core.embeddings import Embeddings
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import ConfigurableField, Runnable, RunnableConfig, RunnablePassthrough
+
+import clients
+import embeddings as embeddings_lib
+import kakaotalk_loader as kakao
+import prompt as prmpt
+import retriever as retriever_lib
+import tracing
+from chunker import ConversationChunker
+from context_packer import ContextPacker
+from index_store import IndexStore, file_fingerprint, stored_messages
+from metadata_index import MetadataIndex
+from query_parser import KoreanQueryParser
+from reranker import MMRReranker
+from summary_index import SummaryIndex, SummaryRouter
+
+# context 에 넣을 최대 토큰 수
+MAX_CONTEXT_TOKENS = 6000
+
+
+def load_or_index(
+    index_store: IndexStore,
+    chat_key: str,
+    data: Union[bytes, BinaryIO],
+    file_name: str,
+    embeddings: Dict[str, object],
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[FAISS, Chroma]:
+    """
+    저장된 인덱스가 있으면 불러오고, 없으면 대화 파일을 읽어 인덱싱합니다.
+
+    :param index_store: 인덱스 저장소
+    :param chat_key: 대화 파일의 해시 (file_fingerprint)
+    :param data: 대화 파일 내용 또는 업로드된 파일 같은 바이너리 스트림 (임시 파일에 쓰지 않고 바로 읽습니다)
+    :param file_name: 대화 파일 이름 (확장자로 TXT/CSV 를 구분합니다)
+    :param embeddings: {"faiss": 임베딩, "chroma": 임베딩}
+    :param on_progress: 임베딩 진행 상황 콜백 (완료 개수, 전체 개수)
+    :return: (FAISS, Chroma)
+    """
+    if index_store.exists(chat_key):
+        return index_store.load(chat_key, embeddings)
+
+    _, file_suffix = os.path.splitext(file_name)
+
+    # 카카오톡 로더 (인코딩은 파일 앞부분으로 추정하고, 읽으면서 디코딩합니다)
+    loader = kakao.KaKaoTalkLoader(data, file_suffix, autodetect_encoding=True, source=file_name)
+
+    # 연속된 메시지를 시간 간격/화자 전환/길이 기준으로 묶어 청크를 생성
+    chunker = ConversationChunker(chunk_size=1000, max_gap_minutes=30, max_turns=20)
+
+    # VectorStore 생성 후 다음 업로드를 위해 디스크에 저장
+    # 같은 대화방의 이전 인덱스가 있으면 새로 추가된 메시지만 임베딩합니다.
+    return index_store.index_chat(
+        chat_key,
+        loader,
+        chunker,
+        embeddings,
+        on_progress=on_progress,
+        file_name=file_name,
+    )
+
+
+class LoadedChat:
+    """
+    불러온 대화 인덱스 하나와 그 위에 만든 검색용 색인(BM25 역색인, 메타데이터 색인)입니다.
+
+    API 키와 관계없는 부분만 담고 있으므로, 같은 파일을 올린 여러 세션이 하나를 공유합니다.
+    세션마다 다른 임베딩(API 키)은 retriever 를 만들 때 벡터스토어의 가벼운 사본으로 연결합니다.
+    """
+
+    def __init__(self, index_store: IndexStore, chat_key: str, faiss: FAISS, chroma: Chroma):
+        """
+        :param index_store: 인덱스 저장소
+        :param chat_key: 대화 파일의 해시
+        :param faiss: FAISS 벡터스토어
+        :param chroma: Chroma 벡터스토어
+        """
+        self.chat_key = chat_key
+        self.faiss = faiss
+        self.chroma = chroma
+        self.users = index_store.manifest(chat_key).get("users")
+        # FAISS 와 BM25, 메타데이터 색인이 같은 MessageStore 를 공유하므로 문서를 한 벌 더 메모리에 올리지 않습니다.
+        self.store = stored_messages(faiss)
+        self.bm25_index = retriever_lib.InvertedIndex(self.store.texts())
+        self.metadata_index = MetadataIndex(self.store)
+        # build_summaries.py 로 미리 만든 기간별 요약 (없으면 None)
+        self.summary_index = SummaryIndex.load(index_store.path(chat_key))
+        self._retrievers: Dict[Tuple[str, Optional[str]], BaseRetriever] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        """
+        MessageStore, BM25 역색인, 메타데이터 색인이 차지하는 byte 수입니다 (FAISS/Chroma 인덱스 제외).
+        """
+        return self.store.nbytes + self.bm25_index.nbytes + self.metadata_index.nbytes
+
+    def retriever(
+        self, embeddings: Dict[str, Embeddings], api_key: str, base_url: Optional[str] = None
+    ) -> BaseRetriever:
+        """
+        API 키별 앙상블 검색기를 반환합니다. 처음 요청한 세션의 임베딩으로 만든 뒤 재사용합니다.
+
+        :param embeddings: {"faiss": 임베딩, "chroma": 임베딩} (질문 임베딩에 사용)
+        :param api_key: OpenAI API 키
+        :param base_url: OpenAI 호환 서버 주소 (기본값은 OpenAI)
+        :return: 검색 순위대로 Document 를 반환하는 앙상블 검색기
+        """
+        with self._lock:
+            key = (api_key, base_url)
+            if key not in self._retrievers:
+                # 인덱스는 공유하고 질문 임베딩만 이 API 키로 계산하도록 벡터스토어 사본을 만듭니다.
+                faiss = FAISS(
+                    embeddings["faiss"], self.faiss.index, self.faiss.docstore, self.faiss.index_to_docstore_id
+                )
+                chroma = Chroma(
+                    client=self.chroma._client,
+                    collection_name=self.chroma._collection.name,
+                    embedding_function=embeddings["chroma"],
+                )
+                self._retrievers[key] = _ensemble_retriever(self, faiss, chroma, api_key, base_url)
+            return self._retrievers[key]
+
+    def summary_router(self) -> Optional[SummaryRouter]:
+        """
+        기간 요약 질문을 요약 색인으로 보내는 라우터를 반환합니다. 요약 색인이 없으면 None 을 반환합니다.
+        """
+        if not self.summary_index:
+            return None
+        return SummaryRouter(self.summary_index, KoreanQueryParser(users=self.users))
+
+
+def build_retriever(
+    index_store: IndexStore,
+    chat_key: str,
+    faiss: FAISS,
+    chroma: Chroma,
+    api_key: str,
+    base_url: Optional[str] = None,
+) -> BaseRetriever:
+    """
+    FAISS, SelfQuery, BM25 검색기를 동시에 실행하는 앙상블 검색기를 생성합니다.
+
+    :param index_store: 인덱스 저장소
+    :param chat_key: 대화 파일의 해시
+    :param faiss: FAISS 벡터스토어
+    :param chroma: Chroma 벡터스토어
+    :param api_key: OpenAI API 키
+    :param base_url: OpenAI 호환 서버 주소 (기본값은 OpenAI)
+    :return: 검색 순위대로 Document 를 반환하는 앙상블 검색기
+    """
+    return _ensemble_retriever(LoadedChat(index_store, chat_key, faiss, chroma), faiss, chroma, api_key, base_url)
+
+
+def _ensemble_retriever(
+    chat: LoadedChat, faiss: FAISS, chroma: Chroma, api_key: str, base_url: Optional[str]
+) -> BaseRetriever:
+    # FAISSRetriever 생성
+    faiss_retriever = retriever_lib.FAISSRetrieverFactory(faiss).create(
+        search_kwargs={"k": 30},
+    )
+
+    # SelfQueryRetriever 생성
+    # 날짜/사용자 표현은 규칙 기반 파서가 먼저 처리하여 FAISS 에서 조건에 맞는 벡터만 검색하고,
+    # 확신할 수 없을 때만 LLM 쿼리 생성기와 Chroma 를 사용합니다.
+    query_parser = KoreanQueryParser(users=chat.users)
+    llm_self_query_retriever = retriever_lib.SelfQueryRetrieverFactory(chroma).create(
+        model="gpt-4-turbo-preview",
+        temperature=0,
+        api_key=api_key,
+        base_url=base_url,
+        search_kwargs={"k": 30},
+        query_parser=query_parser,
+    )
+    self_query_retriever = retriever_lib.FilteredFAISSRetrieverFactory(faiss).create(
+        metadata_index=chat.metadata_index,
+        query_parser=query_parser,
+        fallback=llm_self_query_retriever,
+        search_kwargs={"k": 30},
+    )
+
+    # BM25Retriever 생성 (URL, 닉네임 등 정확한 토큰 검색, API 호출 없음)
+    bm25_retriever = retriever_lib.BM25RetrieverFactory(chat.store).create(
+        index=chat.bm25_index,
+        search_kwargs={"k": 30},
+    )
+
+    # 앙상블 retriever를 초기화합니다.
+    return retriever_lib.EnsembleRetrieverFactory(None).create(
+        retrievers=[faiss_retriever, self_query_retriever, bm25_retriever],
+        weights=[0.3, 0.5, 0.2],
+        # 하위 검색기는 동시에 실행되며, 제한 시간을 넘긴 검색기의 결과는 제외합니다.
+        timeouts=[10, 20, 5],
+        names=["faiss", "self_query", "bm25"],
+    )
+
+
+def build_answer_chain(api_key: str, base_url: Optional[str] = None) -> Runnable:
+    """
+    {"context": 대화 기록 문자열, "question": 질문} 을 받아 답변 문자열을 생성하는 체인을 만듭니다.
+
+    :param api_key: OpenAI API 키
+    :param base_url: OpenAI 호환 서버 주소 (기본값은 OpenAI)
+    :return: 답변 체인
+    """
+    # LLM 클라이언트는 API 키별로 공유되므로 HTTP 연결을 재사용합니다.
+    llm = clients.get_chat_model(
+        api_key, model="gpt-4-turbo-preview", temperature=0, streaming=True, base_url=base_url
+    ).configurable_alternatives(
+        ConfigurableField(id="llm"),
+        default_key="gpt4",
+        gpt3=clients.get_chat_model(
+            api_key, model="gpt-3-turbo", temperature=0, streaming=True, base_url=base_url
+        ),
+    )
+    return prmpt.rag_prompt() | llm | StrOutputParser()
+
+
+def build_chain(
+    retriever: BaseRetriever,
+    api_key: str,
+    base_url: Optional[str] = None,
+    max_context_tokens: int = MAX_CONTEXT_TOKENS,
+    reranker: Optional[MMRReranker] = None,
+    summary_router: Optional[SummaryRouter] = None,
+) -> Runnable:
+    """
+    질문 문자열을 받아 답변 문자열을 생성하는 RAG 체인을 만듭니다.
+
+    :param retriever: 앙상블 검색기
+    :param api_key: OpenAI API 키
+    :param base_url: OpenAI 호환 서버 주소 (기본값은 OpenAI)
+    :param max_context_tokens: context 에 넣을 최대 토큰 수
+    :param reranker: 검색 결과에서 비슷한 청크를 걸러낼 MMR 재정렬기 (없으면 검색 순위를 그대로 사용)
+    :param summary_router: 기간 요약 질문을 요약 색인으로 보낼 라우터 (없으면 모든 질문을 검색기로 처리)
+    :return: RAG 체인
+    """
+    if reranker is not None:
+        retriever = reranker.as_runnable(retriever)
+    if summary_router is not None:
+        retriever = summary_router.as_runnable(retriever)
+    return {
+        # 중복 청크를 제거하고 이어지는 대화를 합쳐 토큰 예산 안에서 context 를 구성
+        "context": retriever | ContextPacker(max_tokens=max_context_tokens).as_runnable(),
+        "question": RunnablePassthrough(),
+    } | build_answer_chain(api_key, base_url)
+
+
+class ChatPipeline:
+    """
+    대화 파일 하나에 대해 로더 → 임베딩 → FAISS/Chroma → 앙상블 검색 → 프롬프트 → LLM 파이프라인을
+    한 번만 구성하고, 여러 질문에 재사용하는 Streamlit 없는 진입점입니다. 여러 스레드에서 동시에 ask 를
+    호출할 수 있습니다.
+    """
+
+    def __init__(
+        self,
+        chat_key: str,
+        retriever: BaseRetriever,
+        answer_chain: Runnable,
+        packer: ContextPacker,
+        reranker: Optional[MMRReranker] = None,
+        summary_router: Optional[SummaryRouter] = None,
+    ):
+        self.chat_key = chat_key
+        self.retriever = retriever
+        self.answer_chain = answer_chain
+        self.packer = packer
+        self.reranker = reranker
+        self.summary_router = summary_router
+
+    @classmethod
+    def from_file(
+        cls,
+        file_path: str,
+        api_key: str,
+        base_url: Optional[str] = None,
+        index_root: str = "./index/",
+        max_context_tokens: int = MAX_CONTEXT_TOKENS,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+        embeddings: Optional[Dict[str, object]] = None,
+    ) -> "ChatPipeline":
+        """
+        대화 파일로 파이프라인을 구성합니다. 같은 파일의 인덱스가 저장되어 있으면 재사용합니다.
+
+        :param file_path: 카카오톡 TXT/CSV 파일 경로
+        :param api_key: OpenAI API 키
+        :param base_url: OpenAI 호환 서버 주소 (기본값은 OpenAI)
+        :param index_root: 인덱스 저장 경로
+        :param max_context_tokens: context 에 넣을 최대 토큰 수
+        :param on_progress: 임베딩 진행 상황 콜백 (완료 개수, 전체 개수)
+        :param embeddings: {"faiss": 임베딩, "chroma": 임베딩} (기본값은 캐시된 OpenAI 임베딩)
+        :return: ChatPipeline
+        """
+        with open(file_path, "rb") as f:
+            data = f.read()
+        file_name = os.path.basename(file_path)
+        _, file_suffix = os.path.splitext(file_name)
+
+        index_store = IndexStore(index_root)
+        chat_key = file_fingerprint(data, file_suffix)
+        if embeddings is None:
+            embeddings = embeddings_lib.embedding_factory(api_key=api_key, base_url=base_url)
+        faiss, chroma = load_or_index(index_store, chat_key, data, file_name, embeddings, on_progress)
+        chat = LoadedChat(index_store, chat_key, faiss, chroma)
+        return cls.for_chat(chat, embeddings, api_key, base_url, max_context_tokens)
+
+    @classmethod
+    def for_chat(
+        cls,
+        chat: LoadedChat,
+        embeddings: Dict[str, Embeddings],
+        api_key: str,
+        base_url: Optional[str] = None,
+        max_context_tokens: int = MAX_CONTEXT_TOKENS,
+    ) -> "ChatPipeline":
+        """
+        불러온 대화 인덱스로 파이프라인을 구성합니다. 검색기와 LLM 클라이언트는 API 키별로 공유되므로
+        질문마다 만들어도 가볍습니다.
+
+        :param chat: 불러온 대화 인덱스
+        :param embeddings: {"faiss": 임베딩, "chroma": 임베딩}
+        :param api_key: OpenAI API 키
+        :param base_url: OpenAI 호환 서버 주소 (기본값은 OpenAI)
+        :param max_context_tokens: context 에 넣을 최대 토큰 수
+        :return: ChatPipeline
+        """
+        return cls(
+            chat.chat_key,
+            chat.retriever(embeddings, api_key, base_url),
+            build_answer_chain(api_key, base_url),
+            ContextPacker(max_tokens=max_context_tokens),
+            MMRReranker(embeddings["faiss"]),
+            chat.summary_router(),
+        )
+
+    def ask(self, question: str, config: Optional[RunnableConfig] = None) -> dict:
+        """
+        질문에 답변하고, 검색된 행 범위와 단계별 소요 시간을 함께 반환합니다.
+
+        :param question: 질문
+        :param config: 체인 실행 설정 (callbacks 등)
+        :return: {"answer", "rows", "timings"} (rows 는 context 에 들어간 [시작 행, 끝 행] 목록,
+                 timings 는 retrieve/pack/generate/total 단계별 초)
+        """
+        with tracing.span("ask") as ask_span:
+            with tracing.span("retrieve") as retrieve_span:
+                # 기간 요약 질문은 검색 대신 미리 만든 요약을 사용합니다.
+                documents = self.summary_router.route(question) if self.summary_router is not None else None
+                if documents is None:
+                    documents = self.retriever.invoke(question, config)
+                    if self.reranker is not None:
+                        documents = self.reranker.rerank(question, documents)
+            with tracing.span("context.pack", candidates=len(documents)) as pack_span:
+                selected = self.packer.select(documents)
+                context = self.packer.format(selected)
+            with tracing.span("generate") as generate_span:
+                answer = self.answer_chain.invoke({"context": context, "question": question}, config)
+        return {
+            "answer": answer,
+            "rows": _rows(selected),
+            "timings": {
+                "retrieve": retrieve_span.duration,
+                "pack": pack_span.duration,
+                "generate": generate_span.duration,
+                "total": ask_span.duration,
+            },
+        }
+
+    async def astream(self, question: str, config: Optional[RunnableConfig] = None) -> AsyncIterator[dict]:
+        """
+        ask 와 같은 단계를 이벤트 루프를 막지 않고 실행하며, 답변 토큰을 생성되는 대로 반환합니다.
+        검색과 LLM 호출은 비동기 API 를, 임베딩 캐시(SQLite)를 읽는 MMR 재정렬은 스레드를 사용합니다.
+
+        :param question: 질문
+        :param config: 체인 실행 설정 (callbacks 등)
+        :return: {"token"} 을 차례로 반환한 뒤, 마지막에 {"answer", "rows", "timings"} 를 반환하는 async iterator
+        """
+        tokens = []
+        with tracing.span("ask") as ask_span:
+            with tracing.span("retrieve") as retrieve_span:
+                documents = self.summary_router.route(question) if self.summary_router is not None else None
+                if documents is None:
+                    documents = await self.retriever.ainvoke(question, config)
+                    if self.reranker is not None:
+                        documents = await asyncio.to_thread(self.reranker.rerank, question, documents)
+            with tracing.span("context.pack", candidates=len(documents)) as pack_span:
+                selected = self.packer.select(documents)
+                context = self.packer.format(selected)
+            with tracing.span("generate") as generate_span:
+                async for token in self.answer_chain.astream({"context": context, "question": question}, config):
+                    tokens.append(token)
+                    yield {"token": token}
+        yield {
+            "answer": "".join(tokens),
+            "rows": _rows(selected),
+            "timings": {
+                "retrieve": retrieve_span.duration,
+                "pack": pack_span.duration,
+                "generate": generate_span.duration,
+                "total": ask_span.duration,
+            },
+        }
+
+
+def _rows(documents) -> List[List[int]]:
+    return sorted(
+        [document.metadata["row"], document.metadata.get("row_end", document.metadata["row"])]
+        for document in documents
+        if "row" in document.metadata
+    )
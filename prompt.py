@@ -35,3 +35,19 @@ def rag_prompt():
     """
     )
     return prompt
+
+
+def summary_prompt():
+    # 기간(일/주/월)별 대화 요약 프롬프트
+    prompt = ChatPromptTemplate.from_template(
+        """You are summarizing a KakaoTalk group chat log for the period {period}.
+    The text below is either the chat transcript or summaries of shorter periods within it.
+    User names are anonymized with asterisks; keep them as they are.
+    Write a concise summary in Korean as a bulleted list of the main topics, decisions, shared links and events,
+    with dates where helpful. Do not add information that is not in the text.
+
+    Text:
+    {text}
+    """
+    )
+    return prompt
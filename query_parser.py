@@ -0,0 +1,204 @@
+import re
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain.chains.query_constructor.ir import (
+    Comparator,
+    Comparison,
+    Operation,
+    Operator,
+    StructuredQuery,
+)
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+import tracing
+
+# 날짜 표현 뒤에 붙는 조사
+_DATE_PARTICLE = r"(?:에는|에서|에|엔|의|쯤)?"
+# 사용자 표현 뒤에 붙는 호칭/조사
+_USER_SUFFIX = re.compile(r"(?:님)?(?:께서|이랑|한테|에게|이|가|은|는|의|랑|도)?")
+
+# (정규식, 정규식 그룹을 (year, month, day) 로 변환하는 함수) 목록. 긴 표현부터 검사합니다.
+_ABSOLUTE_PATTERNS = [
+    (re.compile(r"(?<!\d)(\d{4})\s*[-./]\s*(\d{1,2})\s*[-./]\s*(\d{1,2})" + _DATE_PARTICLE), lambda g: (g[0], g[1], g[2])),
+    (re.compile(r"(?<!\d)(\d{4})년\s*(\d{1,2})월\s*(\d{1,2})일" + _DATE_PARTICLE), lambda g: (g[0], g[1], g[2])),
+    (re.compile(r"(?<!\d)(\d{4})년\s*(\d{1,2})월" + _DATE_PARTICLE), lambda g: (g[0], g[1], None)),
+    (re.compile(r"(?<!\d)(\d{1,2})월\s*(\d{1,2})일" + _DATE_PARTICLE), lambda g: (None, g[0], g[1])),
+    (re.compile(r"(?<![\d/])(\d{1,2})/(\d{1,2})(?![\d/])" + _DATE_PARTICLE), lambda g: (None, g[0], g[1])),
+    (re.compile(r"(?<!\d)(\d{4})년" + _DATE_PARTICLE), lambda g: (g[0], None, None)),
+    (re.compile(r"(?<!\d)(\d{1,2})월" + _DATE_PARTICLE), lambda g: (None, g[0], None)),
+    (re.compile(r"(?<!\d)(\d{1,2})일" + _DATE_PARTICLE), lambda g: (None, None, g[0])),
+]
+
+# (정규식, 기준 날짜로 (year, month, day) 를 계산하는 함수) 목록
+_RELATIVE_PATTERNS = [
+    (re.compile(r"재작년" + _DATE_PARTICLE), lambda t: (t.year - 2, None, None)),
+    (re.compile(r"(?:작년|지난\s*해|지난해)" + _DATE_PARTICLE), lambda t: (t.year - 1, None, None)),
+    (re.compile(r"(?:올해|금년|이번\s*해)" + _DATE_PARTICLE), lambda t: (t.year, None, None)),
+    (re.compile(r"(?:지난\s*달|저번\s*달)" + _DATE_PARTICLE), lambda t: _previous_month(t)),
+    (re.compile(r"(?:이번\s*달|이달|이번\s*월|금월)" + _DATE_PARTICLE), lambda t: (t.year, t.month, None)),
+    (re.compile(r"(?:그저께|그제)" + _DATE_PARTICLE), lambda t: _days_ago(t, 2)),
+    (re.compile(r"어제" + _DATE_PARTICLE), lambda t: _days_ago(t, 1)),
+    (re.compile(r"오늘" + _DATE_PARTICLE), lambda t: _days_ago(t, 0)),
+]
+
+# 규칙으로 정확히 표현할 수 없는 기간 표현. 이런 표현이 있으면 LLM 에 맡깁니다.
+_AMBIGUOUS_PATTERN = re.compile(
+    r"\d+\s*(?:일|주|달|개월|년)\s*(?:전|후|뒤|동안|간|째)"
+    r"|(?:지난|이번|다음|저번|지지난)\s*주|주말|주간|요일"
+    r"|다음\s*달|내년|내일|모레|최근|요즘|최신|예전"
+    r"|부터|까지|사이|이후|이전|이래|~"
+    r"|(?:월|년)\s*(?:초|말|중순)|상반기|하반기|분기|연말|연초"
+)
+_USER_MENTION_PATTERN = re.compile(r"\*+")
+
+
+def _previous_month(today: date) -> Tuple[int, int, None]:
+    if today.month == 1:
+        return (today.year - 1, 12, None)
+    return (today.year, today.month - 1, None)
+
+
+def _days_ago(today: date, days: int) -> Tuple[int, int, int]:
+    target = today - timedelta(days=days)
+    return (target.year, target.month, target.day)
+
+
+class KoreanQueryParser:
+    """
+    한국어 질문에서 날짜 표현과 비식별화된 사용자 언급을 찾아 SelfQueryRetriever 와 같은
+    StructuredQuery(year/month/day/user 필터)로 변환하는 규칙 기반 쿼리 생성기입니다.
+
+    '지난주', '3월부터' 처럼 규칙으로 확신할 수 없는 표현이 있으면 None 을 반환하며,
+    이 경우 as_query_constructor 로 감싼 LLM 쿼리 생성기가 대신 처리합니다.
+    """
+
+    def __init__(self, users: Optional[Iterable[str]] = None, today: Optional[date] = None):
+        """
+        :param users: 대화방의 비식별화된 사용자 목록 (없으면 사용자 언급이 있는 질문은 LLM 에 맡깁니다)
+        :param today: '오늘', '지난달' 등의 기준 날짜 (기본값은 실행 시점의 날짜)
+        """
+        # 긴 이름부터 비교해야 '**나다' 와 '**나다라' 를 구분할 수 있습니다.
+        self.users = (
+            sorted({user for user in users if user}, key=len, reverse=True)
+            if users is not None
+            else None
+        )
+        self.today = today
+
+    def parse(self, question: str) -> Optional[StructuredQuery]:
+        """
+        질문을 StructuredQuery 로 변환합니다.
+
+        :param question: 사용자 질문
+        :return: 변환된 StructuredQuery. 규칙으로 확신할 수 없으면 None
+        """
+        if _AMBIGUOUS_PATTERN.search(question):
+            return None
+
+        fields: Dict[str, object] = {}
+        text = question
+        today = self.today or date.today()
+
+        for pattern, convert in _RELATIVE_PATTERNS:
+            text, matches = self._consume(pattern, text)
+            for _ in matches:
+                if not self._merge(fields, convert(today)):
+                    return None
+
+        for pattern, convert in _ABSOLUTE_PATTERNS:
+            text, matches = self._consume(pattern, text)
+            for groups in matches:
+                values = tuple(int(value) if value is not None else None for value in convert(groups))
+                if not self._is_valid(values) or not self._merge(fields, values):
+                    return None
+
+        if _USER_MENTION_PATTERN.search(text):
+            text, user = self._consume_user(text)
+            if user is None:
+                return None
+            fields["user"] = user
+
+        query = " ".join(text.split()) or question
+        comparisons = [
+            Comparison(comparator=Comparator.EQ, attribute=attribute, value=fields[attribute])
+            for attribute in ("year", "month", "day", "user")
+            if attribute in fields
+        ]
+        if not comparisons:
+            query_filter = None
+        elif len(comparisons) == 1:
+            query_filter = comparisons[0]
+        else:
+            query_filter = Operation(operator=Operator.AND, arguments=comparisons)
+        return StructuredQuery(query=query, filter=query_filter, limit=None)
+
+    def as_query_constructor(self, fallback: Runnable) -> Runnable:
+        """
+        규칙 기반 파서를 먼저 시도하고, 확신할 수 없을 때만 fallback(LLM 쿼리 생성기)을 호출하는
+        Runnable 을 반환합니다. SelfQueryRetriever.query_constructor 를 대체할 수 있습니다.
+
+        :param fallback: {"query": 질문} 을 받아 StructuredQuery 를 반환하는 Runnable
+        :return: 쿼리 생성 Runnable
+        """
+
+        def construct(inputs: dict, config: RunnableConfig) -> StructuredQuery:
+            structured_query = self.parse(inputs["query"])
+            if structured_query is None:
+                tracing.count("query_parser_llm_fallbacks")
+                with tracing.span("self_query.llm"):
+                    return fallback.invoke(inputs, config)
+            tracing.count("query_parser_rule_hits")
+            return structured_query
+
+        return RunnableLambda(construct, name="KoreanQueryParser")
+
+    @staticmethod
+    def _consume(pattern: re.Pattern, text: str) -> Tuple[str, List[tuple]]:
+        matches = [match.groups() for match in pattern.finditer(text)]
+        if matches:
+            text = pattern.sub(" ", text)
+        return text, matches
+
+    def _consume_user(self, text: str) -> Tuple[str, Optional[str]]:
+        if self.users is None:
+            return text, None
+        user = None
+        for match in list(_USER_MENTION_PATTERN.finditer(text)):
+            start = match.start()
+            candidate, end = self._match_user(text, start)
+            # 알 수 없는 사용자이거나, 서로 다른 사용자를 함께 언급한 경우는 LLM 에 맡깁니다.
+            if candidate is None or (user is not None and candidate != user):
+                return text, None
+            user = candidate
+            text = text[:start] + " " * (end - start) + text[end:]
+        return text, user
+
+    def _match_user(self, text: str, start: int) -> Tuple[Optional[str], int]:
+        # 사용자 이름과 뒤에 붙은 조사까지 읽은 위치가 단어의 끝이어야 같은 사용자로 봅니다.
+        for user in self.users:
+            if text.startswith(user, start):
+                end = _USER_SUFFIX.match(text, start + len(user)).end()
+                if end == len(text) or not text[end].isalnum():
+                    return user, end
+        return None, start
+
+    @staticmethod
+    def _is_valid(values: Tuple[Optional[int], Optional[int], Optional[int]]) -> bool:
+        year, month, day = values
+        return (
+            (year is None or 1900 <= year <= 2999)
+            and (month is None or 1 <= month <= 12)
+            and (day is None or 1 <= day <= 31)
+        )
+
+    @staticmethod
+    def _merge(fields: Dict[str, object], values: Tuple[Optional[int], ...]) -> bool:
+        # 같은 필드에 서로 다른 값이 나오면 ('3월 4월') 확신할 수 없으므로 False 를 반환합니다.
+        for attribute, value in zip(("year", "month", "day"), values):
+            if value is None:
+                continue
+            if fields.get(attribute, value) != value:
+                return False
+            fields[attribute] = value
+        return True
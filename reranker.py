@@ -0,0 +1,105 @@
+from typing import List, Optional, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable, RunnableLambda, RunnableParallel, RunnablePassthrough
+
+import tracing
+
+
+def mmr_select(query_vector: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = 0.5) -> List[int]:
+    """
+    최대 한계 관련성(MMR)으로 질문과 관련 있으면서 서로 겹치지 않는 후보를 k 개 고릅니다.
+
+    후보 간 코사인 유사도 행렬을 한 번의 행렬 곱으로 계산하고, 이미 고른 후보와의 최대 유사도를 배열로
+    유지하므로 선택 한 번에 후보 수 크기의 벡터 연산만 수행합니다.
+
+    :param query_vector: 질문 임베딩 (dim,)
+    :param vectors: 후보 임베딩 (n, dim)
+    :param k: 고를 개수
+    :param lambda_mult: 1 이면 관련성만, 0 이면 다양성만 고려합니다.
+    :return: 고른 후보 번호 (선택 순서)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if len(vectors) == 0 or k <= 0:
+        return []
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    query = query / max(float(np.linalg.norm(query)), 1e-12)
+
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+    available = np.ones(len(vectors), dtype=bool)
+
+    # 첫 후보는 관련성만으로 고르고, 이후에는 이미 고른 후보와의 최대 유사도(redundancy)를 뺀 점수로 고릅니다.
+    best = int(np.argmax(relevance))
+    selected = [best]
+    available[best] = False
+    redundancy = similarity[best].copy()
+    for _ in range(min(k, len(vectors)) - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
+
+
+class MMRReranker:
+    """
+    앙상블 검색 결과를 MMR 로 다시 정렬하여, 거의 같은 대화 청크가 context 를 채우지 않도록 합니다.
+
+    후보 청크의 임베딩은 인덱싱할 때 저장한 임베딩 캐시(CachedEmbeddings)에서 읽으므로 API 를 다시 호출하지
+    않습니다. 관련성은 질문과 청크 임베딩의 유사도로 계산하며, 앞서 고른 청크와 비슷한 청크는 뒤로 밀리거나 제외됩니다.
+    """
+
+    def __init__(self, embeddings: Embeddings, k: int = 15, lambda_mult: float = 0.5):
+        """
+        :param embeddings: 인덱싱에 사용한 임베딩 (캐시된 임베딩이면 후보 임베딩을 캐시에서 읽습니다)
+        :param k: 남길 청크 수
+        :param lambda_mult: 관련성과 다양성의 비중 (1 이면 관련성만, 0 이면 다양성만)
+        """
+        if not 0 <= lambda_mult <= 1:
+            raise ValueError(f"lambda_mult 는 0 이상 1 이하여야 합니다: {lambda_mult}")
+        self.embeddings = embeddings
+        self.k = k
+        self.lambda_mult = lambda_mult
+
+    def rerank(
+        self, query: str, documents: Sequence[Document], k: Optional[int] = None, lambda_mult: Optional[float] = None
+    ) -> List[Document]:
+        """
+        후보 청크 중 질문과 관련 있으면서 서로 겹치지 않는 청크를 고릅니다.
+
+        :param query: 질문
+        :param documents: 검색 순위대로 정렬된 후보 청크
+        :param k: 남길 청크 수 (기본값은 self.k)
+        :param lambda_mult: 관련성과 다양성의 비중 (기본값은 self.lambda_mult)
+        :return: MMR 선택 순서대로 정렬된 청크
+        """
+        k = self.k if k is None else k
+        lambda_mult = self.lambda_mult if lambda_mult is None else lambda_mult
+        if len(documents) <= 1:
+            return list(documents)[:k]
+        with tracing.span("rerank.mmr", candidates=len(documents)):
+            # 질문과 후보를 한 번에 조회하여 캐시 조회(및 누락된 임베딩 요청)를 한 번으로 줄입니다.
+            vectors = np.asarray(
+                self.embeddings.embed_documents([query] + [document.page_content for document in documents]),
+                dtype=np.float32,
+            )
+            selected = mmr_select(vectors[0], vectors[1:], k, lambda_mult)
+        return [documents[i] for i in selected]
+
+    def as_runnable(self, retriever: BaseRetriever) -> Runnable:
+        """
+        질문 문자열을 받아 retriever 로 검색한 뒤 MMR 로 다시 정렬한 Document 목록을 반환하는 Runnable 을 생성합니다.
+
+        :param retriever: 앙상블 검색기
+        :return: retriever 대신 사용할 Runnable
+        """
+        return RunnableParallel(documents=retriever, question=RunnablePassthrough()) | RunnableLambda(
+            lambda inputs: self.rerank(inputs["question"], inputs["documents"]), name="MMRReranker"
+        )
@@ -1,13 +1,39 @@
+import asyncio
+import contextvars
+import logging
+import math
+import re
+import sys
+import time
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
-from langchain_core.runnables import ConfigurableField
-from langchain_openai import ChatOpenAI
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Iterable, Optional, Sequence
+import numpy as np
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.runnables import ConfigurableField, RunnableConfig
+from langchain_core.runnables.config import patch_config
+from clients import get_chat_model
+from faiss_index import enable_reconstruct, search_subset, set_search_params
 from langchain.chains.query_constructor.base import AttributeInfo
 from langchain.retrievers.self_query.base import SelfQueryRetriever
 
 from langchain.retrievers import EnsembleRetriever
 from langchain_core.retrievers import BaseRetriever
 
+import tracing
+from message_store import MessageStore
+
+logger = logging.getLogger(__name__)
+
+# 앙상블 하위 검색기를 동시에 실행하기 위한 프로세스 공용 스레드 풀
+_retriever_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="ensemble")
+
 
 class RetrieverFactory(ABC):
     """
@@ -52,9 +78,13 @@ class RetrieverFactory(ABC):
 class FAISSRetrieverFactory(RetrieverFactory):
     """
     FAISS 기반 검색기 생성자 클래스입니다.
+
+    근사 검색 인덱스(IVF, HNSW)는 nprobe / ef_search 로 recall 과 검색 시간을 조절할 수 있습니다.
+    값을 주지 않으면 인덱스를 만들 때 저장한 기본값을 사용합니다.
     """
 
     def create(self, **kwargs) -> BaseRetriever:
+        set_search_params(self.db.index, nprobe=kwargs.get("nprobe"), ef_search=kwargs.get("ef_search"))
         search_kwargs = kwargs.get("search_kwargs", {"k": 30})
         faiss_retriever = self.db.as_retriever(  # 검색 시 반환할 결과의 개수를 설정합니다.
             search_kwargs=search_kwargs
@@ -77,10 +107,12 @@ class SelfQueryRetrieverFactory(RetrieverFactory):
     """
 
     def create(self, **kwargs) -> BaseRetriever:
-        llm_for_selfquery = ChatOpenAI(
+        # API 키별로 공유하는 클라이언트를 사용하여 HTTP 연결을 재사용합니다.
+        llm_for_selfquery = get_chat_model(
+            api_key=kwargs.get("api_key", ""),
             model=kwargs.get("model", "gpt-4-turbo-preview"),
             temperature=kwargs.get("temperature", 0),
-            api_key=kwargs.get("api_key", ""),
+            base_url=kwargs.get("base_url"),
         )
         document_content_description = kwargs.get(
             "document_content_description",
@@ -106,12 +138,17 @@ class SelfQueryRetrieverFactory(RetrieverFactory):
                 ),
                 AttributeInfo(
                     name="user",
-                    description="The user who sent the message",
+                    description="The user who sent the most messages in the conversation chunk",
                     type="string",
                 ),
                 AttributeInfo(
                     name="row",
-                    description="The row number in the original CSV file",
+                    description="The row number of the first message of the chunk in the original file",
+                    type="integer",
+                ),
+                AttributeInfo(
+                    name="row_end",
+                    description="The row number of the last message of the chunk in the original file",
                     type="integer",
                 ),
                 AttributeInfo(
@@ -127,7 +164,16 @@ class SelfQueryRetrieverFactory(RetrieverFactory):
             document_content_description,
             metadata_field_info,
             search_kwargs=search_kwargs,
-        ).configurable_fields(
+        )
+
+        # 규칙 기반 파서가 있으면, 파서가 확신할 수 없는 질문에만 LLM 쿼리 생성기를 사용합니다.
+        query_parser = kwargs.get("query_parser")
+        if query_parser is not None:
+            self_query_retriever.query_constructor = query_parser.as_query_constructor(
+                self_query_retriever.query_constructor
+            )
+
+        self_query_retriever = self_query_retriever.configurable_fields(
             search_kwargs=ConfigurableField(
                 # 검색 매개변수의 고유 식별자를 설정합니다.
                 id="search_kwargs_selfquery",
@@ -140,6 +186,401 @@ class SelfQueryRetrieverFactory(RetrieverFactory):
         return self_query_retriever
 
 
+class FilteredFAISSRetriever(BaseRetriever):
+    """
+    날짜/사용자 조건이 있는 질문을 FAISS 에서 바로 처리하는 검색기입니다.
+
+    규칙 기반 파서(KoreanQueryParser)로 필터를 만들고, MetadataIndex 로 조건에 맞는 벡터 번호를 찾은 뒤
+    그 벡터들 안에서만 유사도 검색을 합니다. 파서가 확신할 수 없는 질문이나 MetadataIndex 로 처리할 수 없는
+    필터는 fallback(LLM 을 사용하는 Chroma SelfQuery 검색기)에 맡깁니다.
+    """
+
+    vectorstore: Any
+    metadata_index: Any
+    query_parser: Any
+    fallback: Any = None
+    """규칙으로 처리할 수 없는 질문을 맡길 검색기 (Runnable)"""
+    search_kwargs: dict = {"k": 30}
+    brute_force_max: int = 4096
+    """후보가 이 개수 이하이면 FAISS 검색 대신 NumPy 로 후보와의 거리를 직접 계산합니다."""
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __repr_args__(self):
+        # NOTE - 콜백 매니저가 검색할 때마다 검색기를 직렬화(repr)하므로, 색인 내용은 표시하지 않습니다.
+        return [("search_kwargs", self.search_kwargs), ("brute_force_max", self.brute_force_max)]
+
+    def __eq__(self, other) -> bool:
+        return self is other
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        structured_query = self.query_parser.parse(query)
+        ids = None
+        if structured_query is not None:
+            try:
+                ids = self.metadata_index.resolve(structured_query.filter)
+            except ValueError:
+                structured_query = None
+        if structured_query is None:
+            if self.fallback is None:
+                return []
+            return self.fallback.invoke(query, {"callbacks": run_manager.get_child()})
+
+        tracing.count("query_parser_rule_hits")
+        k = self.search_kwargs.get("k", 30)
+        vector = self.vectorstore.embeddings.embed_query(structured_query.query)
+        if ids is None:
+            return self.vectorstore.similarity_search_by_vector(vector, k=k)
+
+        tracing.count("filtered_search_candidates", len(ids))
+        with tracing.span("self_query.subset_search"):
+            _, found = search_subset(self.vectorstore.index, vector, ids, k, self.brute_force_max)
+        docstore, index_to_id = self.vectorstore.docstore, self.vectorstore.index_to_docstore_id
+        return [docstore.search(index_to_id[int(i)]) for i in found]
+
+
+class FilteredFAISSRetrieverFactory(RetrieverFactory):
+    """
+    메타데이터 필터를 FAISS 에서 처리하는 검색기 생성자 클래스입니다. db 로 FAISS 벡터스토어를 받습니다.
+    """
+
+    def create(self, **kwargs) -> BaseRetriever:
+        """
+        :param metadata_index: 벡터스토어와 같은 순서의 MessageStore 로 만든 MetadataIndex
+        :param query_parser: KoreanQueryParser
+        :param fallback: 규칙으로 처리할 수 없는 질문을 맡길 검색기
+        :param search_kwargs: {"k": 반환할 결과 수}
+        :param brute_force_max: NumPy 로 직접 거리를 계산할 최대 후보 수
+        """
+        # IVF 인덱스도 후보 벡터를 복원할 수 있도록 direct map 을 만들어 둡니다.
+        enable_reconstruct(self.db.index)
+        filtered_retriever = FilteredFAISSRetriever(
+            vectorstore=self.db,
+            metadata_index=kwargs["metadata_index"],
+            query_parser=kwargs["query_parser"],
+            fallback=kwargs.get("fallback"),
+            search_kwargs=kwargs.get("search_kwargs", {"k": 30}),
+            brute_force_max=kwargs.get("brute_force_max", 4096),
+        ).configurable_fields(
+            search_kwargs=ConfigurableField(
+                # 검색 매개변수의 고유 식별자를 설정합니다.
+                id="search_kwargs_filtered",
+                # 검색 매개변수의 이름을 설정합니다.
+                name="Search Kwargs",
+                # 검색 매개변수에 대한 설명을 작성합니다.
+                description="The search kwargs to use",
+            )
+        )
+        return filtered_retriever
+
+
+class ParallelEnsembleRetriever(EnsembleRetriever):
+    """
+    하위 검색기를 동시에 실행하는 앙상블 검색기입니다.
+
+    각 검색기에 제한 시간을 둘 수 있으며, 제한 시간 안에 끝나지 않았거나 예외가 발생한 검색기의 결과는
+    제외하고 나머지 결과와 가중치만으로 weighted reciprocal rank fusion 을 수행합니다.
+    모든 검색기가 실패한 경우에만 첫 번째 예외를 다시 발생시킵니다.
+    """
+
+    timeouts: Optional[List[Optional[float]]] = None
+    """검색기별 제한 시간(초). None 이면 제한 없이 기다립니다."""
+    names: Optional[List[str]] = None
+    """측정 기록(tracing)에 사용할 검색기 이름. None 이면 retriever_1, retriever_2, ... 를 사용합니다."""
+
+    def _timeout(self, i: int) -> Optional[float]:
+        return self.timeouts[i] if self.timeouts else None
+
+    def _name(self, i: int) -> str:
+        return self.names[i] if self.names else f"retriever_{i+1}"
+
+    def _traced_invoke(
+        self, i: int, retriever: BaseRetriever, query: str, config: RunnableConfig
+    ) -> List[Document]:
+        with tracing.span(f"retrieve.{self._name(i)}") as span:
+            documents = retriever.invoke(query, config)
+            span.set(items=len(documents))
+        return documents
+
+    def rank_fusion(
+        self,
+        query: str,
+        run_manager: CallbackManagerForRetrieverRun,
+        *,
+        config: Optional[RunnableConfig] = None,
+    ) -> List[Document]:
+        with tracing.span("retrieve.ensemble") as span:
+            documents = self._rank_fusion(query, run_manager, config)
+            span.set(items=len(documents))
+        return documents
+
+    def _rank_fusion(
+        self,
+        query: str,
+        run_manager: CallbackManagerForRetrieverRun,
+        config: Optional[RunnableConfig],
+    ) -> List[Document]:
+        start = time.monotonic()
+        # 현재 요청의 측정 기록(trace)이 하위 검색기 스레드에도 이어지도록 context 를 복사해서 실행합니다.
+        futures = [
+            _retriever_executor.submit(
+                contextvars.copy_context().run,
+                self._traced_invoke,
+                i,
+                retriever,
+                query,
+                patch_config(
+                    config, callbacks=run_manager.get_child(tag=f"retriever_{i+1}")
+                ),
+            )
+            for i, retriever in enumerate(self.retrievers)
+        ]
+
+        retriever_docs, errors = [], []
+        for i, future in enumerate(futures):
+            timeout = self._timeout(i)
+            try:
+                retriever_docs.append(
+                    future.result(
+                        None if timeout is None else max(0.0, start + timeout - time.monotonic())
+                    )
+                )
+            except FutureTimeoutError:
+                # 스레드는 취소할 수 없으므로 백그라운드에서 끝나도록 두고 결과만 버립니다.
+                logger.warning("%s timed out after %.1fs", self._name(i), timeout)
+                tracing.count(f"retriever_timeouts_{self._name(i)}")
+                retriever_docs.append(None)
+            except Exception as e:
+                retriever_docs.append(self._failed(i, e, errors))
+
+        return self._fuse(retriever_docs, errors)
+
+    async def arank_fusion(
+        self,
+        query: str,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        *,
+        config: Optional[RunnableConfig] = None,
+    ) -> List[Document]:
+        async def run(i: int, retriever: BaseRetriever) -> Optional[List[Document]]:
+            try:
+                with tracing.span(f"retrieve.{self._name(i)}") as span:
+                    documents = await asyncio.wait_for(
+                        retriever.ainvoke(
+                            query,
+                            patch_config(
+                                config, callbacks=run_manager.get_child(tag=f"retriever_{i+1}")
+                            ),
+                        ),
+                        self._timeout(i),
+                    )
+                    span.set(items=len(documents))
+                    return documents
+            except asyncio.TimeoutError:
+                logger.warning("%s timed out after %.1fs", self._name(i), self._timeout(i))
+                tracing.count(f"retriever_timeouts_{self._name(i)}")
+                return None
+            except Exception as e:
+                return self._failed(i, e, errors)
+
+        errors: List[Exception] = []
+        retriever_docs = await asyncio.gather(
+            *(run(i, retriever) for i, retriever in enumerate(self.retrievers))
+        )
+        return self._fuse(list(retriever_docs), errors)
+
+    def _failed(self, i: int, error: Exception, errors: List[Exception]) -> None:
+        # 예외가 발생한 검색기(예: self-query 의 OpenAI 오류)는 제한 시간을 넘긴 검색기와 같이 결과에서 제외합니다.
+        logger.warning("%s failed: %s: %s", self._name(i), type(error).__name__, error)
+        tracing.count(f"retriever_errors_{self._name(i)}")
+        errors.append(error)
+        return None
+
+    def _fuse(
+        self, retriever_docs: List[Optional[List[Document]]], errors: Sequence[Exception] = ()
+    ) -> List[Document]:
+        if errors and all(docs is None for docs in retriever_docs):
+            raise errors[0]
+        # 제한 시간을 넘기거나 실패한 검색기(None)는 결과와 가중치 모두에서 제외합니다.
+        doc_lists, weights = [], []
+        for docs, weight in zip(retriever_docs, self.weights):
+            if docs is not None:
+                doc_lists.append(
+                    [Document(page_content=doc) if isinstance(doc, str) else doc for doc in docs]
+                )
+                weights.append(weight)
+        if len(weights) == len(self.weights):
+            return self.weighted_reciprocal_rank(doc_lists)
+        return self.copy(update={"weights": weights}).weighted_reciprocal_rank(doc_lists)
+
+
+_WORD_PATTERN = re.compile(r"\S+")
+_PIECE_PATTERN = re.compile(r"[0-9a-z]+|[가-힣]+")
+
+
+def korean_ngram_tokenize(text: str, n: int = 2) -> List[str]:
+    """
+    한국어에 적합한 BM25 토큰을 생성합니다.
+    공백 단위 단어 전체(URL, 닉네임 등 정확히 일치해야 하는 토큰)와, 단어 안의 영숫자 조각,
+    한글 조각의 글자 n-gram 을 함께 사용하므로 조사가 붙은 단어도 검색할 수 있습니다.
+
+    :param text: 토큰화할 문자열
+    :param n: 한글 n-gram 의 글자 수
+    :return: 토큰 목록
+    """
+    tokens = []
+    for word in _WORD_PATTERN.findall(text.lower()):
+        tokens.append(word)
+        for piece in _PIECE_PATTERN.findall(word):
+            if piece[0].isascii() or len(piece) <= n:
+                if piece != word:
+                    tokens.append(piece)
+            else:
+                tokens.extend(piece[i : i + n] for i in range(len(piece) - n + 1))
+    return tokens
+
+
+class InvertedIndex:
+    """
+    BM25 점수 계산을 위한 메모리 역색인입니다.
+
+    포스팅 목록은 단어별 리스트 대신 CSR 형태의 NumPy 배열(indptr, doc_ids, term_freqs)로 저장하며,
+    질의 시 각 단어의 포스팅을 한 번의 벡터 연산으로 점수 배열에 더합니다.
+    """
+
+    def __init__(self, texts: Iterable[str], k1: float = 1.5, b: float = 0.75, tokenizer=korean_ngram_tokenize):
+        """
+        :param texts: 색인할 문서 본문
+        :param k1: BM25 단어 빈도 포화 계수
+        :param b: BM25 문서 길이 정규화 계수
+        :param tokenizer: 문자열을 토큰 목록으로 바꾸는 함수
+        """
+        self.tokenizer = tokenizer
+        self.vocabulary: Dict[str, int] = {}
+        term_ids, doc_ids, term_freqs, doc_lengths = [], [], [], []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenizer(text))
+            doc_lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                term_ids.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                doc_ids.append(doc_id)
+                term_freqs.append(count)
+
+        # 단어 id 순으로 정렬하여 단어별 포스팅이 연속된 구간이 되도록 합니다.
+        term_ids = np.asarray(term_ids, dtype=np.int32)
+        order = np.argsort(term_ids, kind="stable")
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)[order]
+        self.term_freqs = np.asarray(term_freqs, dtype=np.float32)[order]
+        self.indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(self.vocabulary)), out=self.indptr[1:])
+
+        self.num_docs = len(doc_lengths)
+        doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+        average_length = float(doc_lengths.mean()) if self.num_docs else 0.0
+        self.k1 = k1
+        # 문서별 길이 정규화 항 k1 * (1 - b + b * dl / avgdl) 을 미리 계산해 둡니다.
+        self.length_norm = k1 * (1 - b + b * doc_lengths / max(average_length, 1e-9))
+
+    @property
+    def nbytes(self) -> int:
+        """
+        포스팅 배열과 단어 사전이 차지하는 대략적인 byte 수입니다.
+        """
+        arrays = self.doc_ids.nbytes + self.term_freqs.nbytes + self.indptr.nbytes + self.length_norm.nbytes
+        return arrays + sys.getsizeof(self.vocabulary) + sum(sys.getsizeof(term) for term in self.vocabulary)
+
+    def search(self, query: str, k: int) -> List[tuple]:
+        """
+        BM25 점수가 높은 문서를 찾습니다.
+
+        :param query: 질의 문자열
+        :param k: 반환할 문서 수
+        :return: 점수 내림차순으로 정렬된 (문서 번호, 점수) 목록
+        """
+        scores = np.zeros(self.num_docs, dtype=np.float32)
+        for term, query_count in Counter(self.tokenizer(query)).items():
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.indptr[term_id], self.indptr[term_id + 1]
+            doc_ids, tf = self.doc_ids[start:end], self.term_freqs[start:end]
+            document_frequency = end - start
+            idf = math.log(1 + (self.num_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+            scores[doc_ids] += query_count * idf * tf * (self.k1 + 1) / (tf + self.length_norm[doc_ids])
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in candidates]
+
+
+class KoreanBM25Retriever(BaseRetriever):
+    """
+    InvertedIndex 를 사용하는 BM25 검색기입니다. API 호출 없이 로컬에서만 동작합니다.
+    """
+
+    index: Any
+    documents: Any
+    """Document 목록 또는 MessageStore. MessageStore 이면 검색 결과 Document 만 만듭니다."""
+    search_kwargs: dict = {"k": 30}
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def __repr_args__(self):
+        # NOTE - 콜백 매니저가 검색할 때마다 검색기를 직렬화(repr)하므로, 전체 문서 목록 대신 개수만 표시합니다.
+        return [("documents", f"<{len(self.documents)} documents>"), ("search_kwargs", self.search_kwargs)]
+
+    def __eq__(self, other) -> bool:
+        # pydantic 의 기본 비교는 모든 문서를 dict 로 변환하므로, 같은 인스턴스인지만 비교합니다.
+        return self is other
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [
+            self.documents[doc_id]
+            for doc_id, _ in self.index.search(query, self.search_kwargs.get("k", 30))
+        ]
+
+
+class BM25RetrieverFactory(RetrieverFactory):
+    """
+    한국어 글자 n-gram BM25 검색기 생성자 클래스입니다. db 로 Document 목록 또는 MessageStore 를 받습니다.
+    """
+
+    def create(self, **kwargs) -> BaseRetriever:
+        if isinstance(self.db, MessageStore):
+            documents = self.db
+            texts = documents.texts()
+        else:
+            documents = list(self.db)
+            texts = (document.page_content for document in documents)
+        # 같은 문서로 만든 역색인이 있으면 재사용합니다 (여러 세션이 한 대화 파일을 공유하는 경우).
+        index = kwargs.get("index")
+        if index is None:
+            index = InvertedIndex(
+                texts,
+                k1=kwargs.get("k1", 1.5),
+                b=kwargs.get("b", 0.75),
+            )
+        bm25_retriever = KoreanBM25Retriever(
+            index=index,
+            documents=documents,
+            search_kwargs=kwargs.get("search_kwargs", {"k": 30}),
+        ).configurable_fields(
+            search_kwargs=ConfigurableField(
+                # 검색 매개변수의 고유 식별자를 설정합니다.
+                id="search_kwargs_bm25",
+                # 검색 매개변수의 이름을 설정합니다.
+                name="Search Kwargs",
+                # 검색 매개변수에 대한 설명을 작성합니다.
+                description="The search kwargs to use",
+            )
+        )
+        return bm25_retriever
+
+
 class EnsembleRetrieverFactory(RetrieverFactory):
     """
     앙상블 검색기 생성자 클래스입니다.
@@ -150,16 +591,31 @@ class EnsembleRetrieverFactory(RetrieverFactory):
         retrievers: List[BaseRetriever],
         weights: List[float],
         search_type: str = "mmr",
+        parallel: bool = True,
+        timeouts: Optional[List[Optional[float]]] = None,
+        names: Optional[List[str]] = None,
         **kwargs
     ) -> BaseRetriever:
         if not retrievers or not weights or len(retrievers) != len(weights):
             raise ValueError(
                 "Retrievers and weights must be non-empty lists of equal length."
             )
+        if timeouts is not None and len(timeouts) != len(retrievers):
+            raise ValueError("Timeouts must have the same length as retrievers.")
 
-        ensemble_retriever = EnsembleRetriever(
-            retrievers=retrievers,
-            weights=weights,
-            search_type=search_type,
-        )
+        if parallel:
+            # 하위 검색기를 동시에 실행하고, 제한 시간을 넘긴 검색기는 제외합니다.
+            ensemble_retriever = ParallelEnsembleRetriever(
+                retrievers=retrievers,
+                weights=weights,
+                search_type=search_type,
+                timeouts=timeouts,
+                names=names,
+            )
+        else:
+            ensemble_retriever = EnsembleRetriever(
+                retrievers=retrievers,
+                weights=weights,
+                search_type=search_type,
+            )
         return ensemble_retriever
@@ -0,0 +1,188 @@
+"""
+카톡GPT 를 Streamlit 없이 HTTP API 로 제공하는 비동기 서버입니다.
+
+    uvicorn server:create_app --factory --host 0.0.0.0 --port 8000
+
+- POST /chats?file_name=chat.txt : 요청 본문의 대화 파일(TXT/CSV)을 인덱싱하고 chat_key 를 반환합니다.
+- POST /chats/{chat_key}/ask     : {"question": ...} 의 답변을 server-sent events 로 스트리밍합니다.
+                                   token 이벤트로 답변 조각을, 마지막 done 이벤트로 전체 답변/행 범위/소요 시간을 보냅니다.
+- GET  /metrics                  : 누적 측정값 (Prometheus 텍스트 형식)
+
+OpenAI API 키는 Authorization: Bearer <키> 헤더로 전달하며, 없으면 OPENAI_API_KEY 환경변수를 사용합니다.
+OPENAI_BASE_URL 환경변수로 OpenAI 호환 서버(예: tests/fake_openai_server.py)를 지정하면 API 비용 없이 부하 테스트를 할 수 있습니다.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import weakref
+from typing import AsyncIterator, Callable, Dict, Optional
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from langchain_core.embeddings import Embeddings
+from pydantic import BaseModel, Field
+
+import embeddings as embeddings_lib
+import pipeline
+import tracing
+from answer_cache import SemanticAnswerCache, get_answer_cache
+from embeddings import _tiktoken_counter
+from index_manager import IndexManager, get_index_manager
+from index_store import file_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# 업로드할 수 있는 대화 파일 확장자
+FILE_SUFFIXES = (".txt", ".csv")
+# chat_key 는 file_fingerprint 가 만든 sha256 16진수 문자열입니다 (인덱스 경로로 사용되므로 다른 값은 받지 않습니다).
+_CHAT_KEY_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class AskRequest(BaseModel):
+    question: str = Field(min_length=1)
+
+
+def create_app(
+    index_manager: Optional[IndexManager] = None,
+    answer_cache: Optional[SemanticAnswerCache] = None,
+    api_key: Optional[str] = None,
+    base_url: Optional[str] = None,
+    embedding_factory: Optional[Callable[[str], Dict[str, Embeddings]]] = None,
+    max_context_tokens: int = pipeline.MAX_CONTEXT_TOKENS,
+) -> FastAPI:
+    """
+    HTTP API 서버를 생성합니다. 불러온 인덱스와 답변 캐시는 Streamlit 앱과 같은 프로세스 공유 객체를 기본으로 사용합니다.
+
+    :param index_manager: 인덱스 관리자 (기본값은 get_index_manager())
+    :param answer_cache: 답변 캐시 (기본값은 get_answer_cache())
+    :param api_key: Authorization 헤더가 없을 때 사용할 OpenAI API 키 (기본값은 OPENAI_API_KEY 환경변수)
+    :param base_url: OpenAI 호환 서버 주소 (기본값은 OPENAI_BASE_URL 환경변수, 없으면 OpenAI)
+    :param embedding_factory: API 키를 받아 {"faiss": 임베딩, "chroma": 임베딩} 을 만드는 함수
+                              (기본값은 캐시된 OpenAI 임베딩)
+    :param max_context_tokens: context 에 넣을 최대 토큰 수
+    :return: FastAPI 앱
+    """
+    if index_manager is None:
+        index_manager = get_index_manager()
+    # 빈 답변 캐시는 len 이 0 이므로 or 대신 None 인지 확인합니다.
+    if answer_cache is None:
+        answer_cache = get_answer_cache()
+    default_api_key = api_key or os.environ.get("OPENAI_API_KEY")
+    base_url = base_url or os.environ.get("OPENAI_BASE_URL")
+    if embedding_factory is None:
+
+        def embedding_factory(key: str) -> Dict[str, Embeddings]:
+            return embeddings_lib.embedding_factory(api_key=key, base_url=base_url)
+
+    index_store = index_manager.index_store
+    # 같은 파일이 동시에 업로드되어도 한 번만 인덱싱합니다. 잠금은 기다리는 요청이 있는 동안만 유지되고,
+    # 인덱싱이 끝나 참조가 사라지면 자동으로 삭제됩니다.
+    index_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    app = FastAPI(title="카톡GPT")
+    app.state.index_locks = index_locks
+
+    def openai_api_key(authorization: Optional[str] = Header(None)) -> str:
+        scheme, _, key = (authorization or "").partition(" ")
+        if scheme.lower() == "bearer" and key.strip():
+            return key.strip()
+        if default_api_key:
+            return default_api_key
+        raise HTTPException(status_code=401, detail="Authorization: Bearer <OpenAI API 키> 헤더가 필요합니다.")
+
+    def index_chat(chat_key: str, data: bytes, file_name: str, embeddings: Dict[str, Embeddings]) -> None:
+        faiss, chroma = pipeline.load_or_index(index_store, chat_key, data, file_name, embeddings)
+        index_manager.add(chat_key, faiss, chroma)
+
+    @app.post("/chats")
+    async def upload_chat(request: Request, file_name: str, api_key: str = Depends(openai_api_key)) -> dict:
+        """
+        요청 본문의 대화 파일을 인덱싱합니다. 같은 파일의 인덱스가 이미 있으면 다시 인덱싱하지 않으며,
+        응답의 created 는 이 요청에서 새로 인덱싱했는지 여부입니다.
+        """
+        _, file_suffix = os.path.splitext(file_name)
+        if file_suffix not in FILE_SUFFIXES:
+            raise HTTPException(status_code=400, detail=f"지원하지 않는 파일 형식입니다: {file_name}")
+        data = await request.body()
+        if not data:
+            raise HTTPException(status_code=400, detail="대화 파일 내용이 비어 있습니다.")
+
+        chat_key = file_fingerprint(data, file_suffix)
+        index_lock = index_locks.get(chat_key)
+        if index_lock is None:
+            index_lock = index_locks[chat_key] = asyncio.Lock()
+        async with index_lock:
+            created = not await asyncio.to_thread(index_store.exists, chat_key)
+            if created:
+                # 파싱/임베딩/인덱스 생성은 동기 코드이므로 스레드에서 실행하여 다른 요청을 막지 않습니다.
+                await asyncio.to_thread(index_chat, chat_key, data, file_name, embedding_factory(api_key))
+        manifest = await asyncio.to_thread(index_store.manifest, chat_key)
+        return {"chat_key": chat_key, "file_name": file_name, "created": created, "users": manifest.get("users")}
+
+    @app.post("/chats/{chat_key}/ask")
+    async def ask(chat_key: str, body: AskRequest, api_key: str = Depends(openai_api_key)) -> StreamingResponse:
+        """
+        질문의 답변을 server-sent events 로 스트리밍합니다.
+        """
+        if not _CHAT_KEY_PATTERN.fullmatch(chat_key) or not await asyncio.to_thread(index_store.exists, chat_key):
+            raise HTTPException(status_code=404, detail=f"인덱싱된 대화 파일이 없습니다: {chat_key}")
+        return StreamingResponse(
+            answer_events(chat_key, body.question, api_key),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def answer_events(chat_key: str, question: str, api_key: str) -> AsyncIterator[str]:
+        start = time.perf_counter()
+        embeddings = embedding_factory(api_key)
+        try:
+            # 같은 대화 파일에 대해 비슷한 질문의 답변이 있으면 LLM 호출 없이 재사용합니다.
+            with tracing.span("answer_cache.lookup"):
+                question_vector = await embeddings["faiss"].aembed_query(question)
+                cached_answer = answer_cache.lookup(chat_key, question_vector)
+            if cached_answer is not None:
+                yield _event("token", {"token": cached_answer})
+                yield _event("done", {"answer": cached_answer, "rows": [], "timings": {}, "cached": True})
+                tracing.observe("answer", time.perf_counter() - start, cached=True)
+                return
+
+            # 답변을 스트리밍하는 동안에는 인덱스를 메모리에서 내보내지 않습니다.
+            result = None
+            first_token = True
+            async with index_manager.ause(chat_key, embeddings) as chat:
+                chat_pipeline = pipeline.ChatPipeline.for_chat(chat, embeddings, api_key, base_url, max_context_tokens)
+                async for event in chat_pipeline.astream(question):
+                    if "token" not in event:
+                        result = event
+                        continue
+                    if first_token:
+                        first_token = False
+                        tracing.observe("llm.first_token", time.perf_counter() - start)
+                    yield _event("token", event)
+            answer_cache.store(chat_key, question_vector, result["answer"])
+            tracing.count("llm_completion_tokens", _tiktoken_counter()(result["answer"]))
+            tracing.observe("answer", time.perf_counter() - start, cached=False)
+            yield _event("done", {**result, "cached": False})
+        except Exception as e:
+            # 응답 헤더를 이미 보냈으므로 오류도 이벤트로 전달합니다.
+            logger.exception("failed to answer question for %s", chat_key)
+            tracing.count("server_errors")
+            yield _event("error", {"error": f"{type(e).__name__}: {e}"})
+
+    @app.get("/metrics")
+    async def metrics() -> PlainTextResponse:
+        return PlainTextResponse(tracing.tracer.prometheus_text(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/healthz")
+    async def healthz() -> dict:
+        return {"status": "ok", "index": index_manager.stats()}
+
+    return app
+
+
+def _event(name: str, data: dict) -> str:
+    # json.dumps 는 줄바꿈을 이스케이프하므로 data 는 항상 한 줄입니다.
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,364 @@
+import hashlib
+import json
+import os
+import re
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain.chains.query_constructor.ir import Comparator, Comparison, Operation, Operator
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+import clients
+import prompt as prmpt
+import tracing
+from message_store import MessageStore
+from metadata_index import MetadataIndex
+from query_parser import KoreanQueryParser
+
+# 인덱스 디렉토리(<root>/<key>/) 안에 저장할 요약 파일
+SUMMARY_FILE = "summaries.json"
+SUMMARY_VERSION = 1
+# 요약 단위 (긴 기간부터)
+LEVELS = ("month", "week", "day")
+
+# (요약할 텍스트 목록, 기간 이름) 을 받아 요약문을 반환하는 함수
+Summarizer = Callable[[List[str], str], str]
+
+# 특정 대화가 아니라 기간 전체의 흐름을 묻는 질문
+_BROAD_PATTERN = re.compile(
+    r"요약|(?:대화|얘기|이야기|내용)[을를은는]?\s*정리"
+    r"|(?:무슨|어떤|뭔)\s*(?:얘기|이야기|대화|주제|일)|뭐\s*(?:얘기|이야기)"
+    r"|주요\s*(?:내용|주제|이슈)|전반적"
+)
+# KoreanQueryParser 가 LLM 에 맡기는 주 단위 표현 중, 요약 색인으로 바로 처리할 수 있는 표현
+_WEEK_PATTERN = re.compile(r"(이번|지난|저번)\s*주(?!말)")
+
+
+class LLMSummarizer:
+    """
+    OpenAI 채팅 모델로 기간별 대화를 요약합니다.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, model: str = "gpt-3.5-turbo"):
+        """
+        :param api_key: OpenAI API 키
+        :param base_url: OpenAI 호환 서버 주소 (기본값은 OpenAI)
+        :param model: 요약에 사용할 모델
+        """
+        llm = clients.get_chat_model(api_key, model=model, temperature=0, base_url=base_url)
+        self.chain = prmpt.summary_prompt() | llm | StrOutputParser()
+
+    def __call__(self, texts: List[str], period: str) -> str:
+        return self.chain.invoke({"period": period, "text": "\n\n".join(texts)})
+
+
+class SummaryIndex:
+    """
+    대화를 일/주/월 단위로 미리 요약해 둔 보조 색인입니다.
+
+    일 요약은 그날 시작한 청크로, 주/월 요약은 그 기간의 일 요약으로 만듭니다. 한 번에 요약할 텍스트가
+    max_input_chars 를 넘으면 나누어 요약한 뒤 다시 요약하므로, 대화가 길어져도 요약 호출 하나의 입력 크기는
+    일정합니다. 요약마다 입력의 해시를 저장해 두어, 다시 만들 때 입력이 바뀐 기간만 요약합니다.
+    """
+
+    def __init__(self, entries: Sequence[dict]):
+        """
+        :param entries: {"level", "start", "end", "label", "digest", "text"} 목록 (start/end 는 YYYY-MM-DD, end 포함)
+        """
+        self.entries = sorted(entries, key=lambda entry: (LEVELS.index(entry["level"]), entry["start"]))
+        self._levels: Dict[str, List[dict]] = {level: [] for level in LEVELS}
+        for entry in self.entries:
+            self._levels[entry["level"]].append(entry)
+        self._starts = {
+            level: np.array([entry["start"] for entry in entries], dtype="datetime64[D]")
+            for level, entries in self._levels.items()
+        }
+        self._ends = {
+            level: np.array([entry["end"] for entry in entries], dtype="datetime64[D]")
+            for level, entries in self._levels.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @classmethod
+    def build(
+        cls,
+        store: MessageStore,
+        summarizer: Summarizer,
+        previous: Optional["SummaryIndex"] = None,
+        max_input_chars: int = 12000,
+        on_progress: Optional[Callable[[int, int], None]] = None,
+    ) -> "SummaryIndex":
+        """
+        MessageStore 의 청크로 일/주/월 요약을 만듭니다.
+
+        :param store: 인덱싱된 청크 저장소 (date 메타데이터가 있어야 합니다)
+        :param summarizer: (텍스트 목록, 기간 이름) -> 요약문 함수 (예: LLMSummarizer)
+        :param previous: 이전에 만든 요약 색인. 입력이 같은 기간의 요약은 다시 만들지 않습니다.
+        :param max_input_chars: 요약 호출 하나에 넣을 최대 글자 수
+        :param on_progress: 진행 상황 콜백 (완료한 기간 수, 전체 기간 수)
+        :return: 요약 색인
+        """
+        reusable = {}
+        if previous is not None:
+            reusable = {(entry["level"], entry["start"], entry["digest"]): entry["text"] for entry in previous.entries}
+        metadata_index = MetadataIndex(store)
+        days, first = np.unique(metadata_index.sorted_dates.astype("datetime64[D]"), return_index=True)
+        bounds = np.append(first, len(metadata_index.order))
+
+        weeks: Dict[date, List[dict]] = {}
+        months: Dict[date, List[dict]] = {}
+        for day in days.tolist():
+            weeks.setdefault(day - timedelta(days=day.weekday()), [])
+            months.setdefault(day.replace(day=1), [])
+        total = len(days) + len(weeks) + len(months)
+        done = 0
+
+        def summarize(level: str, start: date, end: date, label: str, texts: List[str]) -> dict:
+            nonlocal done
+            digest = hashlib.sha256("\0".join(texts).encode("utf-8")).hexdigest()
+            text = reusable.get((level, start.isoformat(), digest))
+            if text is None:
+                with tracing.span("summary.build", level=level, chars=sum(map(len, texts))):
+                    text = _reduce(summarizer, texts, label, max_input_chars)
+                tracing.count("summaries_generated")
+            else:
+                tracing.count("summaries_reused")
+            done += 1
+            if on_progress is not None:
+                on_progress(done, total)
+            return {
+                "level": level,
+                "start": start.isoformat(),
+                "end": end.isoformat(),
+                "label": label,
+                "digest": digest,
+                "text": text,
+            }
+
+        entries = []
+        for i, day in enumerate(days.tolist()):
+            rows = metadata_index.order[bounds[i] : bounds[i + 1]]
+            entry = summarize("day", day, day, day.isoformat(), [store.text(row) for row in rows.tolist()])
+            entries.append(entry)
+            weeks[day - timedelta(days=day.weekday())].append(entry)
+            months[day.replace(day=1)].append(entry)
+
+        # 주/월 요약은 그 기간의 일 요약을 다시 요약합니다.
+        for start, day_entries in weeks.items():
+            end = start + timedelta(days=6)
+            label = f"{start.isoformat()} ~ {end.isoformat()} 주간"
+            entries.append(summarize("week", start, end, label, _labeled(day_entries)))
+        for start, day_entries in months.items():
+            end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            label = f"{start.year}년 {start.month}월"
+            entries.append(summarize("month", start, end, label, _labeled(day_entries)))
+        return cls(entries)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["SummaryIndex"]:
+        """
+        인덱스 디렉토리에 저장된 요약 색인을 불러옵니다.
+
+        :param path: 인덱스 디렉토리 (IndexStore.path(key))
+        :return: 요약 색인 (없으면 None)
+        """
+        file_path = os.path.join(path, SUMMARY_FILE)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, encoding="utf8") as f:
+            data = json.load(f)
+        if data.get("version") != SUMMARY_VERSION:
+            return None
+        return cls(data["entries"])
+
+    def save(self, path: str) -> None:
+        """
+        요약 색인을 인덱스 디렉토리에 저장합니다.
+
+        :param path: 인덱스 디렉토리 (IndexStore.path(key))
+        """
+        file_path = os.path.join(path, SUMMARY_FILE)
+        with open(file_path + ".tmp", "w", encoding="utf8") as f:
+            json.dump({"version": SUMMARY_VERSION, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(file_path + ".tmp", file_path)
+
+    def find(
+        self,
+        level: str,
+        year: Optional[int] = None,
+        month: Optional[int] = None,
+        day: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        기간이 year/month/day 와 겹치는 요약을 찾습니다. 빠진 값은 모든 값과 일치합니다.
+
+        :param level: "day", "week", "month"
+        :return: 시작일 순서의 요약 목록
+        """
+        # 주 요약은 두 달(또는 두 해)에 걸칠 수 있으므로 시작일이나 종료일 중 하나가 일치하면 됩니다.
+        mask = _matches(self._starts[level], year, month, day) | _matches(self._ends[level], year, month, day)
+        return [self._levels[level][i] for i in np.flatnonzero(mask)]
+
+    def week(self, start: date) -> List[dict]:
+        """
+        start(월요일)부터 시작하는 주의 주간 요약과 일 요약을 찾습니다.
+        """
+        start = np.datetime64(start, "D")
+        weeks = [self._levels["week"][i] for i in np.flatnonzero(self._starts["week"] == start)]
+        days = self._starts["day"]
+        in_week = np.flatnonzero((days >= start) & (days < start + np.timedelta64(7, "D")))
+        return weeks + [self._levels["day"][i] for i in in_week]
+
+    @staticmethod
+    def documents(entries: Sequence[dict]) -> List[Document]:
+        """
+        요약을 context 에 넣을 Document 로 변환합니다. 원본 행 정보(row)가 없으므로 ContextPacker 는
+        요약을 주어진 순서대로 이어 붙입니다.
+        """
+        return [
+            Document(
+                page_content=f"[{entry['label']} 요약]\n{entry['text']}",
+                metadata={"summary": entry["level"], "start": entry["start"], "end": entry["end"]},
+            )
+            for entry in entries
+        ]
+
+
+class SummaryRouter:
+    """
+    '이번 달 대화 요약해줘', '작년에 무슨 얘기 했어' 처럼 기간 전체를 묻는 질문을 요약 색인으로 보냅니다.
+
+    요약을 묻는 표현과 함께 날짜 범위(또는 '이번 주', '지난주')가 있는 질문만 처리하며, 날짜 범위에 맞는 요약을
+    최대 max_documents 개만 사용하므로 대화 길이와 관계없이 context 크기가 일정합니다.
+    기간이 없는 주제 질문, 특정 사용자를 묻거나 날짜 범위를 확신할 수 없는 질문은 기존 검색기가 처리합니다.
+    """
+
+    def __init__(
+        self,
+        summary_index: SummaryIndex,
+        query_parser: KoreanQueryParser,
+        max_documents: int = 12,
+        today: Optional[date] = None,
+    ):
+        """
+        :param summary_index: 요약 색인
+        :param query_parser: 날짜 표현을 해석할 규칙 기반 파서
+        :param max_documents: context 에 넣을 최대 요약 수
+        :param today: '이번 주', '지난주' 의 기준 날짜 (기본값은 실행 시점의 날짜)
+        """
+        self.summary_index = summary_index
+        self.query_parser = query_parser
+        self.max_documents = max_documents
+        self.today = today
+
+    def route(self, question: str) -> Optional[List[Document]]:
+        """
+        질문이 기간 요약 질문이면 해당 기간의 요약을 반환합니다.
+
+        :param question: 사용자 질문
+        :return: 긴 기간부터 시작일 순서로 정렬된 요약 Document.
+                 요약 질문이 아니거나, 날짜 범위를 해석할 수 없거나, 요약이 없으면 None
+        """
+        if not _BROAD_PATTERN.search(question):
+            return None
+        week = _WEEK_PATTERN.search(question)
+        if week is not None:
+            today = self.today or date.today()
+            start = today - timedelta(days=today.weekday() + (0 if week.group(1) == "이번" else 7))
+            entries = self.summary_index.week(start)[: self.max_documents]
+        else:
+            structured_query = self.query_parser.parse(question)
+            fields = _filter_fields(structured_query.filter) if structured_query is not None else None
+            if fields is None or "user" in fields:
+                return None
+            year, month, day = (fields.get(key) for key in ("year", "month", "day"))
+            # '링크 요약해줘' 처럼 기간이 없는 질문은 주제 검색이 필요하므로 검색기에 맡깁니다.
+            if year is None and month is None and day is None:
+                return None
+            if day is not None:
+                entries = self._limit(self.summary_index.find("day", year, month, day))
+            elif month is not None:
+                # 월 요약과 그 달의 주간 요약
+                entries = self._limit(
+                    self.summary_index.find("month", year, month), self.summary_index.find("week", year, month)
+                )
+            else:
+                entries = self._limit(self.summary_index.find("month", year))
+        if not entries:
+            return None
+        tracing.count("summary_route_hits")
+        return self.summary_index.documents(entries)
+
+    def as_runnable(self, default: Runnable) -> Runnable:
+        """
+        요약 질문이면 요약을, 아니면 default 검색 결과를 반환하는 Runnable 을 생성합니다.
+
+        :param default: 질문 문자열을 받아 Document 목록을 반환하는 검색기
+        :return: default 대신 사용할 Runnable
+        """
+
+        def route_or_retrieve(question: str, config: RunnableConfig) -> List[Document]:
+            documents = self.route(question)
+            if documents is None:
+                return default.invoke(question, config)
+            return documents
+
+        return RunnableLambda(route_or_retrieve, name="SummaryRouter")
+
+    def _limit(self, coarse: List[dict], fine: Sequence[dict] = ()) -> List[dict]:
+        # 긴 기간 요약을 먼저 넣고, 남은 자리에 최근 짧은 기간 요약을 채웁니다.
+        coarse = coarse[-self.max_documents :]
+        remaining = self.max_documents - len(coarse)
+        return coarse + (list(fine[-remaining:]) if remaining > 0 else [])
+
+
+def _reduce(summarizer: Summarizer, texts: List[str], label: str, max_input_chars: int) -> str:
+    # 입력이 max_input_chars 를 넘으면 나누어 요약한 뒤, 부분 요약을 다시 요약합니다.
+    groups: List[List[str]] = [[]]
+    size = 0
+    for text in texts:
+        if groups[-1] and size + len(text) > max_input_chars:
+            groups.append([])
+            size = 0
+        groups[-1].append(text)
+        size += len(text)
+    if len(groups) == 1:
+        return summarizer(texts, label)
+    partials = [summarizer(group, f"{label} ({i}/{len(groups)})") for i, group in enumerate(groups, start=1)]
+    return _reduce(summarizer, partials, label, max_input_chars)
+
+
+def _labeled(entries: Sequence[dict]) -> List[str]:
+    return [f"[{entry['label']}]\n{entry['text']}" for entry in entries]
+
+
+def _matches(dates: np.ndarray, year: Optional[int], month: Optional[int], day: Optional[int]) -> np.ndarray:
+    # datetime64[D] 배열 중 연/월/일이 모두 일치하는 위치 (None 은 모든 값과 일치)
+    mask = np.ones(len(dates), dtype=bool)
+    if year is not None:
+        mask &= dates.astype("datetime64[Y]").astype(int) + 1970 == year
+    if month is not None:
+        mask &= dates.astype("datetime64[M]").astype(int) % 12 + 1 == month
+    if day is not None:
+        mask &= (dates - dates.astype("datetime64[M]")).astype(int) + 1 == day
+    return mask
+
+
+def _filter_fields(query_filter) -> Optional[dict]:
+    # year/month/day/user 의 EQ 비교와 AND 로 된 필터를 {속성: 값} 으로 변환합니다.
+    if query_filter is None:
+        return {}
+    comparisons = query_filter.arguments if isinstance(query_filter, Operation) else [query_filter]
+    if isinstance(query_filter, Operation) and query_filter.operator != Operator.AND:
+        return None
+    fields = {}
+    for comparison in comparisons:
+        if not isinstance(comparison, Comparison) or comparison.comparator != Comparator.EQ:
+            return None
+        fields[comparison.attribute] = comparison.value
+    return fields
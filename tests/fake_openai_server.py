@@ -0,0 +1,203 @@
+"""
+테스트와 부하 테스트에서 사용하는 로컬 가짜 OpenAI 호환 서버입니다.
+
+    python tests/fake_openai_server.py --port 8001 --latency 0.2 --max-concurrent 4
+
+로 직접 실행하거나, 테스트에서는 FakeOpenAIServer 를 컨텍스트 매니저로 사용합니다.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+def fake_embedding(text: str, size: int) -> np.ndarray:
+    # 텍스트 해시를 시드로 사용하여 항상 같은 벡터를 만듭니다.
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+    return np.random.default_rng(seed).standard_normal(size).astype(np.float32)
+
+
+class FakeOpenAIServer:
+    """
+    /v1/embeddings 요청에 결정적인 벡터를, /v1/chat/completions 요청에 고정된 답변을 응답하는 서버입니다.
+    chat completions 는 stream=True 요청이면 SSE 로 답변을 나누어 보냅니다.
+
+    :param latency: 요청마다 추가할 지연 시간(초)
+    :param max_concurrent: 동시에 처리 중인 요청이 이 값을 넘으면 429 를 응답합니다 (None 이면 제한 없음)
+    :param size: 임베딩 차원
+    :param reply: chat completions 답변
+    :param token_latency: 스트리밍 토큰 사이의 지연 시간(초)
+    """
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.0,
+        max_concurrent=None,
+        size: int = 16,
+        reply: str = "💬대화:\n- 가짜 답변입니다. `2024-03-27 10:55`",
+        token_latency: float = 0.0,
+    ):
+        self.latency = latency
+        self.max_concurrent = max_concurrent
+        self.size = size
+        self.reply = reply
+        self.token_latency = token_latency
+        # 받은 chat completions 요청 본문
+        self.chat_requests = []
+        # 요청 통계
+        self.requests = 0
+        self.rate_limited = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_stream(self, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                for chunk in chunks:
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(server.token_latency)
+                self.wfile.write(b"data: [DONE]\n\n")
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.requests += 1
+                    if server.max_concurrent is not None and server.in_flight >= server.max_concurrent:
+                        server.rate_limited += 1
+                        limited = True
+                    else:
+                        limited = False
+                        server.in_flight += 1
+                        server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                if limited:
+                    self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}})
+                    return
+                try:
+                    time.sleep(server.latency)
+                    if self.path.endswith("/embeddings"):
+                        self._send_json(200, server.embeddings_response(request))
+                    elif self.path.endswith("/chat/completions"):
+                        with server._lock:
+                            server.chat_requests.append(request)
+                        if request.get("stream"):
+                            self._send_stream(server.chat_chunks(request))
+                        else:
+                            self._send_json(200, server.chat_response(request))
+                    else:
+                        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+        return Handler
+
+    def embeddings_response(self, request: dict) -> dict:
+        inputs = request["input"]
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = []
+        for i, text in enumerate(inputs):
+            if not isinstance(text, str):
+                text = json.dumps(text)
+            vector = fake_embedding(text, self.size)
+            if request.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        tokens = sum(len(text) for text in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "fake"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def chat_response(self, request: dict) -> dict:
+        tokens = len(self.reply)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [
+                {"index": 0, "message": {"role": "assistant", "content": self.reply}, "finish_reason": "stop"}
+            ],
+            "usage": {"prompt_tokens": 0, "completion_tokens": tokens, "total_tokens": tokens},
+        }
+
+    def chat_chunks(self, request: dict):
+        # 답변을 몇 글자씩 나누어 chat.completion.chunk 로 보냅니다.
+        base = {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+        }
+        for start in range(0, len(self.reply), 4):
+            delta = {"content": self.reply[start : start + 4]}
+            if start == 0:
+                delta["role"] = "assistant"
+            yield {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="로컬 가짜 OpenAI 호환 서버")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--max-concurrent", type=int, default=None)
+    parser.add_argument("--size", type=int, default=1536)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(
+        args.port, args.latency, args.max_concurrent, args.size, token_latency=args.token_latency
+    ) as fake:
+        print(f"Fake OpenAI server listening on {fake.base_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
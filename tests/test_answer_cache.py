@@ -0,0 +1,45 @@
+from answer_cache import SemanticAnswerCache, replay_answer
+
+
+def test_lookup_returns_answer_for_similar_question():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store("chat-a", [1.0, 0.0, 0.0], "💬대화:\n- 링크 정리")
+
+    assert cache.lookup("chat-a", [0.99, 0.05, 0.0]) == "💬대화:\n- 링크 정리"
+    # 다른 질문이나 다른 대화 파일에는 적중하지 않습니다.
+    assert cache.lookup("chat-a", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("chat-b", [1.0, 0.0, 0.0]) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_entries_expire_and_are_evicted(monkeypatch):
+    import answer_cache
+
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(ttl=60, max_entries=2)
+
+    cache.store("chat-a", [1.0, 0.0], "A")
+    cache.store("chat-a", [0.0, 1.0], "B")
+    assert cache.lookup("chat-a", [1.0, 0.0]) == "A"
+    # 가장 오래 사용하지 않은 항목(B)이 삭제됩니다.
+    cache.store("chat-b", [1.0, 0.0], "C")
+    assert len(cache) == 2
+    assert cache.lookup("chat-a", [0.0, 1.0]) is None
+
+    now[0] += 61
+    assert cache.lookup("chat-a", [1.0, 0.0]) is None
+    assert len(cache) == 1
+
+
+def test_replay_answer():
+    class Handler:
+        tokens = []
+
+        def on_llm_new_token(self, token, **kwargs):
+            self.tokens.append(token)
+
+    handler = Handler()
+    replay_answer("- 링크 정리\n- `2024-03-27`", handler)
+    assert "".join(handler.tokens) == "- 링크 정리\n- `2024-03-27`"
+    assert len(handler.tokens) > 1
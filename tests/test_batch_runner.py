@@ -0,0 +1,54 @@
+import json
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from batch_runner import read_questions, run_batch, summarize
+from fake_openai_server import FakeOpenAIServer
+from pipeline import ChatPipeline
+
+
+def write_chat(path):
+    lines = ["LLM RAG Langchain 통합 님과 카카오톡 대화", "저장한 날짜 : 2024-03-28 22:00:00", ""]
+    for day in (26, 27, 28):
+        lines.append(f"--------------- 2024년 3월 {day}일 수요일 ---------------")
+        lines.append(f"[가나다] [오전 10:55] {day}일 링크 공유합니다 https://example.com/{day}")
+        lines.append(f"[J] [오후 1:00] {day}일 감사합니다")
+    path.write_text("\n".join(lines) + "\n", encoding="utf8")
+    return path
+
+
+def test_batch_runner_against_fake_server(tmp_path):
+    chat = write_chat(tmp_path / "chat.txt")
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text(
+        "\n".join(
+            json.dumps(record, ensure_ascii=False)
+            for record in [
+                {"request_id": "q-1", "title": "링크", "body": "3월 27일에 공유된 링크 알려줘"},
+                {"question": "감사 인사한 사람은?"},
+            ]
+        ),
+        encoding="utf8",
+    )
+    assert read_questions(str(questions))[1] == {"id": 2, "question": "감사 인사한 사람은?"}
+    embedding = DeterministicFakeEmbedding(size=16)
+
+    with FakeOpenAIServer() as server:
+        chat_pipeline = ChatPipeline.from_file(
+            str(chat),
+            api_key="sk-fake",
+            base_url=server.base_url,
+            index_root=str(tmp_path / "index"),
+            embeddings={"faiss": embedding, "chroma": embedding},
+        )
+        results = list(run_batch(chat_pipeline, read_questions(str(questions)), concurrency=2))
+
+    summary = summarize(results, elapsed=1.0)
+    assert summary["questions"] == 2 and summary["errors"] == 0
+    assert [result["id"] for result in results] == ["q-1", 2]
+    assert all(result["answer"] == server.reply for result in results)
+    assert all(result["rows"] for result in results)
+    assert set(results[0]["timings"]) == {"retrieve", "pack", "generate", "total"}
+    # context 에는 원본 메타데이터 대신 시각이 포함된 대화 라인이 들어갑니다.
+    prompts = [request["messages"][0]["content"] for request in server.chat_requests]
+    assert any("[2024-03-27 10:55] User: **, Message: 27일 링크 공유합니다" in prompt for prompt in prompts)
@@ -0,0 +1,76 @@
+import pytest
+from langchain_core.documents import Document
+from chunker import ConversationChunker
+
+
+def make_message(row, date, user, message):
+    year, month, day = map(int, date[:10].split("-"))
+    return Document(
+        page_content=f'"User: {user}, Message: {message}',
+        metadata={
+            "date": date,
+            "year": year,
+            "month": month,
+            "day": day,
+            "user": user,
+            "row": row,
+            "source": "dummy_path",
+        },
+    )
+
+
+@pytest.fixture
+def messages():
+    return [
+        make_message(0, "2024-03-27 10:55:00", "**나다", "안녕하세요"),
+        make_message(1, "2024-03-27 10:56:00", "**나다", "RAG관련해서 질문 해도될까요"),
+        make_message(2, "2024-03-27 11:00:00", "J", "Bge m3 모델이 잘합니다"),
+        make_message(3, "2024-03-27 11:01:00", "**나다", "감사합니다"),
+        # 1시간 이상 지난 메시지는 새로운 청크가 됩니다.
+        make_message(4, "2024-03-27 12:30:00", "***DE", "점심 뭐 드셨나요"),
+        # 날짜가 바뀌면 새로운 청크가 됩니다.
+        make_message(5, "2024-03-28 00:05:00", "***DE", "늦었네요"),
+    ]
+
+
+def test_split_documents_by_time_gap_and_day(messages):
+    chunks = ConversationChunker(max_gap_minutes=30).split_documents(messages)
+
+    assert len(chunks) == 3
+    assert chunks[0].page_content.splitlines() == [
+        "[2024-03-27 10:55] User: **나다, Message: 안녕하세요",
+        "[2024-03-27 10:56] User: **나다, Message: RAG관련해서 질문 해도될까요",
+        "[2024-03-27 11:00] User: J, Message: Bge m3 모델이 잘합니다",
+        "[2024-03-27 11:01] User: **나다, Message: 감사합니다",
+    ]
+    assert chunks[0].metadata == {
+        "date": "2024-03-27 10:55:00",
+        "date_end": "2024-03-27 11:01:00",
+        "year": 2024,
+        "month": 3,
+        "day": 27,
+        "user": "**나다",
+        "users": "**나다, J",
+        "row": 0,
+        "row_end": 3,
+        "source": "dummy_path",
+    }
+    assert [(c.metadata["row"], c.metadata["row_end"]) for c in chunks[1:]] == [(4, 4), (5, 5)]
+    assert chunks[2].metadata["day"] == 28
+
+
+def test_split_documents_by_turns_and_length(messages):
+    chunks = ConversationChunker(max_turns=1).split_documents(messages[:4])
+    assert [(c.metadata["row"], c.metadata["row_end"]) for c in chunks] == [(0, 2), (3, 3)]
+
+    chunks = ConversationChunker(chunk_size=60).split_documents(messages[:2])
+    assert len(chunks) == 2
+
+
+def test_split_oversized_message():
+    message = make_message(0, "2024-03-27 10:55:00", "J", "가나다라 " * 100)
+    chunks = ConversationChunker(chunk_size=100).split_documents([message])
+
+    assert len(chunks) > 1
+    assert all(len(chunk.page_content) <= 100 for chunk in chunks)
+    assert all(chunk.metadata["row"] == 0 for chunk in chunks)
@@ -0,0 +1,14 @@
+import clients
+
+
+def test_clients_share_connection_pool_per_api_key():
+    gpt4 = clients.get_chat_model("sk-test-a", model="gpt-4-turbo-preview", streaming=True)
+    gpt3 = clients.get_chat_model("sk-test-a", model="gpt-3-turbo", streaming=True)
+    embedding = clients.get_embeddings("sk-test-a")
+
+    # 같은 설정이면 같은 인스턴스를, 같은 API 키면 같은 HTTP 연결 풀을 사용합니다.
+    assert clients.get_chat_model("sk-test-a", model="gpt-4-turbo-preview", streaming=True) is gpt4
+    assert gpt4 is not gpt3
+    assert gpt4.http_client is gpt3.http_client is embedding.http_client
+    assert gpt4.http_client is not clients.get_http_client("sk-test-b")
+    assert gpt4.callbacks is None
@@ -0,0 +1,61 @@
+from langchain_core.documents import Document
+
+from context_packer import ContextPacker
+
+
+def chunk(row, row_end, *lines):
+    return Document(
+        page_content="\n".join(lines),
+        metadata={"row": row, "row_end": row_end, "source": "chat.txt"},
+    )
+
+
+def test_pack_dedupes_and_merges_adjacent_rows():
+    first = chunk(3, 4, "[2024-03-27 10:55] User: **나, Message: 안녕", "[2024-03-27 10:56] User: **다, Message: 링크")
+    second = chunk(5, 5, "[2024-03-27 10:58] User: **나, Message: 감사")
+    distant = chunk(40, 40, "[2024-03-28 09:00] User: **다, Message: 공지")
+    covered = chunk(4, 4, "[2024-03-27 10:56] User: **다, Message: 링크")
+
+    # 검색 순위 순서 (중복 포함)
+    context = ContextPacker(token_counter=len).pack([distant, second, first, second, covered])
+
+    assert context == (
+        "[2024-03-27 10:55] User: **나, Message: 안녕\n"
+        "[2024-03-27 10:56] User: **다, Message: 링크\n"
+        "[2024-03-27 10:58] User: **나, Message: 감사\n\n"
+        "[2024-03-28 09:00] User: **다, Message: 공지"
+    )
+
+
+def test_pack_keeps_pieces_that_share_a_row():
+    # 긴 메시지를 나눈 조각은 모두 같은 행 범위를 가집니다.
+    pieces = [chunk(7, 7, "가" * 998), chunk(7, 7, "나" * 995), chunk(7, 7, "다" * 443)]
+    # 여러 줄 메시지는 한 행이 여러 줄입니다.
+    multiline = chunk(8, 9, "[10:00] A: 첫 줄", "둘째 줄", "[10:01] B: 네")
+    covered = chunk(9, 9, "[10:01] B: 네")
+
+    packer = ContextPacker(token_counter=len)
+    selected = packer.select(pieces + [multiline, covered])
+    context = packer.pack(pieces + [multiline, covered])
+
+    # select 에서 예산을 쓴 조각은 빠짐없이 context 에 들어가고, 더 넓은 구간에 포함된 청크만 제외됩니다.
+    assert len(selected) == 4
+    assert context.split("\n") == [
+        "가" * 998,
+        "나" * 995,
+        "다" * 443,
+        "[10:00] A: 첫 줄",
+        "둘째 줄",
+        "[10:01] B: 네",
+    ]
+    # select 를 거치지 않아도 format 은 포함된 구간만 제외합니다.
+    assert packer.format(pieces + [multiline, covered]) == context
+
+
+def test_select_keeps_highest_ranked_within_budget():
+    documents = [chunk(i, i, f"메시지 {i}" * (3 if i == 1 else 1)) for i in range(5)]
+
+    selected = ContextPacker(max_tokens=20, token_counter=len, separator="\n").select(documents)
+
+    # 예산(20자)을 넘는 1번 청크는 건너뛰고, 순위대로 들어가는 청크만 선택합니다.
+    assert [document.metadata["row"] for document in selected] == [0, 2, 3]
@@ -0,0 +1,145 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from embeddings import CachedEmbeddings, EmbeddingStore
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """임베딩된 텍스트를 기록하는 가짜 임베딩"""
+
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return EmbeddingStore(str(tmp_path / "embeddings.sqlite3"))
+
+
+def test_cached_embeddings_embeds_each_text_once(store):
+    underlying = CountingEmbedding(size=8, calls=[])
+    faiss_embedder = CachedEmbeddings(underlying, store, model="fake")
+    chroma_embedder = CachedEmbeddings(underlying, store, model="fake")
+
+    first = faiss_embedder.embed_documents(["안녕하세요", "감사합니다", "안녕하세요"])
+    second = chroma_embedder.embed_documents(["감사합니다", "안녕하세요"])
+
+    # 중복 텍스트와 다른 소비자의 요청은 캐시에서 처리됩니다.
+    assert underlying.calls == [["안녕하세요", "감사합니다"]]
+    assert second == [first[1], first[0]]
+    assert first[0] == pytest.approx(underlying.embed_query("안녕하세요"), abs=1e-6)
+    assert (faiss_embedder.hits, faiss_embedder.misses) == (1, 2)
+    assert (chroma_embedder.hits, chroma_embedder.misses) == (2, 0)
+
+    # 모델이 다르면 캐시 키도 달라집니다.
+    CachedEmbeddings(underlying, store, model="other").embed_query("안녕하세요")
+    assert underlying.calls[-1] == ["안녕하세요"]
+    assert len(store) == 3
+
+
+def test_store_persists_and_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    # 벡터 하나는 4 * 4 = 16 byte, 최대 3개까지 저장됩니다.
+    store = EmbeddingStore(path, max_bytes=48)
+    store.mset([(b"a", [1, 2, 3, 4]), (b"b", [5, 6, 7, 8]), (b"c", [0, 0, 0, 1])])
+    store.mget([b"a"])
+    store.mset([(b"d", [1, 1, 1, 1])])
+
+    assert store.size_bytes <= 48
+    vectors = EmbeddingStore(path, max_bytes=48).mget([b"a", b"b", b"d"])
+    assert vectors[0].tolist() == [1, 2, 3, 4]
+    assert vectors[1] is None
+    assert vectors[2].tolist() == [1, 1, 1, 1]
+
+
+def test_store_rolls_back_failed_writes(store):
+    store.mset([(b"a", [1, 2, 3, 4])])
+    with pytest.raises(ValueError):
+        store.mset([(b"b", [5, 6, 7, 8]), (b"c", ["벡터가 아님"])])
+
+    # 실패한 쓰기는 모두 취소되고, 같은 연결로 계속 읽고 쓸 수 있습니다.
+    assert store.size_bytes == 16
+    store.mset([(b"d", [1, 1, 1, 1])])
+    assert [vector is not None for vector in store.mget([b"a", b"b", b"d"])] == [True, False, True]
+
+
+def test_pipeline_batches_by_tokens():
+    from embeddings import EmbeddingPipeline
+
+    pipeline = EmbeddingPipeline(
+        DeterministicFakeEmbedding(size=8), max_batch_tokens=10, max_batch_size=3, token_counter=len
+    )
+    assert pipeline.batches(["aaaa", "bbbb", "cc", "d", "e", "f", "gggggggggggg"]) == [
+        (0, 3),
+        (3, 6),
+        (6, 7),
+    ]
+
+
+def test_pipeline_counts_tokens_only_for_uncached_texts(store):
+    import tracing
+    from embeddings import EmbeddingPipeline
+
+    underlying = CountingEmbedding(size=8, calls=[])
+    pipeline = EmbeddingPipeline(CachedEmbeddings(underlying, store, model="fake"), token_counter=len)
+    pipeline.embed(["aaaa", "bb"])
+
+    progress = []
+    before = tracing.tracer.snapshot()["counters"]
+    with tracing.trace() as spans:
+        vectors = pipeline.embed(["aaaa", "c", "bb"], on_progress=lambda done, total: progress.append((done, total)))
+    after = tracing.tracer.snapshot()["counters"]
+
+    # 캐시에 있는 텍스트는 API 로 보내지 않고 토큰 수에도 포함하지 않습니다.
+    assert underlying.calls[-1] == ["c"]
+    assert vectors[1] == pytest.approx(underlying.embed_query("c"), abs=1e-6)
+    assert after["embedding_tokens"] - before.get("embedding_tokens", 0) == 1
+    assert after["embedding_cache_hits"] - before.get("embedding_cache_hits", 0) == 2
+    assert (spans[-1]["tokens"], spans[-1]["cached"]) == (1, 2)
+    assert progress == [(2, 3), (3, 3)]
+
+
+class OpenAIClientEmbedding:
+    """
+    openai 클라이언트로 임베딩 API 를 직접 호출하는 임베딩입니다.
+    OpenAIEmbeddings 는 tiktoken 인코딩을 내려받아야 하므로, 오프라인 테스트에서는 이 클래스를 사용합니다.
+    """
+
+    def __init__(self, base_url):
+        import openai
+
+        self.client = openai.OpenAI(api_key="sk-fake", base_url=base_url, max_retries=0)
+
+    def embed_documents(self, texts):
+        response = self.client.embeddings.create(input=texts, model="text-embedding-ada-002")
+        return [data.embedding for data in response.data]
+
+
+def test_pipeline_against_rate_limited_server():
+    from embeddings import EmbeddingPipeline
+    from fake_openai_server import FakeOpenAIServer, fake_embedding
+
+    texts = [f"메시지 {i}" for i in range(60)]
+    progress = []
+    with FakeOpenAIServer(latency=0.05, max_concurrent=3, size=8) as server:
+        embedding = OpenAIClientEmbedding(server.base_url)
+        pipeline = EmbeddingPipeline(
+            embedding,
+            max_batch_size=2,
+            max_concurrency=8,
+            initial_concurrency=6,
+            backoff=0.01,
+            token_counter=len,
+        )
+        vectors = pipeline.embed(texts, on_progress=lambda done, total: progress.append((done, total)))
+
+    # 순서가 보존되고, rate limit 을 받은 뒤에도 모든 배치가 완료됩니다.
+    assert len(vectors) == 60
+    assert vectors[17] == pytest.approx(fake_embedding("메시지 17", 8).tolist(), abs=1e-6)
+    assert server.rate_limited > 0
+    assert pipeline.rate_limited == server.rate_limited
+    assert 1 < server.max_in_flight <= 3
+    assert progress[-1] == (60, 60)
+    assert [done for done, _ in progress] == sorted(done for done, _ in progress)
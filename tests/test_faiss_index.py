@@ -0,0 +1,33 @@
+import numpy as np
+
+from faiss_index import build_index, choose_index_type, describe_index
+
+
+def test_choose_index_type():
+    assert choose_index_type(1000) == "flat"
+    assert choose_index_type(100_000) == "ivf_sq_fp16"
+    assert choose_index_type(1_000_000) == "ivf_pq"
+
+
+def test_build_index_trains_and_exposes_knobs():
+    from langchain_community.vectorstores import FAISS
+    from retriever import FAISSRetrieverFactory
+
+    vectors = np.random.default_rng(0).standard_normal((2000, 32)).astype(np.float32)
+
+    index = build_index(vectors, "ivf_sq_fp16")
+    assert index.ntotal == 2000
+    description = describe_index(index)
+    assert description["type"] == "IndexIVFScalarQuantizer"
+    assert description["nprobe"] == max(8, description["nlist"] // 4)
+    # 자기 자신은 항상 가장 가까운 벡터로 찾습니다.
+    _, ids = index.search(vectors[:10], 1)
+    assert ids[:, 0].tolist() == list(range(10))
+
+    # 학습할 벡터가 부족하면 flat 인덱스를 사용합니다.
+    assert describe_index(build_index(vectors, "ivf_pq"))["type"] == "IndexFlat"
+
+    # 검색기를 만들 때 recall/속도 설정을 바꿀 수 있습니다.
+    faiss = FAISS(None, index, None, {})
+    FAISSRetrieverFactory(faiss).create(search_kwargs={"k": 5}, nprobe=3)
+    assert describe_index(index)["nprobe"] == 3
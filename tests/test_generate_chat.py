@@ -0,0 +1,17 @@
+from benchmarks.generate_chat import generate_messages, write_chat
+from kakaotalk_loader import KaKaoTalkLoader
+
+
+def test_generated_exports_parse_to_the_same_messages(tmp_path):
+    expected = list(generate_messages(300, num_users=20, seed=7, multiline_ratio=0.2))
+
+    for suffix in (".txt", ".csv"):
+        path = write_chat(str(tmp_path / f"chat{suffix}"), 300, num_users=20, seed=7, multiline_ratio=0.2)
+        documents = KaKaoTalkLoader(path, suffix).load()
+
+        # 날짜 구분선, 입장 안내, 여러 줄 메시지가 있어도 메시지 수와 시각이 그대로 복원됩니다.
+        assert len(documents) == 300
+        assert [doc.metadata["date"][:16] for doc in documents] == [
+            f"{time:%Y-%m-%d %H:%M}" for time, _, _ in expected
+        ]
+        assert documents[-1].page_content.endswith(expected[-1][2])
@@ -0,0 +1,65 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from chunker import ConversationChunker
+from index_manager import IndexManager
+from index_store import IndexStore
+from kakaotalk_loader import KaKaoTalkLoader
+
+
+def index_export(store, embeddings, path, name):
+    lines = [f"{name} 님과 카카오톡 대화", "저장한 날짜 : 2024-03-31 10:00:00", ""]
+    for day in range(1, 11):
+        lines.append(f"--------------- 2024년 3월 {day}일 수요일 ---------------")
+        lines.append(f"[가나다] [오전 10:55] {name} {day}일 첫 메시지")
+        lines.append(f"[J] [오후 1:00] {name} {day}일 두번째 메시지")
+    path.write_text("\n".join(lines) + "\n", encoding="utf8")
+    store.index_chat(name, KaKaoTalkLoader(str(path), ".txt"), ConversationChunker(), embeddings)
+
+
+def test_shares_evicts_and_reloads_indexes(tmp_path):
+    embedding = DeterministicFakeEmbedding(size=16)
+    embeddings = {"faiss": embedding, "chroma": embedding}
+    store = IndexStore(str(tmp_path / "index"))
+    for name in ("a", "b", "c"):
+        index_export(store, embeddings, tmp_path / f"{name}.txt", name)
+
+    manager = IndexManager(store)
+    with manager.use("a", embeddings) as chat:
+        size = manager.stats()["resident_bytes"]
+        assert size > chat.nbytes > 0
+    # 같은 파일을 다시 요청하면 불러온 인덱스를 공유합니다.
+    with manager.use("a", embeddings) as shared:
+        assert shared is chat
+    assert (manager.hits, manager.loads) == (1, 1)
+
+    # 인덱스 두 개만 들어가는 예산에서는 가장 오래 사용하지 않은 인덱스를 내보냅니다.
+    manager.max_bytes = int(size * 2.5)
+    for name in ("b", "a", "c"):
+        with manager.use(name, embeddings):
+            pass
+    stats = manager.stats()
+    assert [chat["key"] for chat in stats["chats"]] == ["a", "c"]
+    assert stats["evictions"] == 1
+    assert stats["resident_bytes"] <= manager.max_bytes
+
+    # 사용 중인 인덱스는 내보내지 않고, 내보낸 인덱스는 다음 질문에서 다시 불러옵니다.
+    with manager.use("b", embeddings) as chat:
+        assert not manager.evict("b")
+        documents = chat.retriever(embeddings, api_key="test").invoke("b 3일 첫 메시지")
+        assert "b 3일 첫 메시지" in documents[0].page_content
+    assert manager.loads == 4
+    assert [chat["key"] for chat in manager.stats()["chats"]] == ["c", "b"]
+    # 불러오기가 끝난 키의 잠금은 남지 않습니다.
+    assert len(manager._load_locks) == 0
+
+
+def test_index_lock_is_shared_per_key(tmp_path):
+    manager = IndexManager(IndexStore(str(tmp_path / "index")))
+    lock = manager.index_lock("a")
+    with lock:
+        # 인덱싱 중인 키는 다른 세션도 같은 잠금을 기다리고, 다른 키는 기다리지 않습니다.
+        assert manager.index_lock("a") is lock
+        assert not lock.acquire(blocking=False)
+        assert manager.index_lock("b") is not lock
+    del lock
+    assert len(manager._index_locks) == 0
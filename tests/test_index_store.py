@@ -0,0 +1,146 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from index_store import IndexStore, file_fingerprint
+
+
+def test_file_fingerprint():
+    assert file_fingerprint(b"abc", ".txt") == file_fingerprint(b"abc", ".txt")
+    assert file_fingerprint(b"abc", ".txt") != file_fingerprint(b"abd", ".txt")
+    assert file_fingerprint(b"abc", ".txt") != file_fingerprint(b"abc", ".csv")
+    # 업로드 버퍼(memoryview)도 복사 없이 같은 값으로 해시합니다.
+    assert file_fingerprint(memoryview(b"abc"), ".txt") == file_fingerprint(b"abc", ".txt")
+
+
+def test_create_and_load(tmp_path):
+    embedding = DeterministicFakeEmbedding(size=16)
+    embeddings = {"faiss": embedding, "chroma": embedding}
+    documents = [
+        Document(page_content=f"User: **나다, Message: 메시지 {i}", metadata={"row": i, "year": 2024})
+        for i in range(20)
+    ]
+    store = IndexStore(str(tmp_path))
+    key = file_fingerprint(b"chat", ".txt")
+
+    assert not store.exists(key)
+    faiss, chroma = store.create(key, documents, embeddings, file_name="chat.txt")
+    assert store.exists(key)
+    assert store.manifest(key)["documents"] == 20
+    assert store.manifest(key)["file_name"] == "chat.txt"
+    assert store.manifest(key)["faiss_index"]["type"] == "IndexFlat"
+
+    query = "User: **나다, Message: 메시지 7"
+    loaded_faiss, loaded_chroma = store.load(key, embeddings)
+    assert loaded_faiss.index.ntotal == 20
+    assert loaded_faiss.similarity_search(query, k=1) == faiss.similarity_search(query, k=1)
+    assert loaded_chroma.similarity_search(query, k=1)[0].metadata["row"] == 7
+
+
+def write_export(path, num_days, saved_at):
+    lines = ["LLM RAG Langchain 통합 님과 카카오톡 대화", f"저장한 날짜 : {saved_at}", ""]
+    for day in range(1, num_days + 1):
+        lines.append(f"--------------- 2024년 3월 {day}일 수요일 ---------------")
+        lines.append(f"[가나다] [오전 10:55] {day}일 첫 메시지")
+        lines.append(f"[J] [오후 1:00] {day}일 두번째 메시지")
+    path.write_text("\n".join(lines) + "\n", encoding="utf8")
+    return path
+
+
+def test_index_chat_appends_only_new_messages(tmp_path):
+    from chunker import ConversationChunker
+    from kakaotalk_loader import KaKaoTalkLoader
+
+    class CountingEmbedding(DeterministicFakeEmbedding):
+        texts: list = []
+
+        def embed_documents(self, texts):
+            self.texts.extend(texts)
+            return super().embed_documents(texts)
+
+    embedding = CountingEmbedding(size=16, texts=[])
+    embeddings = {"faiss": embedding, "chroma": embedding}
+    store = IndexStore(str(tmp_path / "index"))
+    chunker = ConversationChunker()
+
+    first = write_export(tmp_path / "week1.txt", 3, "2024-03-03 22:00:00")
+    store.index_chat("week1", KaKaoTalkLoader(str(first), ".txt"), chunker, embeddings)
+    assert store.manifest("week1")["documents"] == 6
+    assert store.manifest("week1")["last_row"] == 5
+
+    embedding.texts.clear()
+    second = write_export(tmp_path / "week2.txt", 5, "2024-03-05 22:00:00")
+    faiss, chroma = store.index_chat("week2", KaKaoTalkLoader(str(second), ".txt"), chunker, embeddings)
+
+    # 4일, 5일의 메시지만 한 번 임베딩하여 FAISS 와 Chroma 에 함께 추가합니다.
+    assert len(embedding.texts) == 4
+    assert all(("4일" in text) or ("5일" in text) for text in embedding.texts)
+    assert faiss.index.ntotal == 10
+    assert chroma._collection.count() == 10
+    assert store.manifest("week2")["documents"] == 10
+    assert store.manifest("week2")["base_key"] == "week1"
+    assert store.find_chat(KaKaoTalkLoader(str(second), ".txt").chat_fingerprint()) == "week2"
+    # 이전 인덱스는 그대로 남아 있습니다.
+    assert store.load("week1", embeddings)[0].index.ntotal == 6
+
+
+def test_index_chat_rebuilds_when_history_differs(tmp_path):
+    from chunker import ConversationChunker
+    from kakaotalk_loader import KaKaoTalkLoader
+
+    embedding = DeterministicFakeEmbedding(size=16)
+    embeddings = {"faiss": embedding, "chroma": embedding}
+    store = IndexStore(str(tmp_path / "index"))
+
+    first = write_export(tmp_path / "week1.txt", 3, "2024-03-03 22:00:00")
+    store.index_chat("week1", KaKaoTalkLoader(str(first), ".txt"), ConversationChunker(), embeddings)
+
+    # 마지막으로 인덱싱한 메시지가 바뀐 파일은 처음부터 다시 인덱싱합니다.
+    second = write_export(tmp_path / "week2.txt", 5, "2024-03-05 22:00:00")
+    second.write_text(second.read_text(encoding="utf8").replace("3일 두번째", "3일 수정된"), encoding="utf8")
+    store.index_chat("week2", KaKaoTalkLoader(str(second), ".txt"), ConversationChunker(), embeddings)
+    assert "base_key" not in store.manifest("week2")
+    assert store.manifest("week2")["documents"] == 10
+
+
+@pytest.mark.parametrize("edited", [False, True])
+def test_index_chat_parses_the_file_once(tmp_path, edited):
+    from chunker import ConversationChunker
+    from kakaotalk_loader import KaKaoTalkLoader
+
+    class CountingLoader(KaKaoTalkLoader):
+        loads = 0
+
+        def lazy_load(self):
+            CountingLoader.loads += 1
+            return super().lazy_load()
+
+    embedding = DeterministicFakeEmbedding(size=16)
+    embeddings = {"faiss": embedding, "chroma": embedding}
+    store = IndexStore(str(tmp_path / "index"))
+
+    first = write_export(tmp_path / "week1.txt", 3, "2024-03-03 22:00:00")
+    store.index_chat("week1", KaKaoTalkLoader(str(first), ".txt"), ConversationChunker(), embeddings)
+
+    second = write_export(tmp_path / "week2.txt", 5, "2024-03-05 22:00:00")
+    if edited:
+        second.write_text(second.read_text(encoding="utf8").replace("3일 두번째", "3일 수정된"), encoding="utf8")
+    store.index_chat("week2", CountingLoader(str(second), ".txt"), ConversationChunker(), embeddings)
+
+    # 지문 계산, 연장 여부 확인, 전체 인덱싱이 한 번의 파싱 결과를 함께 사용합니다.
+    assert CountingLoader.loads == 1
+    assert ("base_key" in store.manifest("week2")) is not edited
+    assert store.manifest("week2")["documents"] == 10
+    assert store.manifest("week2")["last_row"] == 9
+    assert store.find_chat(KaKaoTalkLoader(str(second), ".txt").chat_fingerprint()) == "week2"
+
+
+def test_stored_documents(tmp_path):
+    from index_store import stored_documents
+
+    embedding = DeterministicFakeEmbedding(size=16)
+    documents = [Document(page_content=f"메시지 {i}", metadata={"row": i}) for i in range(5)]
+    store = IndexStore(str(tmp_path))
+    store.create("chat", documents, {"faiss": embedding, "chroma": embedding})
+
+    faiss, _ = store.load("chat", {"faiss": embedding, "chroma": embedding})
+    assert stored_documents(faiss) == documents
@@ -74,3 +74,148 @@ def test_txt___read_file(mocker):
     assert documents[0].metadata['date'] == "2024-03-27 10:55:00"
     assert documents[0].page_content == '"User: **, Message: 안녕하세요'
 
+
+def test_txt___read_file_multiline_message():
+    lines = [
+        "LLM RAG Langchain 통합 님과 카카오톡 대화\n",
+        "저장한 날짜 : 2024-04-05 01:36:14\n",
+        "--------------- 2024년 3월 27일 수요일 ---------------\n",
+        "[가나다] [오후 12:05] 첫 줄\n",
+        "둘째 줄\n",
+        "셋째 줄\n",
+        "ABC님이 나갔습니다.\n",
+        "[J] [오전 12:01] 한 줄 메시지\n",
+        "--------------- 2024년 3월 28일 목요일 ---------------\n",
+        "[J] [오후 11:59] 다음 날 메시지\n",
+    ]
+
+    loader = KaKaoTalkLoader(file_path="dummy_path", file_suffix=".txt")
+    documents = list(loader._read_file_test(iter(lines)))
+
+    assert len(documents) == 3
+    # 여러 줄 메시지는 하나의 Document로 합쳐지고, 시스템 안내 라인은 제외됩니다.
+    assert documents[0].page_content == '"User: **, Message: 첫 줄\n둘째 줄\n셋째 줄'
+    assert documents[0].metadata["date"] == "2024-03-27 12:05:00"
+    assert documents[1].metadata["date"] == "2024-03-27 00:01:00"
+    assert documents[2].metadata["date"] == "2024-03-28 23:59:00"
+    assert (documents[2].metadata["year"], documents[2].metadata["month"], documents[2].metadata["day"]) == (2024, 3, 28)
+    assert [doc.metadata["row"] for doc in documents] == [0, 1, 2]
+
+def test_csv___read_file_in_chunks():
+    import io
+
+    fake_csv = (
+        "Date,User,Message\n"
+        "2024-03-27 10:55:00,가나다,안녕하세요\n"
+        "2024-03-27 11:00:00,J,Bge m3 모델이 잘합니다\n"
+        "2024-03-28 09:01:02,가나다,감사합니다\n"
+        "2024-04-01 23:59:59,ABCDE,https://huggingface.co/BAAI/bge-m3\n"
+        "2024-04-02 00:00:00,J,좋네요\n"
+    )
+
+    loader = KaKaoTalkLoader(file_path="dummy_path", file_suffix=".csv", csv_chunksize=2)
+    documents = list(loader._read_file_test(io.StringIO(fake_csv)))
+
+    assert len(documents) == 5
+    # 청크 경계를 넘어도 행 번호가 이어집니다.
+    assert [doc.metadata["row"] for doc in documents] == [0, 1, 2, 3, 4]
+    assert documents[0].page_content == '"User: **, Message: 안녕하세요'
+    assert documents[3].metadata == {
+        "date": "2024-04-01 23:59:59",
+        "year": 2024,
+        "month": 4,
+        "day": 1,
+        "user": "***DE",
+        "row": 3,
+        "source": "dummy_path",
+    }
+    assert type(documents[3].metadata["year"]) is int
+
+
+def test_csv___numeric_users_in_a_chunk_stay_strings():
+    import io
+
+    fake_csv = (
+        "Date,User,Message\n"
+        "2024-03-27 10:55:00,가나다,안녕하세요\n"
+        "2024-03-27 11:00:00,J,네\n"
+        "2024-03-28 09:01:02,12345,NA\n"
+        "2024-04-01 23:59:59,678,\n"
+    )
+
+    loader = KaKaoTalkLoader(file_path="dummy_path", file_suffix=".csv", csv_chunksize=2)
+    documents = list(loader._read_file_test(io.StringIO(fake_csv)))
+
+    # 두 번째 청크의 사용자가 모두 숫자여도 문자열로 비식별화합니다.
+    assert [doc.metadata["user"] for doc in documents[2:]] == ["***45", "**"]
+    assert [doc.page_content for doc in documents[2:]] == ['"User: ***45, Message: NA', '"User: **, Message: ']
+
+
+def test_sniff_encoding():
+    from kakaotalk_loader import sniff_encoding
+
+    text = "[가나다] [오전 10:55] 안녕하세요\n"
+    assert sniff_encoding(text.encode("utf-8")) == "utf-8"
+    # 앞부분이 멀티바이트 문자 중간에서 잘려도 UTF-8 로 판별합니다.
+    assert sniff_encoding(text.encode("utf-8")[:-3]) == "utf-8"
+    assert sniff_encoding("\ufeffDate,User,Message\n".encode("utf-8")) == "utf-8-sig"
+    assert sniff_encoding(text.encode("cp949")) == "cp949"
+
+
+def test_load_from_bytes_and_stream(tmp_path):
+    import io
+
+    fake_csv = "Date,User,Message\n2024-03-27 10:55:00,가나다,안녕하세요\n2024-03-27 11:00:00,J,감사합니다\n"
+    path = tmp_path / "chat.csv"
+    path.write_text(fake_csv, encoding="utf-8")
+    expected = KaKaoTalkLoader(str(path), ".csv", source="chat.csv").load()
+
+    # BOM 이 붙은 UTF-8 과 CP949 내용도 임시 파일 없이 같은 Document 로 읽습니다.
+    for data in [("\ufeff" + fake_csv).encode("utf-8"), fake_csv.encode("cp949")]:
+        loader = KaKaoTalkLoader(data, ".csv", autodetect_encoding=True, source="chat.csv")
+        assert loader.load() == expected
+
+    # 스트림은 닫지 않고, 다시 읽을 때 처음 위치부터 읽습니다.
+    stream = io.BytesIO(fake_csv.encode("utf-8"))
+    stream.name = "chat.csv"
+    loader = KaKaoTalkLoader(stream, ".csv", autodetect_encoding=True)
+    assert loader.load() == expected
+    assert loader.load() == expected
+    assert not stream.closed
+
+    # 추정한 인코딩으로 디코딩할 수 없는 바이트는 대체 문자로 바꾸지 않고 오류를 발생시킵니다.
+    broken = fake_csv.encode("utf-8") + "2024-03-28 09:00:00,J,".encode("utf-8") + b"\xff\xfe\n"
+    with pytest.raises(RuntimeError) as excinfo:
+        KaKaoTalkLoader(broken, ".csv", autodetect_encoding=True).load()
+    assert isinstance(excinfo.value.__cause__, UnicodeDecodeError)
+
+
+def test_load_cp949_after_ascii_prefix():
+    from kakaotalk_loader import SNIFF_BYTES
+
+    # 인코딩을 추정하는 앞부분이 ASCII 뿐이어도 이후의 CP949 메시지를 그대로 읽습니다.
+    rows = ["Date,User,Message\n"] + [f"2024-03-27 10:55:00,J,hello {i}\n" for i in range(SNIFF_BYTES // 20)]
+    data = "".join(rows).encode("ascii") + "2024-03-28 09:00:00,가나다,안녕하세요\n".encode("cp949")
+    assert len(data) > SNIFF_BYTES
+
+    documents = KaKaoTalkLoader(data, ".csv", autodetect_encoding=True, csv_chunksize=1000).load()
+    assert len(documents) == len(rows)
+    assert documents[-1].page_content == '"User: **, Message: 안녕하세요'
+
+
+def test_chat_fingerprint_is_not_traced_as_parse():
+    import tracing
+
+    fake_csv = "Date,User,Message\n" + "".join(f"2024-03-27 10:55:{i:02d},J,메시지 {i}\n" for i in range(10))
+    loader = KaKaoTalkLoader(fake_csv.encode("utf-8"), ".csv", autodetect_encoding=True)
+
+    # 지문 계산은 앞부분만 읽으므로 loader.parse 측정에 일부만 읽은 span 을 남기지 않습니다.
+    with tracing.trace() as spans:
+        fingerprint = loader.chat_fingerprint()
+    assert [span["span"] for span in spans if span["span"] == "loader.parse"] == []
+
+    # 이미 파싱한 앞부분 메시지로 계산해도 같은 값입니다.
+    with tracing.trace() as spans:
+        documents = loader.load()
+    assert [span["items"] for span in spans if span["span"] == "loader.parse"] == [10]
+    assert loader.chat_fingerprint(documents[:5]) == fingerprint
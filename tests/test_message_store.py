@@ -0,0 +1,68 @@
+import pickle
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from message_store import MessageDocstore, MessageStore
+
+
+def make_chunks(n):
+    return [
+        Document(
+            page_content=f"[2024-03-{i % 28 + 1:02d} 10:55] User: **나다, Message: 메시지 {i} 👍",
+            metadata={
+                "date": f"2024-03-{i % 28 + 1:02d} 10:55:00",
+                "date_end": f"2024-03-{i % 28 + 1:02d} 11:05:00",
+                "year": 2024,
+                "month": 3,
+                "day": i % 28 + 1,
+                "user": "**나다" if i % 2 else "J",
+                "users": "**나다, J",
+                "row": i * 3,
+                "row_end": i * 3 + 2,
+                "source": "/tmp/chat.txt",
+            },
+        )
+        for i in range(n)
+    ]
+
+
+def test_round_trip_and_columns():
+    chunks = make_chunks(25)
+    store = MessageStore.from_documents(iter(chunks), batch_size=10)
+
+    assert len(store) == 25
+    assert list(store) == chunks
+    assert store[-1] == chunks[-1]
+    assert pickle.loads(pickle.dumps(store))[7] == chunks[7]
+    # 반복되는 문자열은 한 번만 저장하고, 숫자/날짜는 배열로 저장합니다.
+    assert store.categories("source") == ["/tmp/chat.txt"]
+    assert sorted(store.categories("user")) == ["**나다", "J"]
+    assert store.column("date").dtype.kind == "M"
+    assert store.column("month").itemsize == 1
+
+    # 형식이 다른 값이 추가되어도 원래 값을 그대로 돌려줍니다.
+    odd = Document(page_content="x", metadata={**chunks[0].metadata, "date": "2024/03/01", "row": 10**10})
+    store.extend([odd])
+    assert store[25] == odd
+    assert store[0] == chunks[0]
+
+
+def test_index_store_uses_message_store(tmp_path):
+    from index_store import IndexStore, stored_messages
+    from retriever import BM25RetrieverFactory
+
+    embedding = DeterministicFakeEmbedding(size=16)
+    embeddings = {"faiss": embedding, "chroma": embedding}
+    chunks = make_chunks(20)
+    IndexStore(str(tmp_path)).create("chat", chunks, embeddings)
+
+    faiss, _ = IndexStore(str(tmp_path)).load("chat", embeddings)
+    assert isinstance(faiss.docstore, MessageDocstore)
+    assert faiss.similarity_search(chunks[7].page_content, k=1) == [chunks[7]]
+
+    # BM25 검색기는 FAISS 와 같은 저장소를 공유합니다.
+    store = stored_messages(faiss)
+    bm25 = BM25RetrieverFactory(store).create(search_kwargs={"k": 1})
+    assert bm25.default.documents is store
+    assert bm25.invoke(chunks[13].page_content) == [chunks[13]]
@@ -0,0 +1,111 @@
+from datetime import date
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.retrievers import BaseRetriever
+
+from faiss_index import build_index, enable_reconstruct, search_subset
+from message_store import MessageDocstore, MessageStore, PositionIds
+from metadata_index import MetadataIndex
+from query_parser import KoreanQueryParser
+from retriever import FilteredFAISSRetrieverFactory
+
+
+def make_store(n):
+    documents = []
+    for i in range(n):
+        year, month, day = 2023 + i % 2, i % 12 + 1, i % 28 + 1
+        users = ["**나다", "J"] if i % 3 == 0 else ["J"]
+        documents.append(
+            Document(
+                page_content=f"메시지 {i}",
+                metadata={
+                    "date": f"{year}-{month:02d}-{day:02d} 10:00:00",
+                    "year": year,
+                    "month": month,
+                    "day": day,
+                    "user": users[0],
+                    "users": ", ".join(users),
+                },
+            )
+        )
+    return MessageStore.from_documents(documents)
+
+
+def expected_ids(store, **fields):
+    return [
+        i
+        for i in range(len(store))
+        if all(
+            (value in store.metadata(i)["users"].split(", ")) if key == "user" else store.metadata(i)[key] == value
+            for key, value in fields.items()
+        )
+    ]
+
+
+def test_resolve_filters_by_bisection():
+    store = make_store(500)
+    metadata_index = MetadataIndex(store)
+    parser = KoreanQueryParser(users=["**나다", "J"], today=date(2024, 6, 1))
+
+    for question, fields in [
+        ("2023년 3월 대화", {"year": 2023, "month": 3}),
+        ("3월 5일에 뭐 했어?", {"month": 3, "day": 5}),
+        ("**나다님이 2024년에 한 말", {"year": 2024, "user": "**나다"}),
+    ]:
+        ids = metadata_index.resolve(parser.parse(question).filter)
+        assert ids.tolist() == expected_ids(store, **fields), question
+
+    assert metadata_index.resolve(parser.parse("전체 요약").filter) is None
+    assert len(metadata_index.users("없는사람")) == 0
+
+
+def test_search_subset_matches_exhaustive_search():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((3000, 16)).astype(np.float32)
+    query = rng.standard_normal(16).astype(np.float32)
+    ids = np.sort(rng.choice(3000, 1000, replace=False))
+    distances = ((vectors[ids] - query) ** 2).sum(axis=1)
+    expected = ids[np.argsort(distances)[:10]].tolist()
+
+    for index_type in ("flat", "ivf_flat"):
+        index = build_index(vectors, index_type)
+        enable_reconstruct(index)
+        # NumPy 로 후보 거리 계산 / IDSelector 로 FAISS 검색 제한
+        assert search_subset(index, query, ids, 10, brute_force_max=5000)[1].tolist() == expected
+        assert search_subset(index, query, ids, 10, brute_force_max=100)[1].tolist() == expected
+
+
+class RecordingRetriever(BaseRetriever):
+    queries: list = []
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        self.queries.append(query)
+        return [Document(page_content="fallback")]
+
+
+def test_filtered_retriever_uses_metadata_index_and_falls_back():
+    store = make_store(200)
+    embedding = DeterministicFakeEmbedding(size=8)
+    vectors = np.array(embedding.embed_documents(list(store.texts())), dtype=np.float32)
+    faiss = FAISS(embedding, build_index(vectors, "flat"), MessageDocstore(store), PositionIds(len(store)))
+    fallback = RecordingRetriever()
+    retriever = FilteredFAISSRetrieverFactory(faiss).create(
+        metadata_index=MetadataIndex(store),
+        query_parser=KoreanQueryParser(users=["**나다", "J"], today=date(2024, 6, 1)),
+        fallback=fallback,
+        search_kwargs={"k": 5},
+    )
+
+    documents = retriever.invoke("2023년 1월에 **나다님")
+    assert 0 < len(documents) <= 5
+    for document in documents:
+        assert (document.metadata["year"], document.metadata["month"]) == (2023, 1)
+        assert "**나다" in document.metadata["users"]
+    assert fallback.queries == []
+
+    # 규칙으로 확신할 수 없는 질문은 fallback 검색기에 맡깁니다.
+    assert retriever.invoke("지난주에 무슨 얘기 했어?")[0].page_content == "fallback"
+    assert fallback.queries == ["지난주에 무슨 얘기 했어?"]
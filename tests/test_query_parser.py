@@ -0,0 +1,72 @@
+import json
+from datetime import date
+from pathlib import Path
+
+import pytest
+from langchain.chains.query_constructor.ir import Comparison, Operation, StructuredQuery
+from langchain_core.runnables import RunnableLambda
+from query_parser import KoreanQueryParser
+
+# 질문별로 기대하는 필터를 기록한 레이블 데이터. expected 가 null 이면 LLM 에 맡겨야 하는 질문입니다.
+CASES = [
+    json.loads(line)
+    for line in (Path(__file__).parent / "data" / "query_parser_cases.jsonl").read_text(encoding="utf8").splitlines()
+    if line.strip()
+]
+USERS = ["**", "**나다", "***DE", "***ef", ""]
+
+
+def filter_fields(structured_query: StructuredQuery) -> dict:
+    if structured_query.filter is None:
+        return {}
+    if isinstance(structured_query.filter, Comparison):
+        comparisons = [structured_query.filter]
+    else:
+        assert isinstance(structured_query.filter, Operation)
+        comparisons = structured_query.filter.arguments
+    return {comparison.attribute: comparison.value for comparison in comparisons}
+
+
+@pytest.fixture
+def parser():
+    return KoreanQueryParser(users=USERS, today=date(2024, 4, 5))
+
+
+@pytest.mark.parametrize("case", CASES, ids=[case["question"] for case in CASES])
+def test_parse_labeled_questions(parser, case):
+    structured_query = parser.parse(case["question"])
+
+    if case["expected"] is None:
+        assert structured_query is None
+    else:
+        assert structured_query is not None
+        assert filter_fields(structured_query) == case["expected"]
+        if "query" in case:
+            assert structured_query.query == case["query"]
+
+
+def test_parser_coverage(parser):
+    parsed = sum(parser.parse(case["question"]) is not None for case in CASES)
+    print(f"\nKoreanQueryParser coverage: {parsed}/{len(CASES)} ({parsed / len(CASES):.0%})")
+    assert parsed == sum(case["expected"] is not None for case in CASES)
+
+
+def test_as_query_constructor_falls_back_only_when_unsure(parser):
+    calls = []
+
+    def llm_constructor(inputs):
+        calls.append(inputs["query"])
+        return StructuredQuery(query="링크", filter=None, limit=None)
+
+    constructor = parser.as_query_constructor(RunnableLambda(llm_constructor))
+
+    assert filter_fields(constructor.invoke({"query": "어제 공유된 링크"})) == {"year": 2024, "month": 4, "day": 4}
+    assert calls == []
+    assert constructor.invoke({"query": "지난주에 공유된 링크"}).query == "링크"
+    assert calls == ["지난주에 공유된 링크"]
+
+
+def test_parse_without_known_users():
+    parser = KoreanQueryParser(today=date(2024, 4, 5))
+    assert parser.parse("**나다님이 공유한 링크") is None
+    assert filter_fields(parser.parse("지난달 공유한 링크")) == {"year": 2024, "month": 3}
@@ -0,0 +1,31 @@
+import numpy as np
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from reranker import MMRReranker, mmr_select
+
+
+def test_mmr_select_matches_reference_implementation():
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((60, 16)).astype(np.float32)
+    query = rng.standard_normal(16).astype(np.float32)
+    for lambda_mult in (0.0, 0.3, 0.5, 1.0):
+        expected = maximal_marginal_relevance(query, vectors, lambda_mult=lambda_mult, k=10)
+        assert mmr_select(query, vectors, 10, lambda_mult) == expected
+
+
+def test_rerank_drops_near_duplicates():
+    embedding = DeterministicFakeEmbedding(size=256)
+    duplicates = [Document(page_content="점심 메뉴 정하자") for _ in range(5)]
+    others = [Document(page_content=f"다른 이야기 {i}") for i in range(5)]
+    reranker = MMRReranker(embedding, k=4, lambda_mult=0.3)
+
+    reranked = reranker.rerank("점심 메뉴 정하자", duplicates + others)
+    assert len(reranked) == 4
+    assert reranked[0].page_content == "점심 메뉴 정하자"
+    # 같은 청크는 한 번만 고르고, 나머지는 서로 다른 청크로 채웁니다.
+    assert sum(document.page_content == "점심 메뉴 정하자" for document in reranked) == 1
+
+    # 관련성만 고려하면 검색 결과가 그대로 유지됩니다.
+    assert reranker.rerank("점심 메뉴 정하자", duplicates + others, lambda_mult=1.0) == duplicates[:4]
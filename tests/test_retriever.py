@@ -0,0 +1,117 @@
+import asyncio
+import time
+from typing import List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from retriever import EnsembleRetrieverFactory, ParallelEnsembleRetriever
+
+
+class SlowRetriever(BaseRetriever):
+    """지연 시간 후 고정된 결과를 반환하는 검색기"""
+
+    delay: float
+    contents: List[str]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        time.sleep(self.delay)
+        return [Document(page_content=content) for content in self.contents]
+
+
+def test_ensemble_runs_retrievers_concurrently():
+    retrievers = [
+        SlowRetriever(delay=0.3, contents=["a", "b"]),
+        SlowRetriever(delay=0.3, contents=["b", "c"]),
+        SlowRetriever(delay=0.3, contents=["c"]),
+    ]
+    ensemble = EnsembleRetrieverFactory(None).create(retrievers=retrievers, weights=[0.2, 0.5, 0.3])
+    assert isinstance(ensemble, ParallelEnsembleRetriever)
+
+    start = time.monotonic()
+    documents = ensemble.invoke("질문")
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 0.6
+    assert [doc.page_content for doc in documents] == ["c", "b", "a"]
+
+
+def test_ensemble_drops_retrievers_that_time_out():
+    retrievers = [
+        SlowRetriever(delay=0.0, contents=["a", "b"]),
+        SlowRetriever(delay=1.0, contents=["c"]),
+    ]
+    ensemble = EnsembleRetrieverFactory(None).create(
+        retrievers=retrievers, weights=[0.4, 0.6], timeouts=[None, 0.2]
+    )
+
+    start = time.monotonic()
+    documents = ensemble.invoke("질문")
+    assert time.monotonic() - start < 0.5
+    assert [doc.page_content for doc in documents] == ["a", "b"]
+
+    documents = asyncio.run(ensemble.ainvoke("질문"))
+    assert [doc.page_content for doc in documents] == ["a", "b"]
+
+
+class FailingRetriever(BaseRetriever):
+    """항상 예외를 발생시키는 검색기"""
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        raise RuntimeError("OpenAI API 오류")
+
+
+def test_ensemble_drops_retrievers_that_fail():
+    ensemble = EnsembleRetrieverFactory(None).create(
+        retrievers=[SlowRetriever(delay=0.0, contents=["a", "b"]), FailingRetriever()], weights=[0.4, 0.6]
+    )
+    assert [doc.page_content for doc in ensemble.invoke("질문")] == ["a", "b"]
+    assert [doc.page_content for doc in asyncio.run(ensemble.ainvoke("질문"))] == ["a", "b"]
+
+    # 모든 검색기가 실패하면 예외를 그대로 전달합니다.
+    failing = EnsembleRetrieverFactory(None).create(retrievers=[FailingRetriever()], weights=[1.0])
+    with pytest.raises(RuntimeError):
+        failing.invoke("질문")
+    with pytest.raises(RuntimeError):
+        asyncio.run(failing.ainvoke("질문"))
+
+
+def test_ensemble_factory_validates_arguments():
+    with pytest.raises(ValueError):
+        EnsembleRetrieverFactory(None).create(
+            retrievers=[SlowRetriever(delay=0, contents=[])], weights=[1.0], timeouts=[1, 2]
+        )
+
+
+def test_korean_ngram_tokenize():
+    from retriever import korean_ngram_tokenize
+
+    assert korean_ngram_tokenize("링크를 https://a.com/bge-m3") == [
+        "링크를",
+        "링크",
+        "크를",
+        "https://a.com/bge-m3",
+        "https",
+        "a",
+        "com",
+        "bge",
+        "m3",
+    ]
+
+
+def test_bm25_retriever_matches_exact_tokens():
+    from retriever import BM25RetrieverFactory
+
+    documents = [
+        Document(page_content="User: **나다, Message: 한국어 임베딩 모델 추천 부탁드려요", metadata={"row": 0}),
+        Document(page_content="User: J, Message: https://huggingface.co/BAAI/bge-m3 이거 써보세요", metadata={"row": 1}),
+        Document(page_content="User: ***DE, Message: 오늘 점심은 국밥입니다", metadata={"row": 2}),
+        Document(page_content="User: J, Message: bge m3 모델이 한국어를 잘합니다", metadata={"row": 3}),
+    ]
+    bm25 = BM25RetrieverFactory(documents).create(search_kwargs={"k": 2})
+
+    assert [doc.metadata["row"] for doc in bm25.invoke("https://huggingface.co/BAAI/bge-m3")][:1] == [1]
+    assert [doc.metadata["row"] for doc in bm25.invoke("임베딩 모델을 추천해줘")][:1] == [0]
+    assert [doc.metadata["row"] for doc in bm25.invoke("국밥")] == [2]
+    assert bm25.invoke("없는단어") == []
+    assert len(bm25.invoke("모델")) == 2
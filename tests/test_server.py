@@ -0,0 +1,66 @@
+import json
+
+from fastapi.testclient import TestClient
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import answer_cache
+import index_manager
+from answer_cache import SemanticAnswerCache
+from fake_openai_server import FakeOpenAIServer
+from index_manager import IndexManager
+from index_store import IndexStore
+from server import create_app
+from test_batch_runner import write_chat
+
+
+def read_events(response):
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        name, data = block.split("\n")
+        events.append((name[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+def test_upload_and_stream_answers_against_fake_server(tmp_path, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    data = write_chat(tmp_path / "chat.txt").read_bytes()
+    embedding = DeterministicFakeEmbedding(size=16)
+
+    with FakeOpenAIServer() as server:
+        app = create_app(
+            index_manager=IndexManager(IndexStore(str(tmp_path / "index"))),
+            answer_cache=SemanticAnswerCache(),
+            base_url=server.base_url,
+            embedding_factory=lambda api_key: {"faiss": embedding, "chroma": embedding},
+        )
+        headers = {"Authorization": "Bearer sk-fake"}
+        with TestClient(app) as client:
+            uploaded = client.post("/chats", params={"file_name": "chat.txt"}, content=data, headers=headers).json()
+            assert uploaded["created"] and uploaded["users"]
+            # 같은 파일은 다시 인덱싱하지 않습니다.
+            again = client.post("/chats", params={"file_name": "chat.txt"}, content=data, headers=headers).json()
+            assert again["chat_key"] == uploaded["chat_key"] and not again["created"]
+            # 인덱싱이 끝난 파일의 잠금은 남기지 않습니다.
+            assert len(app.state.index_locks) == 0
+
+            path = f"/chats/{uploaded['chat_key']}/ask"
+            response = client.post(path, json={"question": "3월 27일에 공유된 링크 알려줘"}, headers=headers)
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = read_events(response)
+            tokens = [data["token"] for name, data in events if name == "token"]
+            assert len(tokens) > 1 and "".join(tokens) == server.reply
+            name, done = events[-1]
+            assert name == "done" and done["answer"] == server.reply and done["rows"] and not done["cached"]
+
+            # 같은 질문은 LLM 을 다시 호출하지 않고 캐시된 답변을 보냅니다.
+            events = read_events(client.post(path, json={"question": "3월 27일에 공유된 링크 알려줘"}, headers=headers))
+            assert events[-1][1]["cached"] and len(server.chat_requests) == 1
+
+            assert client.post(f"/chats/{'0' * 64}/ask", json={"question": "안녕"}, headers=headers).status_code == 404
+            assert client.post("/chats/not-a-key/ask", json={"question": "안녕"}, headers=headers).status_code == 404
+            assert client.post("/chats", params={"file_name": "chat.pdf"}, content=data, headers=headers).status_code == 400
+            assert client.post(path, json={"question": "안녕"}).status_code == 401
+            assert "kakaotalk_gpt_span_seconds" in client.get("/metrics").text
+
+    # 모듈을 불러오는 것만으로 프로세스 공유 인덱스 관리자/답변 캐시를 만들지 않습니다.
+    assert index_manager._index_manager is None and answer_cache._answer_cache is None
@@ -0,0 +1,87 @@
+from datetime import date
+
+from langchain_core.documents import Document
+
+from message_store import MessageStore
+from query_parser import KoreanQueryParser
+from summary_index import SummaryIndex, SummaryRouter
+
+
+class FakeSummarizer:
+    """입력 개수와 기간 이름으로 요약문을 만드는 가짜 요약기"""
+
+    def __init__(self):
+        self.periods = []
+
+    def __call__(self, texts, period):
+        self.periods.append(period)
+        return f"{period}: {len(texts)}개"
+
+
+def make_store(days):
+    documents = [
+        Document(
+            page_content=f"[{day} 10:00] User: J, Message: {day} 대화 {i} " + "가" * 40,
+            metadata={"date": f"{day} 10:0{i}:00", "user": "J", "users": "J"},
+        )
+        for day in days
+        for i in range(3)
+    ]
+    return MessageStore.from_documents(documents)
+
+
+def test_build_reuses_unchanged_periods():
+    days = ["2024-02-28", "2024-02-29", "2024-03-01", "2024-03-04", "2024-03-05"]
+    summarizer = FakeSummarizer()
+    summary_index = SummaryIndex.build(make_store(days), summarizer, max_input_chars=200)
+
+    assert [len(summary_index.find(level)) for level in ("day", "week", "month")] == [5, 2, 2]
+    # 한 번에 요약할 수 있는 글자 수를 넘는 날은 나누어 요약한 뒤 다시 요약합니다.
+    assert "2024-02-28 (1/2)" in summarizer.periods
+    assert summary_index.find("day", 2024, 3, 4)[0]["text"] == "2024-03-04: 2개"
+    # 2월 말과 3월 초가 같은 주에 있으면 두 달 모두에서 찾습니다.
+    assert [entry["start"] for entry in summary_index.find("week", 2024, 3)] == ["2024-02-26", "2024-03-04"]
+
+    # 날짜가 추가되면 그 날과, 그 날이 속한 주/월만 다시 요약합니다.
+    summarizer = FakeSummarizer()
+    SummaryIndex.build(make_store(days + ["2024-03-06"]), summarizer, previous=summary_index, max_input_chars=200)
+    assert [period for period in summarizer.periods if "(" not in period] == [
+        "2024-03-06",
+        "2024-03-04 ~ 2024-03-10 주간",
+        "2024년 3월",
+    ]
+
+
+def test_router_sends_broad_questions_to_summaries(tmp_path):
+    days = ["2024-03-01", "2024-03-04", "2024-03-05", "2024-12-30", "2025-01-02"]
+    summary_index = SummaryIndex.build(make_store(days), FakeSummarizer())
+    summary_index.save(str(tmp_path))
+    router = SummaryRouter(
+        SummaryIndex.load(str(tmp_path)),
+        KoreanQueryParser(users=["**나다", "J"], today=date(2025, 1, 3)),
+        today=date(2025, 1, 3),
+    )
+
+    def labels(question):
+        documents = router.route(question)
+        return None if documents is None else [document.page_content.split("\n")[0] for document in documents]
+
+    assert labels("2024년 3월 대화 요약해줘") == [
+        "[2024년 3월 요약]",
+        "[2024-02-26 ~ 2024-03-03 주간 요약]",
+        "[2024-03-04 ~ 2024-03-10 주간 요약]",
+    ]
+    assert labels("작년에 무슨 얘기 했어?") == ["[2024년 3월 요약]", "[2024년 12월 요약]"]
+    assert labels("3월 5일 대화 요약") == ["[2024-03-05 요약]"]
+    assert labels("이번 주에 무슨 얘기 했어?") == [
+        "[2024-12-30 ~ 2025-01-05 주간 요약]",
+        "[2024-12-30 요약]",
+        "[2025-01-02 요약]",
+    ]
+    # 특정 대화를 찾는 질문, 특정 사용자에 대한 질문, 요약이 없는 기간은 검색기가 처리합니다.
+    assert labels("3월 5일에 공유된 링크 알려줘") is None
+    assert labels("**나다님이 3월에 한 얘기 요약") is None
+    assert labels("2023년 대화 요약") is None
+    # 기간 없이 주제를 요약해 달라는 질문도 검색기가 처리합니다.
+    assert labels("링크 요약해줘") is None
+    assert labels("회식 장소 얘기 요약해줘") is None
@@ -0,0 +1,73 @@
+import time
+
+from langchain_core.documents import Document
+
+from tracing import Tracer, summarize_trace
+
+
+def test_spans_counters_and_prometheus_text():
+    tracer = Tracer()
+    with tracer.trace() as spans:
+        with tracer.span("embed", items=3) as span:
+            span.set(tokens=42)
+        tracer.count("embedding_cache_hits", 2)
+        tracer.observe("llm.first_token", 0.25)
+    with tracer.span("embed", items=1):
+        pass
+
+    # trace 밖의 span 은 누적 통계에만 기록됩니다.
+    assert [span["span"] for span in spans] == ["embed", "llm.first_token"]
+    assert spans[0]["items"] == 3 and spans[0]["tokens"] == 42
+    assert summarize_trace(spans)[1] == ("llm.first_token", 250.0)
+
+    snapshot = tracer.snapshot()
+    assert snapshot["counters"] == {"embedding_cache_hits": 2}
+    assert snapshot["spans"]["embed"]["count"] == 2
+
+    text = tracer.prometheus_text()
+    assert "kakaotalk_gpt_embedding_cache_hits_total 2" in text
+    assert 'kakaotalk_gpt_span_seconds_count{span="embed"} 2' in text
+    assert 'kakaotalk_gpt_span_seconds_sum{span="llm.first_token"} 0.25' in text
+
+
+def test_traced_iter_excludes_consumer_time():
+    tracer = Tracer()
+
+    def produce():
+        for i in range(3):
+            time.sleep(0.01)
+            yield i
+
+    with tracer.trace() as spans:
+        for _ in tracer.traced_iter("loader.parse", produce()):
+            time.sleep(0.05)
+
+    assert spans[0]["items"] == 3
+    assert 25 <= spans[0]["duration_ms"] < 100
+
+
+def test_ensemble_records_sub_retriever_spans_in_trace():
+    import tracing
+    from langchain_core.retrievers import BaseRetriever
+    from retriever import EnsembleRetrieverFactory
+
+    class StaticRetriever(BaseRetriever):
+        documents: list
+
+        def _get_relevant_documents(self, query, *, run_manager):
+            return self.documents
+
+    retrievers = [
+        StaticRetriever(documents=[Document(page_content="a"), Document(page_content="b")]),
+        StaticRetriever(documents=[Document(page_content="b")]),
+    ]
+    ensemble = EnsembleRetrieverFactory(None).create(
+        retrievers=retrievers, weights=[0.5, 0.5], names=["faiss", "bm25"]
+    )
+    with tracing.trace() as spans:
+        ensemble.invoke("질문")
+
+    recorded = {span["span"]: span for span in spans}
+    assert recorded["retrieve.faiss"]["items"] == 2
+    assert recorded["retrieve.bm25"]["items"] == 1
+    assert recorded["retrieve.ensemble"]["items"] == 2
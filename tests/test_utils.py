@@ -0,0 +1,39 @@
+from utils import StreamHandler
+
+
+class FakeContainer:
+    def __init__(self):
+        self.rendered = []
+
+    def markdown(self, text):
+        self.rendered.append(text)
+
+
+def test_stream_handler_coalesces_tokens(monkeypatch):
+    import utils
+
+    now = [0.0]
+    monkeypatch.setattr(utils.time, "monotonic", lambda: now[0])
+    container = FakeContainer()
+    handler = StreamHandler(container, min_interval=0.1, max_pending=10)
+
+    for token in ["💬", "대화", ":\n", "- "]:
+        handler.on_llm_new_token(token)
+    assert container.rendered == []
+
+    # 시간 간격이 지나면 출력합니다.
+    now[0] += 0.2
+    handler.on_llm_new_token("링크")
+    # 쌓인 길이가 max_pending 이상이면 바로 출력합니다.
+    handler.on_llm_new_token("https://example.com")
+    handler.on_llm_new_token(" 공유")
+    handler.on_llm_end(None)
+
+    assert container.rendered == [
+        "💬대화:\n- 링크",
+        "💬대화:\n- 링크https://example.com",
+        "💬대화:\n- 링크https://example.com 공유",
+    ]
+    assert handler.text == container.rendered[-1]
+    assert handler.flush_count == 3
+    assert handler.bytes_sent == sum(len(text.encode("utf-8")) for text in container.rendered)
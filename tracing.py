@@ -0,0 +1,241 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 단계별 소요 시간 백분위수를 계산할 때 사용할 최근 측정값 수
+RECENT_SAMPLES = 1024
+METRIC_PREFIX = "kakaotalk_gpt"
+
+# 현재 실행 중인 요청(trace)의 span 기록 목록
+_current_trace: contextvars.ContextVar[Optional[List[dict]]] = contextvars.ContextVar(
+    "current_trace", default=None
+)
+
+
+class Span:
+    """
+    하나의 단계(span) 실행 기록입니다. set 으로 처리 개수, 토큰 수 등의 속성을 추가합니다.
+    """
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.duration = 0.0
+
+    def set(self, **attributes) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def to_dict(self) -> dict:
+        return {"span": self.name, "duration_ms": round(self.duration * 1000, 3), **self.attributes}
+
+
+class Tracer:
+    """
+    파이프라인 단계별 소요 시간과 카운터를 모으는 가벼운 측정기입니다.
+
+    - span: 단계 실행 시간을 기록하고, 구조화된 JSON 로그(logger: tracing)를 남깁니다.
+    - count: 처리 개수, 캐시 적중, 토큰 수 등의 누적 카운터를 증가시킵니다.
+    - trace: 한 요청 동안 실행된 span 을 모아서 화면에 단계별 시간을 보여줄 수 있게 합니다.
+    - snapshot / prometheus_text: 누적 통계를 JSON 또는 Prometheus 텍스트 형식으로 내보냅니다.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        # span 이름 -> [실행 횟수, 합계(초), 최대(초), 최근 측정값]
+        self._spans: Dict[str, list] = {}
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """
+        with 블록의 실행 시간을 기록합니다. 예외가 발생하면 error 속성에 예외 이름을 기록합니다.
+
+        :param name: 단계 이름 (예: "retrieve.faiss")
+        :param attributes: span 에 기록할 속성
+        :return: Span
+        """
+        span = Span(name, attributes)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            self.record(span)
+
+    def traced_iter(self, name: str, iterable: Iterable, **attributes) -> Iterator:
+        """
+        iterator 가 값을 만드는 데 걸린 시간만 측정합니다 (값을 소비하는 쪽의 시간은 제외).
+        끝까지 읽으면 items 속성에 생성한 개수를 기록합니다.
+
+        :param name: 단계 이름
+        :param iterable: 측정할 iterable
+        :param attributes: span 에 기록할 속성
+        :return: 같은 값을 생성하는 iterator
+        """
+        span = Span(name, attributes)
+        iterator = iter(iterable)
+        items = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    span.duration += time.perf_counter() - start
+                items += 1
+                yield item
+        finally:
+            span.set(items=items)
+            self.record(span)
+
+    def record(self, span: Span) -> None:
+        """
+        완료된 span 을 누적 통계와 현재 trace 에 기록하고 JSON 로그를 남깁니다.
+        """
+        with self._lock:
+            stats = self._spans.get(span.name)
+            if stats is None:
+                stats = self._spans[span.name] = [0, 0.0, 0.0, deque(maxlen=RECENT_SAMPLES)]
+            stats[0] += 1
+            stats[1] += span.duration
+            stats[2] = max(stats[2], span.duration)
+            stats[3].append(span.duration)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append(span.to_dict())
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(span.to_dict(), ensure_ascii=False, default=str))
+
+    def observe(self, name: str, seconds: float, **attributes) -> None:
+        """
+        with 블록으로 감쌀 수 없는 구간(예: 첫 토큰까지의 시간)의 측정값을 span 으로 기록합니다.
+
+        :param name: 단계 이름
+        :param seconds: 소요 시간(초)
+        :param attributes: span 에 기록할 속성
+        """
+        span = Span(name, attributes)
+        span.duration = seconds
+        self.record(span)
+
+    def count(self, name: str, value: float = 1) -> None:
+        """
+        카운터를 증가시킵니다.
+
+        :param name: 카운터 이름 (예: "embedding_cache_hits")
+        :param value: 증가량
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def trace(self) -> Iterator[List[dict]]:
+        """
+        with 블록 안에서 실행된 span 기록을 모읍니다. 다른 스레드에서 실행되는 단계도
+        contextvars 를 복사해서 실행하면 같은 trace 에 기록됩니다.
+
+        :return: span 기록(dict) 목록
+        """
+        spans: List[dict] = []
+        token = _current_trace.set(spans)
+        try:
+            yield spans
+        finally:
+            _current_trace.reset(token)
+
+    def snapshot(self) -> dict:
+        """
+        누적 통계를 JSON 으로 직렬화할 수 있는 dict 로 반환합니다.
+
+        :return: {"counters": {...}, "spans": {이름: {count, total_ms, max_ms, p50_ms, p95_ms}}}
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            spans = {name: (count, total, peak, sorted(recent)) for name, (count, total, peak, recent) in self._spans.items()}
+        return {
+            "counters": counters,
+            "spans": {
+                name: {
+                    "count": count,
+                    "total_ms": total * 1000,
+                    "max_ms": peak * 1000,
+                    "p50_ms": _quantile(recent, 0.5) * 1000,
+                    "p95_ms": _quantile(recent, 0.95) * 1000,
+                }
+                for name, (count, total, peak, recent) in spans.items()
+            },
+        }
+
+    def prometheus_text(self) -> str:
+        """
+        누적 통계를 Prometheus 텍스트 형식으로 반환합니다.
+        카운터는 <prefix>_<이름>_total, span 은 <prefix>_span_seconds summary (label: span) 로 내보냅니다.
+
+        :return: Prometheus exposition 텍스트
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            metric = f"{METRIC_PREFIX}_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        if snapshot["spans"]:
+            metric = f"{METRIC_PREFIX}_span_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for name, stats in sorted(snapshot["spans"].items()):
+                label = f'span="{name}"'
+                lines.append(f'{metric}{{{label},quantile="0.5"}} {stats["p50_ms"] / 1000}')
+                lines.append(f'{metric}{{{label},quantile="0.95"}} {stats["p95_ms"] / 1000}')
+                lines.append(f"{metric}_sum{{{label}}} {stats['total_ms'] / 1000}")
+                lines.append(f"{metric}_count{{{label}}} {stats['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._spans.clear()
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _metric_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+def summarize_trace(spans: List[dict]) -> List[Tuple[str, float]]:
+    """
+    trace 의 span 기록을 이름별 총 소요 시간(ms)으로 합칩니다. 화면에 단계별 시간을 보여줄 때 사용합니다.
+
+    :param spans: Tracer.trace 로 모은 span 기록
+    :return: (span 이름, 소요 시간 ms) 목록 (처음 실행된 순서)
+    """
+    totals: Dict[str, float] = {}
+    for span in spans:
+        totals[span["span"]] = totals.get(span["span"], 0.0) + span["duration_ms"]
+    return list(totals.items())
+
+
+# 프로세스 전체에서 공유하는 측정기
+tracer = Tracer()
+span = tracer.span
+traced_iter = tracer.traced_iter
+observe = tracer.observe
+count = tracer.count
+trace = tracer.trace
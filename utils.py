@@ -1,15 +1,69 @@
 from langchain_core.callbacks.base import BaseCallbackHandler
 import streamlit as st
+import time
+
+import tracing
 
 
 class StreamHandler(BaseCallbackHandler):
-    def __init__(self, container, initial_text=""):
+    """
+    LLM 스트리밍 토큰을 모아서 일정 시간 또는 일정 길이마다 한 번씩 화면에 출력하는 콜백 핸들러입니다.
+
+    토큰마다 전체 markdown 을 다시 그리면 답변 길이의 제곱에 비례하는 렌더링과 웹소켓 메시지가 발생하므로,
+    토큰을 모아 두었다가 min_interval 초가 지나거나 max_pending 글자 이상 쌓였을 때만 출력합니다.
+    LLM 이 끝나거나 오류가 나면 남은 토큰을 반드시 출력합니다.
+    """
+
+    def __init__(self, container, initial_text="", min_interval=0.1, max_pending=200):
+        """
+        :param container: markdown 을 출력할 streamlit 컨테이너 (st.empty() 등)
+        :param initial_text: 처음 출력할 텍스트
+        :param min_interval: 출력 사이의 최소 간격(초)
+        :param max_pending: 이 글자 수 이상 쌓이면 간격과 관계없이 출력합니다
+        """
         self.container = container
         self.text = initial_text
+        self.min_interval = min_interval
+        self.max_pending = max_pending
+        self._pending = []
+        self._pending_chars = 0
+        self._last_flush = time.monotonic()
+        # 출력 횟수와 전송한 텍스트 크기(byte)
+        self.flush_count = 0
+        self.bytes_sent = 0
+        # 첫 토큰을 받은 시각 (time.perf_counter 기준)
+        self.first_token_time = None
 
     def on_llm_new_token(self, token: str, **kwargs) -> None:
-        self.text += token
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        self._pending.append(token)
+        self._pending_chars += len(token)
+        if (
+            self._pending_chars >= self.max_pending
+            or time.monotonic() - self._last_flush >= self.min_interval
+        ):
+            self.flush()
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        self.flush()
+
+    def on_llm_error(self, error, **kwargs) -> None:
+        self.flush()
+
+    def flush(self) -> None:
+        """
+        쌓여 있는 토큰을 화면에 출력합니다.
+        """
+        if not self._pending:
+            return
+        self.text += "".join(self._pending)
+        self._pending = []
+        self._pending_chars = 0
         self.container.markdown(self.text)
+        self._last_flush = time.monotonic()
+        self.flush_count += 1
+        self.bytes_sent += len(self.text.encode("utf-8"))
 
 
 def print_messages():
@@ -17,3 +71,52 @@ def print_messages():
     if "messages" in st.session_state and len(st.session_state["messages"]) > 0:
         for chat_message in st.session_state["messages"]:
             st.chat_message(chat_message.role).write(chat_message.content)
+
+
+def print_trace(spans, title):
+    """
+    tracing.trace 로 모은 span 기록을 단계별 소요 시간 표로 출력합니다.
+
+    :param spans: span 기록 (없으면 출력하지 않습니다)
+    :param title: 표 제목
+    """
+    if not spans:
+        return
+    stages = tracing.summarize_trace(spans)
+    st.markdown(f"**{title}**")
+    st.table({"단계": [name for name, _ in stages], "ms": [f"{ms:,.1f}" for _, ms in stages]})
+
+
+def print_counters():
+    """
+    누적 캐시 적중률과 토큰 수를 출력합니다.
+    """
+    counters = tracing.tracer.snapshot()["counters"]
+    rates = []
+    for label, prefix in [("임베딩 캐시", "embedding_cache"), ("답변 캐시", "answer_cache")]:
+        hits, misses = counters.get(f"{prefix}_hits", 0), counters.get(f"{prefix}_misses", 0)
+        if hits + misses:
+            rates.append(f"- {label} 적중률: {hits / (hits + misses):.0%} ({int(hits):,}/{int(hits + misses):,})")
+    rule_hits = counters.get("query_parser_rule_hits", 0)
+    fallbacks = counters.get("query_parser_llm_fallbacks", 0)
+    if rule_hits + fallbacks:
+        rates.append(f"- 규칙 기반 쿼리 생성: {rule_hits / (rule_hits + fallbacks):.0%} (나머지는 LLM 호출)")
+    for label, name in [("임베딩 토큰", "embedding_tokens"), ("context 토큰", "context_tokens"), ("답변 토큰", "llm_completion_tokens")]:
+        if name in counters:
+            rates.append(f"- {label}: {int(counters[name]):,}")
+    if rates:
+        st.markdown("**누적 통계**\n\n" + "\n".join(rates))
+
+
+def print_index_stats(stats: dict):
+    """
+    메모리에 올라와 있는 대화 인덱스 수와 크기를 출력합니다.
+
+    :param stats: IndexManager.stats() 결과
+    """
+    st.markdown(
+        f"**인덱스 메모리**\n\n"
+        f"- 사용량: {stats['resident_bytes'] / 2**20:,.1f} / {stats['max_bytes'] / 2**20:,.0f} MB "
+        f"({len(stats['chats'])}개 대화)\n"
+        f"- 재사용 {stats['hits']:,}회, 불러오기 {stats['loads']:,}회, 내보내기 {stats['evictions']:,}회"
+    )